@@ -0,0 +1,296 @@
+"""Benchmark BasicRegionDetector and AdvancedDetector stage by stage on synthetic screenshots.
+
+Layouts: card grids, forms, dense tables, and very tall and very wide pages,
+rendered at 720p up to 8K. Each stage is timed separately (median and min of
+--repeat runs on a freshly decoded image), then run once more under
+tracemalloc to record its peak Python/NumPy allocation; the process-wide
+peak RSS is recorded in the metadata.
+
+Usage:
+    python benchmarks/bench_detectors.py [--layouts cards form table tall wide]
+        [--resolutions 720p 1080p 1440p 4k 8k] [--repeat 5] [--ocr]
+        [--output results.json] [--compare baseline.json]
+
+OCR is only timed with --ocr (it loads the EasyOCR models); otherwise
+get_components runs with OCR stubbed out so the numbers cover the CV work.
+--compare prints the change of every stage's median against an earlier
+--output file, e.g. one written on another commit.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ui-screenshot-to-prompt"))
+
+from config import (  # noqa: E402
+    MAX_UI_COMPONENTS,
+    MIN_COMPONENT_WIDTH_ADVANCED,
+    MIN_COMPONENT_HEIGHT_ADVANCED,
+)
+from decoded_image import DecodedImage  # noqa: E402
+from detect_components import (  # noqa: E402
+    AdvancedDetector,
+    BasicRegionDetector,
+    build_candidates,
+    suppress_overlaps,
+)
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+    "8k": (7680, 4320),
+}
+# Tall and wide pages keep one side at the chosen resolution and stretch the other 8x
+PAGE_STRETCH = 8
+
+TEXT_COLOR = (32, 33, 36)
+BORDER_COLOR = (200, 200, 200)
+ACCENT_COLOR = (26, 115, 232)
+
+
+def _text(image, text, x, y, scale):
+    cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5 * scale, TEXT_COLOR, max(1, int(scale)))
+
+
+def draw_cards(image, x0, y0, width, height, scale, rng):
+    """Grid of cards, each with a title, an image placeholder and a button"""
+    card_w, card_h, gap = int(300 * scale), int(220 * scale), int(24 * scale)
+    for y in range(y0 + gap, y0 + height - card_h, card_h + gap):
+        for x in range(x0 + gap, x0 + width - card_w, card_w + gap):
+            cv2.rectangle(image, (x, y), (x + card_w, y + card_h), (255, 255, 255), -1)
+            cv2.rectangle(image, (x, y), (x + card_w, y + card_h), BORDER_COLOR, max(1, int(scale)))
+            cv2.rectangle(image, (x + gap, y + gap), (x + card_w - gap, y + card_h // 2),
+                          tuple(int(c) for c in rng.integers(120, 230, 3)), -1)
+            _text(image, f"Card {rng.integers(1000)}", x + gap, y + card_h // 2 + int(30 * scale), scale)
+            bx, by = x + gap, y + card_h - int(50 * scale)
+            cv2.rectangle(image, (bx, by), (bx + int(40 * scale), by + int(40 * scale)), ACCENT_COLOR, -1)
+
+
+def draw_form(image, x0, y0, width, height, scale, rng):
+    """Label/input rows with a submit button"""
+    row_h, input_w = int(70 * scale), min(width - int(200 * scale), int(600 * scale))
+    x = x0 + int(60 * scale)
+    for y in range(y0 + int(40 * scale), y0 + height - 2 * row_h, row_h):
+        _text(image, f"Field {rng.integers(100)}", x, y + int(18 * scale), scale)
+        cv2.rectangle(image, (x, y + int(26 * scale)), (x + input_w, y + int(60 * scale)), BORDER_COLOR,
+                      max(1, int(scale)))
+    y = y0 + height - int(80 * scale)
+    cv2.rectangle(image, (x, y), (x + int(48 * scale), y + int(48 * scale)), ACCENT_COLOR, -1)
+
+
+def draw_table(image, x0, y0, width, height, scale, rng):
+    """Dense table: ruled rows and columns full of short text"""
+    row_h, col_w = int(28 * scale), int(140 * scale)
+    for y in range(y0 + row_h, y0 + height, row_h):
+        cv2.line(image, (x0, y), (x0 + width, y), BORDER_COLOR, 1)
+        for x in range(x0, x0 + width - col_w, col_w):
+            _text(image, str(rng.integers(100000)), x + int(8 * scale), y - int(8 * scale), scale * 0.8)
+    for x in range(x0, x0 + width, col_w):
+        cv2.line(image, (x, y0), (x, y0 + height), BORDER_COLOR, 1)
+
+
+def synthetic_screenshot(layout: str, resolution: str, seed: int = 0) -> np.ndarray:
+    """RGB screenshot of the given layout: a nav bar and sidebar around the layout's content"""
+    width, height = RESOLUTIONS[resolution]
+    if layout == "tall":
+        height *= PAGE_STRETCH
+    elif layout == "wide":
+        width *= PAGE_STRETCH
+    scale = RESOLUTIONS[resolution][1] / 1080
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 245, np.uint8)
+
+    nav_h, sidebar_w = int(64 * scale), int(240 * scale)
+    cv2.rectangle(image, (0, 0), (width, nav_h), (40, 44, 52), -1)
+    cv2.rectangle(image, (0, nav_h), (sidebar_w, height), (255, 255, 255), -1)
+    for i, y in enumerate(range(nav_h + int(30 * scale), height - int(40 * scale), int(48 * scale))):
+        _text(image, f"Menu item {i}", int(24 * scale), y, scale)
+
+    draw = {"cards": draw_cards, "form": draw_form, "table": draw_table, "tall": draw_cards, "wide": draw_cards}
+    draw[layout](image, sidebar_w, nav_h, width - sidebar_w, height - nav_h, scale, rng)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def encode_png(rgb: np.ndarray) -> bytes:
+    ok, encoded = cv2.imencode(".png", cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+    if not ok:
+        raise RuntimeError("PNG encoding failed")
+    return encoded.tobytes()
+
+
+def advanced_stages(png: bytes, with_ocr: bool, output_dir: str):
+    """(stage, callable) pairs run in order on one freshly decoded image"""
+    state = {}
+
+    def new_detector(decoded):
+        detector = AdvancedDetector(decoded, MAX_UI_COMPONENTS, MIN_COMPONENT_WIDTH_ADVANCED,
+                                    MIN_COMPONENT_HEIGHT_ADVANCED)
+        if not with_ocr:
+            detector.extract_texts = lambda bboxes, types: [""] * len(bboxes)
+        return detector
+
+    def decode():
+        state["decoded"] = DecodedImage.from_bytes(png)
+        state["detector"] = new_detector(state["decoded"])
+
+    def find_contours():
+        state["contours"], _ = cv2.findContours(state["edges"], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    def suppress():
+        kept = suppress_overlaps(state["candidates"], MAX_UI_COMPONENTS)
+        state["bboxes"] = [(int(c["x"]), int(c["y"]), int(c["w"]), int(c["h"])) for c in kept]
+        state["types"] = [state["detector"].classify_component(float(c["aspect"]), float(c["area"])) for c in kept]
+
+    stages = [
+        ("decode", decode),
+        ("detect_edges", lambda: state.update(edges=state["detector"].detect_edges())),
+        ("find_contours", find_contours),
+        ("build_candidates", lambda: state.update(candidates=build_candidates(
+            state["contours"], MIN_COMPONENT_WIDTH_ADVANCED, MIN_COMPONENT_HEIGHT_ADVANCED))),
+        ("suppress_overlaps", suppress),
+    ]
+    if with_ocr:
+        stages.append(("ocr", lambda: state["detector"].extract_texts(state["bboxes"], state["types"])))
+    stages += [
+        # End to end (including decode), on a fresh image so no derived buffers are reused
+        ("get_components", lambda: state.update(
+            detections=new_detector(DecodedImage.from_bytes(png)).get_components())),
+        ("visualize_detections", lambda: state["detector"].visualize_detections(
+            state["decoded"].rgb, state["detections"], os.path.join(output_dir, "advanced.png"))),
+    ]
+    return stages
+
+
+def basic_stages(png: bytes, output_dir: str):
+    state = {}
+
+    def decode():
+        state["decoded"] = DecodedImage.from_bytes(png)
+        state["detector"] = BasicRegionDetector(state["decoded"])
+
+    return [
+        ("decode", decode),
+        ("get_grid_pattern", lambda: state["detector"].get_grid_pattern()),
+        ("get_components", lambda: state.update(detections=state["detector"].get_components())),
+        ("visualize_detections", lambda: state["detector"].visualize_detections(
+            state["decoded"].rgb, state["detections"], os.path.join(output_dir, "basic.png"))),
+    ]
+
+
+def measure(make_stages, repeat: int):
+    """Per-stage timings over repeat runs plus one tracemalloc run for peak memory"""
+    timings = {}
+    for _ in range(repeat):
+        for stage, fn in make_stages():
+            start = time.perf_counter()
+            fn()
+            timings.setdefault(stage, []).append(time.perf_counter() - start)
+
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for stage, fn in make_stages():
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            fn()
+            peaks[stage] = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+    return {
+        stage: {
+            "median_ms": round(statistics.median(times) * 1000, 3),
+            "min_ms": round(min(times) * 1000, 3),
+            "peak_mb": round(peaks[stage] / 2 ** 20, 2),
+        }
+        for stage, times in timings.items()
+    }
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "opencv_threads": cv2.getNumThreads(),
+        # Whole-process high-water mark (Linux reports KiB), including OpenCV's own buffers
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["layout"], r["resolution"], r["detector"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\nChange vs {baseline_path} (median; negative is faster):")
+    for r in results:
+        old = baseline.get((r["layout"], r["resolution"], r["detector"], r["stage"]))
+        if old and old["median_ms"] > 0:
+            change = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100
+            print(f"  {r['layout']:>6} {r['resolution']:>6} {r['detector']:>9} {r['stage']:<21} "
+                  f"{old['median_ms']:>10.2f} -> {r['median_ms']:>10.2f} ms  {change:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layouts", nargs="+", default=["cards", "form", "table", "tall", "wide"],
+                        choices=["cards", "form", "table", "tall", "wide"])
+    parser.add_argument("--resolutions", nargs="+", default=["720p", "1080p", "4k", "8k"], choices=list(RESOLUTIONS))
+    parser.add_argument("--detectors", nargs="+", default=["basic", "advanced"], choices=["basic", "advanced"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ocr", action="store_true", help="Include OCR (loads the EasyOCR models)")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Earlier --output file to compare against")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'layout':>6} {'res':>6} {'size':>11} {'detector':>9} {'stage':<21} {'median_ms':>10} {'min_ms':>10} "
+          f"{'peak_mb':>8}")
+    with tempfile.TemporaryDirectory() as output_dir:
+        for layout in args.layouts:
+            for resolution in args.resolutions:
+                rgb = synthetic_screenshot(layout, resolution)
+                png = encode_png(rgb)
+                size = f"{rgb.shape[1]}x{rgb.shape[0]}"
+                for detector in args.detectors:
+                    if detector == "basic":
+                        stages = measure(lambda: basic_stages(png, output_dir), args.repeat)
+                    else:
+                        stages = measure(lambda: advanced_stages(png, args.ocr, output_dir), args.repeat)
+                    for stage, numbers in stages.items():
+                        results.append({"layout": layout, "resolution": resolution, "size": size,
+                                        "detector": detector, "stage": stage, **numbers})
+                        print(f"{layout:>6} {resolution:>6} {size:>11} {detector:>9} {stage:<21} "
+                              f"{numbers['median_ms']:>10.2f} {numbers['min_ms']:>10.2f} {numbers['peak_mb']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": {**metadata(), "repeat": args.repeat, "ocr": args.ocr}, "results": results},
+                      f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark AdvancedDetector overlap suppression: legacy Python loop vs NumPy.
+
+Usage:
+    python benchmarks/bench_overlap_suppression.py [--sizes 1000 10000 50000] [--max-keep 6 0]
+
+A --max-keep of 0 means "keep everything that survives", which is the
+worst case for the legacy loop (every candidate is compared with every
+kept box).
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "ui-screenshot-to-prompt"))
+
+from detect_components import CANDIDATE_DTYPE, suppress_overlaps  # noqa: E402
+
+
+def synthetic_candidates(count: int, width: int = 3840, height: int = 2160, seed: int = 0) -> np.ndarray:
+    """Random boxes resembling dense UI contours: many small, some large and nested"""
+    rng = np.random.default_rng(seed)
+    candidates = np.empty(count, dtype=CANDIDATE_DTYPE)
+    w = np.clip(rng.lognormal(4.0, 0.8, count), 20, width // 2).astype(np.int32)
+    h = np.clip(rng.lognormal(3.5, 0.7, count), 20, height // 2).astype(np.int32)
+    candidates["x"] = rng.integers(0, width - w)
+    candidates["y"] = rng.integers(0, height - h)
+    candidates["w"] = w
+    candidates["h"] = h
+    # Contour area is at most the bounding box area; round to create ties
+    candidates["area"] = np.round(w * h * rng.uniform(0.3, 1.0, count), -1)
+    candidates["aspect"] = w / h.astype(np.float64)
+    return candidates
+
+
+def legacy_suppress(candidates: np.ndarray, max_keep: int):
+    """The original dict-per-contour nested loop from AdvancedDetector.get_components"""
+    potential_components = [
+        {"bbox": (int(c["x"]), int(c["y"]), int(c["w"]), int(c["h"])), "area": float(c["area"])}
+        for c in candidates
+    ]
+    potential_components.sort(key=lambda x: x["area"], reverse=True)
+
+    filtered_components = []
+    for comp in potential_components:
+        x1, y1, w1, h1 = comp["bbox"]
+        is_overlapping = False
+        for existing in filtered_components:
+            x2, y2, w2, h2 = existing["bbox"]
+            x_left = max(x1, x2)
+            y_top = max(y1, y2)
+            x_right = min(x1 + w1, x2 + w2)
+            y_bottom = min(y1 + h1, y2 + h2)
+            if x_right > x_left and y_bottom > y_top:
+                intersection_area = (x_right - x_left) * (y_bottom - y_top)
+                smaller_area = min(w1 * h1, w2 * h2)
+                if intersection_area / smaller_area > 0.5:
+                    is_overlapping = True
+                    break
+        if not is_overlapping:
+            filtered_components.append(comp)
+        if len(filtered_components) >= max_keep:
+            break
+    return [comp["bbox"] for comp in filtered_components[:max_keep]]
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--max-keep", type=int, nargs="+", default=[6, 0])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'contours':>9} {'max_keep':>9} {'kept':>6} {'legacy_ms':>11} {'numpy_ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        candidates = synthetic_candidates(size)
+        for max_keep in args.max_keep:
+            limit = max_keep or size
+            legacy_time, legacy_result = timed(lambda: legacy_suppress(candidates, limit), args.repeat)
+            numpy_time, kept = timed(lambda: suppress_overlaps(candidates, limit), args.repeat)
+            numpy_result = [(int(c["x"]), int(c["y"]), int(c["w"]), int(c["h"])) for c in kept]
+            if numpy_result != legacy_result:
+                raise SystemExit(f"Mismatch at {size} contours, max_keep={max_keep}")
+            print(
+                f"{size:>9} {max_keep or 'all':>9} {len(kept):>6} {legacy_time * 1000:>11.2f} "
+                f"{numpy_time * 1000:>10.2f} {legacy_time / numpy_time:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Throughput per GB of memory for each API server worker profile.
+
+Starts benchmarks/fake_provider.py, then for each profile (sync, gthread,
+gevent, uvicorn) starts `api.py --profile <name>`, sends the same
+/process-image load, and reports throughput, p50/p95 latency, the peak RSS
+and settled PSS summed over all server processes, and requests/sec per GB of
+each. Workers and threads come from the quota-derived defaults in
+server_profiles.py, computed from --rpm/--tpm and --expected-seconds, unless
+--workers/--threads are given.
+
+Usage:
+    python benchmarks/bench_worker_profiles.py [--profiles sync gthread gevent uvicorn]
+        [--concurrency 32] [--requests 128] [--latency-ms 800] [--rpm 6000] [--tpm 2000000]
+        [--expected-seconds 4] [--json results.json]
+
+The server binds port 5003 and the fake provider port 8900, so stop any
+running instances first. Profiles whose dependency is missing (gevent) are
+reported as errors and skipped.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import requests
+
+from load_test import MemorySampler, find_server_pids, run_level
+from startup_report import API_PATH, SRC_DIR, memory_breakdown, server_env
+
+FAKE_PROVIDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_provider.py")
+FAKE_PROVIDER_URL = "http://127.0.0.1:8900"
+PROFILES = ["sync", "gthread", "gevent", "uvicorn"]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.1)
+    return False
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def profile_env(args) -> Dict[str, str]:
+    env = server_env()
+    # The benchmark starts its own fake provider, so point every client at it
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "OPENROUTER_API_KEY"):
+        env.pop(name, None)
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": FAKE_PROVIDER_URL,
+        "AZURE_OPENAI_API_KEY": "fake",
+        "ANTHROPIC_API_KEY": "fake",
+        "ANTHROPIC_BASE_URL": FAKE_PROVIDER_URL,
+        "RATE_LIMIT_DEFAULT_RPM": str(args.rpm),
+        "RATE_LIMIT_DEFAULT_TPM": str(args.tpm),
+        "SERVER_EXPECTED_REQUEST_SECONDS": str(args.expected_seconds),
+        # Every request must reach the (fake) providers
+        "RESULT_CACHE_ENABLED": "false",
+        "CALL_CACHE_BACKEND": "none",
+    })
+    return env
+
+
+def describe_profile(profile: str, args, cwd: str) -> str:
+    """Workers and threads the server derives for a profile under the benchmark's quota"""
+    probe = (f"from server_profiles import resolve_profile; "
+             f"print(resolve_profile({profile!r}, {args.workers}, {args.threads}).describe())")
+    result = subprocess.run([sys.executable, "-c", probe], cwd=cwd, capture_output=True, text=True,
+                            env={**profile_env(args), "PYTHONPATH": os.pathsep.join(
+                                filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")]))})
+    return result.stdout.strip() or "?"
+
+
+def measure_profile(profile: str, args, cwd: str) -> Dict:
+    """Start api.py with one profile, drive the load and sample memory"""
+    command = [sys.executable, API_PATH, "--profile", profile]
+    if args.workers:
+        command += ["--workers", str(args.workers)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    log_path = os.path.join(cwd, f"{profile}.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen(command, cwd=cwd, env=profile_env(args), stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not wait_until_ready(args.ready_url, server, args.timeout):
+            with open(log_path) as f:
+                tail = f.read().strip().splitlines()[-1:] or ["not ready"]
+            return {"profile": profile, "error": tail[0]}
+        # Warm-up: every worker creates its clients and imports the detection modules
+        run_level(args.url, args.warmup, args.warmup, 10_000_000, args.timeout)
+
+        sampler = MemorySampler(API_PATH)
+        sampler.start()
+        result = run_level(args.url, args.concurrency, args.requests, 0, args.timeout)
+        peaks = sampler.stop()
+        processes = [memory_breakdown(pid) for pid in find_server_pids(API_PATH)]
+    finally:
+        stop(server)
+
+    rss_gb = sum(peaks.values()) / 1024.0
+    pss_gb = sum(p.get("pss_mb", p["rss_mb"]) for p in processes if p) / 1024.0
+    return {
+        "profile": profile,
+        "settings": describe_profile(profile, args, cwd),
+        "processes": len(peaks),
+        **result,
+        "peak_rss_gb": round(rss_gb, 3),
+        "pss_gb": round(pss_gb, 3),
+        "rps_per_gb_rss": round(result["throughput_rps"] / rss_gb, 2) if rss_gb else None,
+        "rps_per_gb_pss": round(result["throughput_rps"] / pss_gb, 2) if pss_gb else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=PROFILES, choices=PROFILES)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=128, help="Requests per profile")
+    parser.add_argument("--warmup", type=int, default=8, help="Requests sent before measuring")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Fake provider median latency")
+    parser.add_argument("--rpm", type=int, default=6000, help="Provider requests/minute quota per deployment")
+    parser.add_argument("--tpm", type=int, default=2000000, help="Provider tokens/minute quota per deployment")
+    parser.add_argument("--expected-seconds", type=float, default=4.0,
+                        help="Expected latency of one screenshot, used to size the profiles")
+    parser.add_argument("--workers", type=int, default=0, help="Override the derived worker processes")
+    parser.add_argument("--threads", type=int, default=0, help="Override the derived threads per process")
+    parser.add_argument("--url", default="http://127.0.0.1:5003/process-image")
+    parser.add_argument("--ready-url", default="http://127.0.0.1:5003/executor/stats")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    # Run from a scratch directory so logs, caches and metrics files stay out of the tree
+    with tempfile.TemporaryDirectory() as cwd:
+        provider = subprocess.Popen([sys.executable, FAKE_PROVIDER_PATH, "--latency-ms", str(args.latency_ms)],
+                                    cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_ready(f"{FAKE_PROVIDER_URL}/stats", provider, 30):
+                sys.exit("fake provider did not start")
+            print(f"{'profile':<9} {'settings':<30} {'ok':>5} {'err':>4} {'rps':>7} {'p50':>7} {'p95':>7} "
+                  f"{'rss_gb':>7} {'pss_gb':>7} {'rps/gb_rss':>11} {'rps/gb_pss':>11}")
+            for profile in args.profiles:
+                result = measure_profile(profile, args, cwd)
+                results.append(result)
+                if "error" in result:
+                    print(f"{profile:<9} {result['error']}")
+                    continue
+                print(f"{profile:<9} {result['settings']:<30} {result['ok']:>5} {sum(result['errors'].values()):>4} "
+                      f"{result['throughput_rps']:>7.2f} {result['p50_seconds']:>7.2f} {result['p95_seconds']:>7.2f} "
+                      f"{result['peak_rss_gb']:>7.3f} {result['pss_gb']:>7.3f} "
+                      f"{result['rps_per_gb_rss'] or 0:>11.2f} {result['rps_per_gb_pss'] or 0:>11.2f}")
+                if result["errors"]:
+                    print(f"          errors: {result['errors']}")
+        finally:
+            stop(provider)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "profiles": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
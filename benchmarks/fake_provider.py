@@ -0,0 +1,333 @@
+"""Local stand-in for the provider APIs, for load tests that cost nothing.
+
+Serves the endpoints the pipeline calls, with canned responses:
+    Azure OpenAI  POST /openai/deployments/<deployment>/chat/completions
+    OpenAI-style  POST /v1/chat/completions          (OpenRouter)
+    Anthropic     POST /v1/messages
+    Bedrock       POST /model/<model_id>/invoke, /model/<model_id>/invoke-with-response-stream
+Streaming requests are answered in each provider's streaming format.
+
+Usage:
+    python benchmarks/fake_provider.py [--port 8900] [--latency-ms 800] [--latency-sigma 0.4]
+        [--tokens-per-second 80] [--error-rate 0.01] [--rate-limit-rate 0.02] [--responses canned.json]
+
+Point the app at it with:
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8900 AZURE_OPENAI_API_KEY=fake
+    ANTHROPIC_API_KEY=fake ANTHROPIC_BASE_URL=http://127.0.0.1:8900
+    (or OPENROUTER_API_KEY=fake OPENROUTER_BASE_URL=http://127.0.0.1:8900/v1,
+     or AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake BEDROCK_ENDPOINT_URL=http://127.0.0.1:8900)
+
+GET /stats returns request, error and 429 counts per provider.
+"""
+import argparse
+import base64
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+
+from flask import Flask, Response, jsonify, request
+
+DEFAULT_RESPONSES = {
+    # Region analyses ask for JSON
+    "json": json.dumps({
+        "component": "primary action button",
+        "specs": {
+            "type": "button",
+            "visual": {"colors": ["#1a73e8", "#ffffff", "#202124"], "dimensions": "120x40, 16px padding"},
+            "content": {"text": "Sign in"},
+            "interaction": {"primary": "click", "states": ["hover", "active", "disabled"]},
+        },
+        "implementation": "rounded filled button with hover elevation",
+    }),
+    # Full-screenshot analyses and the super prompt
+    "text": (
+        "A clean two-column dashboard with a fixed top navigation bar, a left sidebar of icon links "
+        "and a content grid of summary cards. Neutral grey background, white cards with 8px radius "
+        "and soft shadows, a blue accent colour for primary actions and Inter-like sans-serif type. "
+    ) * 4,
+}
+
+app = Flask(__name__)
+settings = argparse.Namespace()
+stats = Counter()
+stats_lock = threading.Lock()
+
+
+def count(key: str):
+    with stats_lock:
+        stats[key] += 1
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Rough prompt size: 4 characters per token, 255 tokens per image"""
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "text":
+                tokens += len(part.get("text", "")) // 4
+            else:
+                tokens += 255
+    return max(tokens, 1)
+
+
+def response_text(body: dict) -> str:
+    wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+    return settings.responses["json" if wants_json else "text"]
+
+
+def completion_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def inject_error(provider: str):
+    """Count the call and return an injected 429/500 response, or None"""
+    count(provider)
+    roll = random.random()
+    if roll < settings.rate_limit_rate:
+        count(f"{provider}:429")
+        return error_response(provider, 429, "Rate limit exceeded (injected)")
+    if roll < settings.rate_limit_rate + settings.error_rate:
+        count(f"{provider}:500")
+        return error_response(provider, 500, "Internal server error (injected)")
+    return None
+
+
+def simulate(provider: str, text: str):
+    """Sleep for the simulated latency, or return an injected error response"""
+    error = inject_error(provider)
+    if error is None:
+        time.sleep(time_to_first_token() + generation_seconds(text))
+    return error
+
+
+def time_to_first_token() -> float:
+    # Log-normal around the median, like real provider latency
+    return settings.latency_ms / 1000.0 * math.exp(random.gauss(0, settings.latency_sigma))
+
+
+def generation_seconds(text: str) -> float:
+    if not settings.tokens_per_second:
+        return 0.0
+    return completion_tokens(text) / settings.tokens_per_second
+
+
+def error_response(provider: str, status: int, message: str) -> Response:
+    headers = {}
+    if status == 429:
+        headers["retry-after"] = str(settings.retry_after)
+    if provider == "anthropic":
+        error_type = "rate_limit_error" if status == 429 else "api_error"
+        body = {"type": "error", "error": {"type": error_type, "message": message}}
+    elif provider == "bedrock":
+        headers["x-amzn-ErrorType"] = "ThrottlingException" if status == 429 else "InternalServerException"
+        body = {"message": message}
+    else:
+        body = {"error": {"message": message, "type": "rate_limit" if status == 429 else "server_error",
+                          "code": str(status)}}
+    return Response(json.dumps(body), status=status, headers=headers, mimetype="application/json")
+
+
+def chunks_of(text: str, size: int = 16):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+
+def paced(pieces):
+    """Yield stream pieces spread over the simulated generation time"""
+    pieces = list(pieces)
+    delay = generation_seconds("".join(pieces)) / max(len(pieces), 1)
+    for piece in pieces:
+        if delay:
+            time.sleep(delay)
+        yield piece
+
+
+def sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.route("/openai/deployments/<deployment>/chat/completions", methods=["POST"])
+def azure_chat_completions(deployment):
+    return chat_completions("azure", deployment)
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def openai_chat_completions():
+    return chat_completions("openai", None)
+
+
+def chat_completions(provider: str, deployment):
+    body = request.get_json()
+    model = deployment or body.get("model", "fake")
+    text = response_text(body)
+    prompt_tokens = estimate_prompt_tokens(body.get("messages", []))
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens(text),
+             "total_tokens": prompt_tokens + completion_tokens(text)}
+    response_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    if body.get("stream"):
+        error = inject_error(provider)
+        if error is not None:
+            return error
+        time.sleep(time_to_first_token())
+
+        def generate():
+            for piece in paced(chunks_of(text)):
+                yield sse({"id": response_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [{"index": 0, "delta": {"content": piece}}]})
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield sse({"id": response_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                           "model": model, "choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    error = simulate(provider, text)
+    if error is not None:
+        return error
+    return jsonify({
+        "id": response_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage,
+    })
+
+
+def anthropic_message(model: str, text: str, input_tokens: int) -> dict:
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": completion_tokens(text)},
+    }
+
+
+def anthropic_stream_events(model: str, text: str, input_tokens: int):
+    """(event type, data) pairs of an Anthropic streaming response"""
+    message = anthropic_message(model, "", input_tokens)
+    message["content"] = []
+    message["usage"]["output_tokens"] = 1
+    yield "message_start", {"type": "message_start", "message": message}
+    yield "content_block_start", {"type": "content_block_start", "index": 0,
+                                  "content_block": {"type": "text", "text": ""}}
+    for piece in paced(chunks_of(text)):
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0,
+                                      "delta": {"type": "text_delta", "text": piece}}
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                            "usage": {"output_tokens": completion_tokens(text)}}
+    yield "message_stop", {"type": "message_stop"}
+
+
+@app.route("/v1/messages", methods=["POST"])
+def anthropic_messages():
+    body = request.get_json()
+    model = body.get("model", "fake")
+    text = settings.responses["text"]
+    input_tokens = estimate_prompt_tokens(body.get("messages", []))
+
+    if body.get("stream"):
+        error = inject_error("anthropic")
+        if error is not None:
+            return error
+        time.sleep(time_to_first_token())
+        events = (sse(data, event) for event, data in anthropic_stream_events(model, text, input_tokens))
+        return Response(events, mimetype="text/event-stream")
+
+    error = simulate("anthropic", text)
+    if error is not None:
+        return error
+    return jsonify(anthropic_message(model, text, input_tokens))
+
+
+def event_stream_message(payload: bytes) -> bytes:
+    """Encode one AWS event-stream message carrying a Bedrock response chunk"""
+    headers = b""
+    for name, value in ((":event-type", "chunk"), (":content-type", "application/json"), (":message-type", "event")):
+        name_bytes, value_bytes = name.encode(), value.encode()
+        # Header value type 7 = string
+        headers += struct.pack(">B", len(name_bytes)) + name_bytes + struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+    total_length = 12 + len(headers) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    prelude += struct.pack(">I", zlib.crc32(prelude))
+    message = prelude + headers + payload
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+@app.route("/model/<path:model_id>/invoke", methods=["POST"])
+def bedrock_invoke(model_id):
+    body = json.loads(request.get_data())
+    text = settings.responses["text"]
+    error = simulate("bedrock", text)
+    if error is not None:
+        return error
+    return jsonify(anthropic_message(model_id, text, estimate_prompt_tokens(body.get("messages", []))))
+
+
+@app.route("/model/<path:model_id>/invoke-with-response-stream", methods=["POST"])
+def bedrock_invoke_stream(model_id):
+    body = json.loads(request.get_data())
+    text = settings.responses["text"]
+    input_tokens = estimate_prompt_tokens(body.get("messages", []))
+    error = inject_error("bedrock")
+    if error is not None:
+        return error
+    time.sleep(time_to_first_token())
+
+    def generate():
+        for _, data in anthropic_stream_events(model_id, text, input_tokens):
+            payload = json.dumps({"bytes": base64.b64encode(json.dumps(data).encode()).decode()}).encode()
+            yield event_stream_message(payload)
+
+    return Response(generate(), mimetype="application/vnd.amazon.eventstream")
+
+
+@app.route("/stats", methods=["GET"])
+def stats_api():
+    with stats_lock:
+        return jsonify(dict(stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Simulated generation speed (0 = whole response after the latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--responses", help='JSON file with canned {"json": ..., "text": ...} responses')
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    responses = dict(DEFAULT_RESPONSES)
+    if args.responses:
+        with open(args.responses) as f:
+            responses.update(json.load(f))
+    vars(settings).update(vars(args), responses=responses)
+
+    # Threaded: each simulated call sleeps for its latency
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""End-to-end load test of the API server's /process-image endpoint.
+
+Sends synthetic screenshots at each concurrency level and reports
+throughput, p50/p95/p99 latency, errors and the peak RSS of every server
+process. Run the server against benchmarks/fake_provider.py so provider
+latency is controlled and nothing is billed, e.g.:
+
+    python benchmarks/fake_provider.py --latency-ms 800 &
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8900 AZURE_OPENAI_API_KEY=fake \\
+    ANTHROPIC_API_KEY=fake ANTHROPIC_BASE_URL=http://127.0.0.1:8900 \\
+    RESULT_CACHE_ENABLED=false CALL_CACHE_BACKEND=none \\
+        python src/ui-screenshot-to-prompt/api.py &
+    python benchmarks/load_test.py --concurrency 1 4 16 64 --requests 100 [--json results.json]
+
+Every request uses a slightly different image, so result and call caches
+do not short-circuit the pipeline even when they are enabled.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+import requests
+
+
+def synthetic_screenshot(index: int, width: int = 1440, height: int = 900) -> bytes:
+    """A dashboard-like page (nav bar, sidebar, card grid) made unique by index"""
+    rng = np.random.default_rng(index)
+    image = np.full((height, width, 3), 245, np.uint8)
+    cv2.rectangle(image, (0, 0), (width, 64), (40, 44, 52), -1)
+    cv2.rectangle(image, (0, 64), (220, height), (255, 255, 255), -1)
+    for row in range(3):
+        for column in range(3):
+            x, y = 260 + column * 380, 100 + row * 260
+            cv2.rectangle(image, (x, y), (x + 340, y + 220), (255, 255, 255), -1)
+            cv2.rectangle(image, (x, y), (x + 340, y + 220), (200, 200, 200), 2)
+            cv2.putText(image, f"Card {row * 3 + column}", (x + 20, y + 40),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (32, 33, 36), 2)
+    # A few unique pixels defeat content-addressed caching
+    image[height - 4:, :64] = rng.integers(0, 255, (4, 64, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".png", image)
+    return encoded.tobytes()
+
+
+def find_server_pids(pattern: str) -> List[int]:
+    """Processes whose command line contains pattern, with their descendants (Linux /proc)"""
+    parents: Dict[int, int] = {}
+    matches = set()
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                parents[pid] = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        if pattern in cmdline and pid != os.getpid():
+            matches.add(pid)
+    pids = set(matches)
+    added = True
+    while added:
+        children = {pid for pid, ppid in parents.items() if ppid in pids} - pids
+        pids |= children
+        added = bool(children)
+    return sorted(pids)
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of the server processes and keeps each one's peak"""
+
+    def __init__(self, pattern: str, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.pattern = pattern
+        self.interval = interval
+        self.peaks: Dict[int, float] = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            for pid in find_server_pids(self.pattern):
+                rss = rss_mb(pid)
+                if rss is not None:
+                    self.peaks[pid] = max(self.peaks.get(pid, 0.0), rss)
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> Dict[int, float]:
+        self.stopped.set()
+        self.join()
+        return self.peaks
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_level(url: str, concurrency: int, total: int, first_index: int, timeout: float) -> Dict:
+    images = [synthetic_screenshot(first_index + i) for i in range(total)]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def send(image: bytes):
+        start = time.perf_counter()
+        try:
+            response = session.post(url, files={"image": ("screenshot.png", image, "image/png")}, timeout=timeout)
+            if not response.ok:
+                error = f"HTTP {response.status_code}"
+            else:
+                # Pipeline failures are reported in the body of a 200 response
+                error = "pipeline error" if response.json().get("final_analysis") == "Error in final analysis" else None
+        except Exception as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with lock:
+            if error is None:
+                latencies.append(elapsed)
+            else:
+                errors[error] = errors.get(error, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(send, images))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3),
+        "p50_seconds": round(percentile(latencies, 0.50), 3),
+        "p95_seconds": round(percentile(latencies, 0.95), 3),
+        "p99_seconds": round(percentile(latencies, 0.99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5003/process-image")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--server-pattern", default="api.py",
+                        help="Command-line substring identifying the server processes to measure")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'conc':>5} {'ok':>5} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  peak RSS per process (MB)")
+    for level, concurrency in enumerate(args.concurrency):
+        sampler = MemorySampler(args.server_pattern)
+        sampler.start()
+        result = run_level(args.url, concurrency, args.requests, level * args.requests, args.timeout)
+        result["peak_rss_mb"] = {str(pid): round(rss, 1) for pid, rss in sorted(sampler.stop().items())}
+        results.append(result)
+        rss = ", ".join(f"{pid}: {mb}" for pid, mb in result["peak_rss_mb"].items()) or "n/a"
+        print(f"{concurrency:>5} {result['ok']:>5} {sum(result['errors'].values()):>5} "
+              f"{result['throughput_rps']:>8.2f} {result['p50_seconds']:>8.2f} {result['p95_seconds']:>8.2f} "
+              f"{result['p99_seconds']:>8.2f}  {rss}")
+        if result["errors"]:
+            print(f"      errors: {result['errors']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"url": args.url, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Cold-start and per-worker memory report for the API server.
+
+Measures, each in a fresh interpreter, how long importing the API modules
+takes and which heavy modules (provider SDKs, Gradio, torch, EasyOCR) that
+pulls in, then starts `api.py` with and without --preload-app and reports
+the time until it answers, plus the RSS, PSS (RSS with shared pages split
+between the processes sharing them) and USS (private memory) of the master
+and every worker once they have settled.
+
+Usage:
+    python benchmarks/startup_report.py [--modes default preload_app] [--settle 5] [--json report.json]
+
+The server binds port 5003, so stop any running instance first. Provider
+credentials default to placeholders pointing at benchmarks/fake_provider.py;
+no requests are made to providers.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+import requests
+
+from load_test import find_server_pids, rss_mb
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src", "ui-screenshot-to-prompt"))
+API_PATH = os.path.join(SRC_DIR, "api.py")
+HEAVY_MODULES = ["openai", "anthropic", "boto3", "gradio", "torch", "easyocr"]
+MODES = {"default": [], "preload_app": ["--preload-app"]}
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024.0
+print(json.dumps({{"seconds": seconds, "rss_mb": rss, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def server_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1:8900")
+    env.setdefault("AZURE_OPENAI_API_KEY", "fake")
+    env.setdefault("ANTHROPIC_API_KEY", "fake")
+    env.setdefault("ANTHROPIC_BASE_URL", "http://127.0.0.1:8900")
+    return env
+
+
+def measure_import(module: str, cwd: str) -> Dict:
+    """Import time, resulting RSS and loaded heavy modules of a fresh interpreter"""
+    probe = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", probe], cwd=cwd, env={**server_env(), "PYTHONPATH": os.pathsep.join(
+        filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")]))}, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1] if result.stderr else "failed"}
+    return {"module": module, **json.loads(result.stdout.strip().splitlines()[-1])}
+
+
+def memory_breakdown(pid: int) -> Optional[Dict[str, float]]:
+    """RSS, PSS and USS in MB from /proc/<pid>/smaps_rollup"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024.0
+    except OSError:
+        rss = rss_mb(pid)
+        return {"rss_mb": round(rss, 1)} if rss is not None else None
+    return {
+        "rss_mb": round(fields.get("Rss", 0.0), 1),
+        "pss_mb": round(fields.get("Pss", 0.0), 1),
+        "uss_mb": round(fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def measure_server(mode: str, url: str, settle: float, timeout: float, cwd: str) -> Dict:
+    """Start api.py in the given mode and measure time to first response and memory per process"""
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, API_PATH, *MODES[mode]], cwd=cwd, env=server_env(),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = None
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                return {"mode": mode, "error": f"server exited with {server.returncode}"}
+            try:
+                if requests.get(url, timeout=1).ok:
+                    ready = time.perf_counter() - start
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        if ready is None:
+            return {"mode": mode, "error": f"not ready after {timeout}s"}
+
+        # Let every worker finish post_worker_init (client creation, OCR warm-up)
+        time.sleep(settle)
+        processes = {}
+        for pid in find_server_pids(API_PATH):
+            memory = memory_breakdown(pid)
+            if memory is not None:
+                processes[pid] = {"role": "master" if pid == server.pid else "worker", **memory}
+        workers = [p for p in processes.values() if p["role"] == "worker"]
+        return {
+            "mode": mode,
+            "ready_seconds": round(ready, 3),
+            "workers": len(workers),
+            "master": processes.get(server.pid),
+            "worker_avg": {
+                key: round(sum(p.get(key, 0.0) for p in workers) / len(workers), 1)
+                for key in ("rss_mb", "pss_mb", "uss_mb")
+            } if workers else None,
+            "total_pss_mb": round(sum(p.get("pss_mb", 0.0) for p in processes.values()), 1),
+            "processes": {str(pid): p for pid, p in sorted(processes.items())},
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["pipeline", "api", "asgi", "main"])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--url", default="http://127.0.0.1:5003/executor/stats")
+    parser.add_argument("--settle", type=float, default=5.0, help="Seconds to wait after the first response")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    # Run from a scratch directory so logs, caches and metrics files stay out of the tree
+    with tempfile.TemporaryDirectory() as cwd:
+        print(f"{'module':<10} {'import_s':>9} {'rss_mb':>8}  heavy modules loaded")
+        imports = []
+        for module in args.modules:
+            result = measure_import(module, cwd)
+            imports.append(result)
+            if "error" in result:
+                print(f"{module:<10} {'-':>9} {'-':>8}  {result['error']}")
+            else:
+                print(f"{module:<10} {result['seconds']:>9.3f} {result['rss_mb']:>8.1f}  "
+                      f"{', '.join(result['loaded']) or '-'}")
+
+        print(f"\n{'mode':<12} {'ready_s':>8} {'workers':>8} {'master_rss':>11} {'worker_rss':>11} "
+              f"{'worker_pss':>11} {'worker_uss':>11} {'total_pss':>10}")
+        servers = []
+        for mode in args.modes:
+            result = measure_server(mode, args.url, args.settle, args.timeout, cwd)
+            servers.append(result)
+            if "error" in result:
+                print(f"{mode:<12} {result['error']}")
+                continue
+            worker = result["worker_avg"] or {}
+            print(f"{mode:<12} {result['ready_seconds']:>8.2f} {result['workers']:>8} "
+                  f"{(result['master'] or {}).get('rss_mb', 0.0):>11.1f} {worker.get('rss_mb', 0.0):>11.1f} "
+                  f"{worker.get('pss_mb', 0.0):>11.1f} {worker.get('uss_mb', 0.0):>11.1f} "
+                  f"{result['total_pss_mb']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"imports": imports, "servers": servers}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,66 @@
+import os
+import sys
+
+
+def requested_profile() -> str:
+    """从命令行（--profile）或 SERVER_PROFILE 环境变量读取工作进程模式，在 argparse 之前使用"""
+    argv = sys.argv[1:]
+    for i, arg in enumerate(argv):
+        if arg == "--profile" and i + 1 < len(argv):
+            return argv[i + 1].lower()
+        if arg.startswith("--profile="):
+            return arg.split("=", 1)[1].lower()
+        if arg == "--asgi":
+            return "uvicorn"
+    return os.getenv("SERVER_PROFILE", "sync").lower()
+
+
+if requested_profile() == "gevent":
+    # gevent 必须在导入 socket/ssl/threading 的模块（requests、模型 SDK）之前打补丁
+    try:
+        from gevent import monkey
+    except ImportError:
+        print("请先安装 gevent: pip install gevent")
+        sys.exit(1)
+    monkey.patch_all()
+    # 打补丁后 select.epoll 不存在，已安装的 trio 会在 httpcore 导入它时出错；标记为不可导入后 httpcore 会跳过它
+    sys.modules.setdefault("trio", None)
+
 import requests  # 新增导入
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request, jsonify, stream_with_context
 from PIL import Image
-import os
-import uuid
+import io
 import multiprocessing
-import sys
 import argparse
 import signal
 import atexit
+import json
 import logging
 from logging.handlers import RotatingFileHandler
 from gunicorn.app.base import BaseApplication
-from main import process_image, set_detection_method  # 导入现有的处理函数和设置方法
+# 多进程共享的指标目录必须在导入 prometheus_client（pipeline 会间接导入）之前设置
+from config import use_multiprocess_metrics
+use_multiprocess_metrics()
+# pipeline 不依赖 Gradio，模型 SDK 和 OCR 模型在首次使用时才加载
+from pipeline import (
+    process_image,
+    process_image_events,
+    run_batch_items,
+    get_clients,
+    preload_shared_state,
+)
+from cache import get_result_cache, get_call_cache
+from rate_limit import get_bucket_levels
+from executor import get_executor_stats
+from usage import RequestUsage
+from pipeline_options import PipelineOptions
+from metrics import render_metrics, reset_metrics_dir, mark_worker_dead
+from jobs import get_job_store, ensure_job_runner, stop_job_runner, job_params
+from config import OCR_WARMUP, OCR_PRELOAD, PRELOAD_APP, BATCH_MAX_IMAGES
+from config import SERVER_PROFILE, SERVER_WORKERS, SERVER_THREADS
+from server_profiles import PROFILES, resolve_profile
+from executor import get_executor
+from ocr import warm_up_ocr
 import time
 
 try:
@@ -20,7 +69,18 @@ except ImportError:
     print("请先安装 uvicorn: pip install uvicorn")
     sys.exit(1)
 
+class InMemoryRequest(Request):
+    """上传的文件始终保存在内存中（Werkzeug 默认会把较大的文件写入临时文件）"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+
+# 工作进程启动时是否预热 OCR（由 --warmup-ocr 设置）
+warmup_ocr_on_worker_init = False
 
 def setup_logging(log_file):
     """设置日志系统"""
@@ -48,22 +108,6 @@ def setup_logging(log_file):
         app.logger.addHandler(file_handler)
 
 
-def generate_temp_filepath():
-    """生成临时文件路径"""
-    temp_dir = "temp_images"
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    return os.path.join(temp_dir, f"{uuid.uuid4()}.png")
-
-
-def cleanup_temp_file(filepath):
-    """清理临时文件"""
-    try:
-        if os.path.exists(filepath):
-            os.remove(filepath)
-    except Exception as e:
-        print(f"清理临时文件失败: {str(e)}")
-
 @app.route("/process-image", methods=["POST"])
 def process_image_api():
     """处理上传的图像并返回分析结果"""
@@ -75,18 +119,13 @@ def process_image_api():
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        # 生成唯一的临时文件路径
-        temp_image_path = generate_temp_filepath()
-        image_file.save(temp_image_path)
-
-        # 设置检测方法（根据需要进行调整）
-        set_detection_method("basic")  # 或者根据请求参数设置
+        # 每个请求使用自己的不可变选项，同一进程内的并发请求互不影响
+        options = PipelineOptions(detection_method="basic")  # 或者根据请求参数设置
 
-        # 调用现有的图像处理函数
-        main_design_choices, analyses, final_analysis = process_image(temp_image_path)
-
-        # 清理临时文件
-        cleanup_temp_file(temp_image_path)
+        # 调用现有的图像处理函数（usage 记录各阶段、各模型的 token 用量与费用）
+        usage = RequestUsage()
+        # 直接从请求流中解码，不写入磁盘
+        main_design_choices, analyses, final_analysis = process_image(image_file.stream, options, usage=usage)
 
         # 返回结果
         return jsonify(
@@ -94,13 +133,11 @@ def process_image_api():
                 "main_design_choices": main_design_choices,
                 "analyses": analyses,
                 "final_analysis": final_analysis,
+                "usage": usage.summary(),
             }
         )
 
     except Exception as e:
-        # 确保发生异常时也清理临时文件
-        if "temp_image_path" in locals():
-            cleanup_temp_file(temp_image_path)
         return jsonify({"error": str(e)}), 500
 
 
@@ -114,22 +151,15 @@ def process_image_url_api():
     image_url = data["image_url"]
 
     try:
-        # 下载图像并保存到唯一的临时文件
-        response = requests.get(image_url)
-        response.raise_for_status()  # 检查请求是否成功
-
-        temp_image_path = generate_temp_filepath()
-        with open(temp_image_path, "wb") as f:
-            f.write(response.content)
+        # 下载图像到内存
+        image_bytes = download_image(image_url)
 
-        # 设置检测方法（根据需要进行调整）
-        set_detection_method("basic")  # 或者根据请求参数设置
+        # 每个请求使用自己的不可变选项，同一进程内的并发请求互不影响
+        options = PipelineOptions(detection_method="basic")  # 或者根据请求参数设置
 
-        # 调用现有的图像处理函数
-        main_design_choices, analyses, final_analysis = process_image(temp_image_path)
-
-        # 清理临时文件
-        cleanup_temp_file(temp_image_path)
+        # 调用现有的图像处理函数（usage 记录各阶段、各模型的 token 用量与费用）
+        usage = RequestUsage()
+        main_design_choices, analyses, final_analysis = process_image(image_bytes, options, usage=usage)
 
         # 返回结果
         return jsonify(
@@ -137,15 +167,148 @@ def process_image_url_api():
                 "main_design_choices": main_design_choices,
                 "analyses": analyses,
                 "final_analysis": final_analysis,
+                "usage": usage.summary(),
             }
         )
 
     except Exception as e:
-        # 确保发生异常时也清理临时文件
-        if "temp_image_path" in locals():
-            cleanup_temp_file(temp_image_path)
         return jsonify({"error": str(e)}), 500
 
+def wants_sse() -> bool:
+    """客户端是否请求 Server-Sent Events（否则返回 NDJSON）"""
+    return request.args.get("format") == "sse" or "text/event-stream" in request.headers.get("Accept", "")
+
+
+def stream_events(events, sse: bool) -> Response:
+    """把事件生成器包装成 SSE 或逐行 JSON（NDJSON）的流式响应"""
+    def generate():
+        for event in events:
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event['type']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        # 禁止反向代理缓冲，保证首个片段尽快到达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/process-image-stream", methods=["POST"])
+def process_image_stream_api():
+    """处理上传的图像，按完成顺序以流的形式返回各阶段结果和逐段生成的最终提示词"""
+    if "image" not in request.files:
+        return jsonify({"error": "No image provided"}), 400
+
+    image_file = request.files["image"]
+    if image_file.filename == "":
+        return jsonify({"error": "No selected file"}), 400
+
+    image_bytes = image_file.read()
+    options = PipelineOptions(detection_method="basic")
+    return stream_events(process_image_events(image_bytes, options=options), wants_sse())
+
+
+def download_image(image_url: str) -> bytes:
+    """下载图像内容"""
+    response = requests.get(image_url, timeout=30)
+    response.raise_for_status()
+    return response.content
+
+
+@app.route("/process-images-batch", methods=["POST"])
+def process_images_batch_api():
+    """批量处理多张图像（multipart 文件和/或 URL），相同图像只处理一次，逐项返回结果或错误"""
+    # 收集输入：multipart 的 images 文件，以及表单或 JSON 中的 image_urls
+    items = [
+        {"source": image_file.filename, "image": image_file.read()}
+        for image_file in request.files.getlist("images")
+        if image_file.filename
+    ]
+    data = request.get_json(silent=True) or {}
+    image_urls = data.get("image_urls") or request.form.getlist("image_urls")
+    items += [{"source": image_url, "url": image_url} for image_url in image_urls]
+
+    if not items:
+        return jsonify({"error": "No images or image URLs provided"}), 400
+    if len(items) > BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images (max {BATCH_MAX_IMAGES})"}), 400
+
+    # 在共享线程池中并发下载 URL
+    lane = get_executor().lane()
+    downloads = {i: lane.submit(download_image, item["url"]) for i, item in enumerate(items) if "url" in item}
+    for i, future in downloads.items():
+        try:
+            items[i]["image"] = future.result()
+        except Exception as e:
+            items[i]["error"] = f"Failed to download image: {str(e)}"
+
+    # 按内容去重后统一处理：所有图像的全图、区域和最终提示词调用经由共享线程池和限流器调度
+    return jsonify(run_batch_items(items, PipelineOptions(detection_method="basic")))
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job_api():
+    """提交异步处理任务，立即返回任务 ID"""
+    if "image" in request.files:
+        image_file = request.files["image"]
+        if image_file.filename == "":
+            return jsonify({"error": "No selected file"}), 400
+        image_bytes = image_file.read()
+    else:
+        data = request.get_json(silent=True) or {}
+        if "image_url" not in data:
+            return jsonify({"error": "No image or image URL provided"}), 400
+        try:
+            response = requests.get(data["image_url"], timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+        image_bytes = response.content
+
+    # 任务写入共享任务表后由后台线程执行，请求处理进程立即返回
+    job_id = get_job_store().create(image_bytes, job_params(PipelineOptions(detection_method="basic")))
+    ensure_job_runner()
+    return jsonify({"job_id": job_id, "status": "queued"}), 202, {"Location": f"/jobs/{job_id}"}
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job_api(job_id):
+    """查询任务状态、已完成的阶段和结果"""
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats_api():
+    """返回结果缓存（所有工作进程共享）和调用缓存的命中/未命中统计"""
+    result_cache = get_result_cache()
+    call_cache = get_call_cache()
+    return jsonify(
+        {
+            "results": result_cache.stats() if result_cache is not None else {"enabled": False},
+            "calls": call_cache.stats() if call_cache is not None else {"enabled": False},
+        }
+    )
+
+@app.route("/rate-limits", methods=["GET"])
+def rate_limits_api():
+    """返回各部署共享令牌桶的当前水位（所有工作进程共享）"""
+    return jsonify(get_bucket_levels())
+
+@app.route("/executor/stats", methods=["GET"])
+def executor_stats_api():
+    """返回本工作进程共享线程池的队列深度、等待时间和活跃任务数"""
+    return jsonify({"pid": os.getpid(), **get_executor_stats()})
+
+@app.route("/metrics", methods=["GET"])
+def metrics_api():
+    """Prometheus 指标：各阶段与模型调用耗时、错误与重试次数、进行中的任务数（汇总所有工作进程）"""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 class StandaloneApplication(BaseApplication):
     """Gunicorn 应用程序封装类"""
 
@@ -162,6 +325,33 @@ class StandaloneApplication(BaseApplication):
     def load(self):
         return self.application
 
+def post_fork(server, worker):
+    """工作进程 fork 之后运行一次 OCR 推理预热（模型已在主进程中加载）"""
+    warm_up_ocr(run_inference=True)
+
+
+def post_worker_init(worker):
+    """在工作进程开始接收请求之前创建模型客户端、按需加载 OCR 模型，并启动后台任务线程"""
+    # 客户端持有连接池，必须在 fork 之后由每个工作进程各自创建
+    try:
+        get_clients()
+    except Exception as e:
+        logging.warning(f"模型客户端初始化失败，将在首次请求时重试: {e}")
+    if warmup_ocr_on_worker_init:
+        warm_up_ocr(run_inference=True)
+    ensure_job_runner()
+
+
+def worker_exit(server, worker):
+    """工作进程退出（如达到 max_requests）时把正在执行的任务放回队列"""
+    stop_job_runner()
+
+
+def child_exit(server, worker):
+    """工作进程退出后清理其进行中指标，避免 /metrics 中残留已退出进程的数值"""
+    mark_worker_dead(worker.pid)
+
+
 def create_pid_file(pid_file: str):
     """创建 PID 文件"""
     with open(pid_file, "w") as f:
@@ -278,7 +468,50 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="UI Screenshot to Prompt API Server")
     parser.add_argument("--daemon", action="store_true", help="在后台运行服务")
     parser.add_argument("--kill", action="store_true", help="停止正在运行的后台服务")
+    parser.add_argument(
+        "--preload-ocr",
+        action="store_true",
+        default=OCR_PRELOAD,
+        help="在主进程中加载 OCR 模型，工作进程以写时复制方式共享",
+    )
+    parser.add_argument(
+        "--warmup-ocr",
+        action="store_true",
+        default=OCR_WARMUP,
+        help="每个工作进程启动时预热 OCR 模型",
+    )
+    parser.add_argument(
+        "--preload-app",
+        action="store_true",
+        default=PRELOAD_APP,
+        help="在主进程中加载应用和模型 SDK，工作进程（包括因 max_requests 重启的进程）以写时复制方式共享",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILES,
+        default=SERVER_PROFILE,
+        help="工作进程模式：sync（每进程一个请求）、gthread（线程）、gevent（协程）或 uvicorn（异步 ASGI 应用 asgi.py）",
+    )
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="等同于 --profile uvicorn",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_WORKERS,
+        help="工作进程数（默认根据模型调用配额计算）",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=SERVER_THREADS,
+        help="每个进程的线程数 / gevent 连接数 / uvicorn 并发请求数（默认根据模型调用配额计算）",
+    )
     args = parser.parse_args()
+    if args.asgi:
+        args.profile = "uvicorn"
 
     # 获取当前目录的绝对路径
     base_dir = os.path.abspath(os.path.dirname(__file__))
@@ -325,13 +558,35 @@ if __name__ == "__main__":
 
         logging.info("服务器正在后台启动...")
 
+    # 清除上次运行残留的指标文件（必须在启动工作进程之前）
+    reset_metrics_dir()
+
+    # 并发度按模型调用配额（RATE_LIMITS）和单个请求的耗时计算，而不是按 CPU 核数；
+    # 请求绝大部分时间在等待模型接口，线程、协程或异步模式可用少量进程承载全部并发
+    profile = resolve_profile(args.profile, args.workers, args.threads, multiprocessing.cpu_count())
+    logging.info(f"工作进程模式 {profile.describe()}，最多同时处理 {profile.concurrency} 个请求")
+
+    if profile.name == "uvicorn":
+        # 异步模式：每个进程用事件循环并发等待模型调用，进程数不必多
+        if args.warmup_ocr or args.preload_ocr:
+            # uvicorn 以 spawn 方式启动工作进程，由各进程在启动时自行预热
+            os.environ["OCR_WARMUP"] = "true"
+        uvicorn.run(
+            "asgi:app",
+            host="0.0.0.0",
+            port=5003,
+            app_dir=base_dir,
+            timeout_keep_alive=5,
+            log_level="info",
+            **profile.uvicorn_options(),
+        )
+        sys.exit(0)
+
     try:
-        # Gunicorn 配置
-        cpu_count = multiprocessing.cpu_count()
+        # Gunicorn 配置（worker_class、workers 以及 threads / worker_connections 来自工作进程模式）
         options = {
             "bind": "0.0.0.0:5003",
-            "workers": min(cpu_count + 2, 6),  # 减少工作进程数量，避免内存过载
-            "worker_class": "sync",  # 使用同步工作进程
+            **profile.gunicorn_options(),
             "timeout": 300,  # 增加超时时间到 300 秒
             "graceful_timeout": 120,  # 优雅退出超时时间
             "keepalive": 5,  # keepalive 连接超时时间
@@ -348,6 +603,20 @@ if __name__ == "__main__":
             "limit_request_field_size": 8190,
         }
 
+        if args.preload_app:
+            # 只读的模块和数据在主进程加载一次；客户端仍由各工作进程在 fork 之后创建
+            preload_shared_state()
+            options["preload_app"] = True
+        if args.preload_ocr:
+            # 在 fork 之前加载模型，但不运行推理（torch 线程池无法跨 fork 使用）
+            warm_up_ocr(run_inference=False)
+            options["post_fork"] = post_fork
+        elif args.warmup_ocr:
+            warmup_ocr_on_worker_init = True
+        options["post_worker_init"] = post_worker_init
+        options["worker_exit"] = worker_exit
+        options["child_exit"] = child_exit
+
         if args.daemon:
             logging.info(f"""
 =================================================
@@ -359,7 +628,7 @@ if __name__ == "__main__":
   - 访问日志：access.log
   - 错误日志：error.log
 - 服务地址：http://0.0.0.0:5003
-- 工作进程数：{options["workers"]}
+- 工作进程模式：{profile.describe()}
 - 请求超时时间：{options["timeout"]}秒
 - 每进程最大请求数：{options["max_requests"]}
 
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import uuid
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from config import ARTIFACT_SINK, ARTIFACT_DIR
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_SINKS = ("none", "memory", "directory")
+
+
+class ArtifactSink:
+    """Receives the RGB detection crops and visualization of one pipeline run; this base sink discards them"""
+
+    # Callers skip drawing the visualization when nothing would keep it
+    enabled = False
+
+    def save(self, name: str, rgb: np.ndarray):
+        """Store one image under a name such as 'component_3' or 'visualization'"""
+
+    def close(self):
+        """Called once when the run has finished, successfully or not"""
+
+
+class MemoryArtifactSink(ArtifactSink):
+    """Keeps the run's artifacts as arrays, e.g. for the Gradio UI to display"""
+
+    enabled = True
+
+    def __init__(self):
+        self.images: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def save(self, name: str, rgb: np.ndarray):
+        with self._lock:
+            self.images[name] = rgb
+
+    def get(self, name: str) -> Optional[np.ndarray]:
+        with self._lock:
+            return self.images.get(name)
+
+
+class DirectoryArtifactSink(ArtifactSink):
+    """Writes the run's artifacts as PNG files to their own directory, which is kept for inspection"""
+
+    enabled = True
+
+    def __init__(self, base_dir: str = ARTIFACT_DIR):
+        self.path = os.path.join(base_dir, str(uuid.uuid4()))
+
+    def save(self, name: str, rgb: np.ndarray):
+        # Created on first use, so runs that fail before detection leave nothing behind
+        os.makedirs(self.path, exist_ok=True)
+        cv2.imwrite(os.path.join(self.path, f"{name}.png"), cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+
+    def close(self):
+        if os.path.isdir(self.path):
+            logger.info(f"Saved detection artifacts to {self.path}")
+
+
+def create_artifact_sink(kind: str = ARTIFACT_SINK) -> ArtifactSink:
+    """Create a sink for one run: 'none', 'memory' or 'directory'"""
+    kind = kind.lower()
+    if kind == "none":
+        return ArtifactSink()
+    if kind == "memory":
+        return MemoryArtifactSink()
+    if kind == "directory":
+        return DirectoryArtifactSink()
+    raise ValueError(f"Invalid artifact sink '{kind}'. Must be one of: {', '.join(ARTIFACT_SINKS)}")
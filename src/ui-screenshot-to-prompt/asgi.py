@@ -0,0 +1,289 @@
+"""ASGI 入口：单个进程内并发处理大量等待 I/O 的截图请求
+
+运行方式：
+    uvicorn asgi:app --host 0.0.0.0 --port 5003
+或：
+    python api.py --asgi
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# 多进程共享的指标目录必须在导入 prometheus_client（async_pipeline 会间接导入）之前设置
+from config import use_multiprocess_metrics
+use_multiprocess_metrics()
+
+from async_pipeline import process_image_async
+from cache import get_result_cache, get_call_cache
+from config import OCR_WARMUP, BATCH_MAX_IMAGES
+from executor import get_executor_stats
+from jobs import get_job_store, ensure_job_runner, stop_job_runner, job_params
+from pipeline import process_image_events, run_batch_items
+from pipeline_options import PipelineOptions
+from metrics import render_metrics
+from ocr import warm_up_ocr
+from rate_limit import get_bucket_levels
+from usage import RequestUsage
+
+logger = logging.getLogger(__name__)
+
+_http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """下载图片用的共享异步 HTTP 客户端"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=30.0, follow_redirects=True)
+    return _http_client
+
+
+async def _analyze(image_bytes: bytes) -> JSONResponse:
+    # 每个请求使用自己的不可变选项（与 api.py 保持一致），并发请求互不影响
+    options = PipelineOptions(detection_method="basic")
+    usage = RequestUsage()
+    main_design_choices, analyses, final_analysis = await process_image_async(image_bytes, options, usage=usage)
+    return JSONResponse(
+        {
+            "main_design_choices": main_design_choices,
+            "analyses": analyses,
+            "final_analysis": final_analysis,
+            "usage": usage.summary(),
+        }
+    )
+
+
+async def process_image_endpoint(request: Request):
+    """处理上传的图像并返回分析结果"""
+    form = await request.form()
+    image_file = form.get("image")
+    if image_file is None or isinstance(image_file, str):
+        return JSONResponse({"error": "No image provided"}, status_code=400)
+    if image_file.filename == "":
+        return JSONResponse({"error": "No selected file"}, status_code=400)
+
+    try:
+        # 直接在内存中处理，不写临时文件
+        image_bytes = await image_file.read()
+        return await _analyze(image_bytes)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def process_image_url_endpoint(request: Request):
+    """处理通过URL上传的图像并返回分析结果"""
+    try:
+        data = await request.json()
+    except ValueError:  # 包括 json.JSONDecodeError 和非 UTF-8 的请求体
+        return JSONResponse({"error": "Invalid JSON body"}, status_code=400)
+    if not isinstance(data, dict) or "image_url" not in data:
+        return JSONResponse({"error": "No image URL provided"}, status_code=400)
+
+    try:
+        response = await get_http_client().get(data["image_url"])
+        response.raise_for_status()
+        return await _analyze(response.content)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def wants_sse(request: Request) -> bool:
+    """客户端是否请求 Server-Sent Events（否则返回 NDJSON）"""
+    return request.query_params.get("format") == "sse" or "text/event-stream" in request.headers.get("accept", "")
+
+
+async def _iterate_events(events):
+    """在线程中逐个取出同步事件生成器的事件，客户端断开时关闭生成器以取消流水线"""
+    pending = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(asyncio.to_thread(next, events, None))
+            event = await asyncio.shield(pending)
+            pending = None
+            if event is None:
+                return
+            yield event
+    finally:
+        # 生成器正在线程中执行时不能关闭，先等当前这一步返回
+        if pending is not None:
+            with contextlib.suppress(Exception):
+                await pending
+        await asyncio.to_thread(events.close)
+
+
+def stream_events(events, sse: bool) -> StreamingResponse:
+    """把事件生成器包装成 SSE 或逐行 JSON（NDJSON）的流式响应"""
+    async def generate():
+        async for event in _iterate_events(events):
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event['type']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # 禁止反向代理缓冲，保证首个片段尽快到达客户端
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def process_image_stream_endpoint(request: Request):
+    """处理上传的图像，按完成顺序以流的形式返回各阶段结果和逐段生成的最终提示词"""
+    form = await request.form()
+    image_file = form.get("image")
+    if image_file is None or isinstance(image_file, str):
+        return JSONResponse({"error": "No image provided"}, status_code=400)
+    if image_file.filename == "":
+        return JSONResponse({"error": "No selected file"}, status_code=400)
+
+    image_bytes = await image_file.read()
+    options = PipelineOptions(detection_method="basic")
+    return stream_events(process_image_events(image_bytes, options=options), wants_sse(request))
+
+
+async def download_image(image_url: str) -> bytes:
+    """下载图像内容"""
+    response = await get_http_client().get(image_url)
+    response.raise_for_status()
+    return response.content
+
+
+async def _read_json(request: Request) -> dict:
+    """解析 JSON 请求体，没有或无效时返回空字典"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def process_images_batch_endpoint(request: Request):
+    """批量处理多张图像（multipart 文件和/或 URL），相同图像只处理一次，逐项返回结果或错误"""
+    # 收集输入：multipart 的 images 文件，以及表单或 JSON 中的 image_urls
+    items = []
+    image_urls = []
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        for image_file in form.getlist("images"):
+            if not isinstance(image_file, str) and image_file.filename:
+                items.append({"source": image_file.filename, "image": await image_file.read()})
+        image_urls = [url for url in form.getlist("image_urls") if isinstance(url, str)]
+    else:
+        image_urls = (await _read_json(request)).get("image_urls") or []
+    items += [{"source": image_url, "url": image_url} for image_url in image_urls]
+
+    if not items:
+        return JSONResponse({"error": "No images or image URLs provided"}, status_code=400)
+    if len(items) > BATCH_MAX_IMAGES:
+        return JSONResponse({"error": f"Too many images (max {BATCH_MAX_IMAGES})"}, status_code=400)
+
+    # 并发下载 URL
+    url_items = [item for item in items if "url" in item]
+    downloads = await asyncio.gather(*(download_image(item["url"]) for item in url_items), return_exceptions=True)
+    for item, download in zip(url_items, downloads):
+        if isinstance(download, Exception):
+            item["error"] = f"Failed to download image: {str(download)}"
+        else:
+            item["image"] = download
+
+    # 批处理在共享线程池中运行（与 api.py 相同），不阻塞事件循环
+    result = await asyncio.to_thread(run_batch_items, items, PipelineOptions(detection_method="basic"))
+    return JSONResponse(result)
+
+
+async def create_job_endpoint(request: Request):
+    """提交异步处理任务，立即返回任务 ID"""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        image_file = form.get("image")
+        if image_file is None or isinstance(image_file, str):
+            return JSONResponse({"error": "No image or image URL provided"}, status_code=400)
+        if image_file.filename == "":
+            return JSONResponse({"error": "No selected file"}, status_code=400)
+        image_bytes = await image_file.read()
+    else:
+        data = await _read_json(request)
+        if "image_url" not in data:
+            return JSONResponse({"error": "No image or image URL provided"}, status_code=400)
+        try:
+            image_bytes = await download_image(data["image_url"])
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+
+    # 任务写入共享任务表后由后台线程执行，请求立即返回
+    params = job_params(PipelineOptions(detection_method="basic"))
+    job_id = await asyncio.to_thread(get_job_store().create, image_bytes, params)
+    return JSONResponse({"job_id": job_id, "status": "queued"}, status_code=202,
+                        headers={"Location": f"/jobs/{job_id}"})
+
+
+async def get_job_endpoint(request: Request):
+    """查询任务状态、已完成的阶段和结果"""
+    job = await asyncio.to_thread(get_job_store().get, request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return JSONResponse(job)
+
+
+async def cache_stats_endpoint(request: Request):
+    """返回结果缓存和调用缓存的命中/未命中统计"""
+    result_cache = get_result_cache()
+    call_cache = get_call_cache()
+    return JSONResponse(
+        {
+            "results": result_cache.stats() if result_cache is not None else {"enabled": False},
+            "calls": call_cache.stats() if call_cache is not None else {"enabled": False},
+        }
+    )
+
+
+async def rate_limits_endpoint(request: Request):
+    """返回各部署共享令牌桶的当前水位"""
+    return JSONResponse(await asyncio.to_thread(get_bucket_levels))
+
+
+async def executor_stats_endpoint(request: Request):
+    """返回本工作进程共享线程池的队列深度、等待时间和活跃任务数"""
+    return JSONResponse({"pid": os.getpid(), **get_executor_stats()})
+
+
+async def metrics_endpoint(request: Request):
+    """Prometheus 指标（汇总所有工作进程）"""
+    body, content_type = await asyncio.to_thread(render_metrics)
+    return Response(body, media_type=content_type)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """工作进程启动时按需预热 OCR 并启动后台任务线程，退出时把进行中的任务放回队列并关闭共享的 HTTP 客户端"""
+    if OCR_WARMUP:
+        await asyncio.to_thread(warm_up_ocr, True)
+    await asyncio.to_thread(ensure_job_runner)
+    yield
+    await asyncio.to_thread(stop_job_runner)
+    if _http_client is not None:
+        await _http_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/process-image", process_image_endpoint, methods=["POST"]),
+        Route("/process-image-url", process_image_url_endpoint, methods=["POST"]),
+        Route("/process-image-stream", process_image_stream_endpoint, methods=["POST"]),
+        Route("/process-images-batch", process_images_batch_endpoint, methods=["POST"]),
+        Route("/jobs", create_job_endpoint, methods=["POST"]),
+        Route("/jobs/{job_id}", get_job_endpoint, methods=["GET"]),
+        Route("/cache/stats", cache_stats_endpoint, methods=["GET"]),
+        Route("/rate-limits", rate_limits_endpoint, methods=["GET"]),
+        Route("/executor/stats", executor_stats_endpoint, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
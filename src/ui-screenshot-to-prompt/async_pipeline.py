@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import weakref
+from typing import List, Optional
+
+from config import (
+    VISION_ANALYSIS_PROMPT,
+    MAIN_DESIGN_ANALYSIS_PROMPT,
+    ASYNC_MAX_CONCURRENT_CALLS,
+    load_and_initialize_async_clients,
+)
+from cache import memoize_call_async
+from decoded_image import DecodedImage, ImageSource, read_image_source
+from artifacts import ArtifactSink, create_artifact_sink
+from image_payload import build_image_payload
+from rate_limit import rate_limited_call_async, estimate_request_tokens
+from usage import RequestUsage
+from metrics import pipeline_started, pipeline_finished, time_stage
+from pipeline_options import PipelineOptions
+from pipeline import (
+    VisionImage,
+    NoDetectionsError,
+    build_vision_request,
+    build_detection_prompt,
+    run_detection,
+    save_detection_crop,
+    save_visualization,
+    link_descriptions,
+    prepare_super_prompt,
+    pipeline_cache_key,
+    lookup_cached_result,
+    store_cached_result,
+)
+
+logger = logging.getLogger(__name__)
+
+_async_clients = None
+_call_semaphores: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_clients():
+    """Return (async OpenAI client, async super prompt function), created on first use"""
+    global _async_clients
+    if _async_clients is None:
+        _async_clients = load_and_initialize_async_clients()
+    return _async_clients
+
+
+def _reset_after_fork():
+    # Clients and their connection pools are created per process
+    global _async_clients
+    _async_clients = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_call_semaphore() -> asyncio.Semaphore:
+    """Semaphore bounding in-flight provider calls on the running event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _call_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENT_CALLS)
+        _call_semaphores[loop] = semaphore
+    return semaphore
+
+
+async def call_vision_api_async(model: str, image: VisionImage, system_prompt: str, user_prompt: str,
+                                temperature: float = 0.1, json_response: bool = True,
+                                usage: Optional[RequestUsage] = None, stage: str = "vision") -> str:
+    """Async counterpart of pipeline.call_vision_api"""
+    try:
+        openai_client, _ = get_async_clients()
+        # Resizing and encoding are CPU work; keep them off the event loop
+        payload = await asyncio.to_thread(build_image_payload, image)
+        request_kwargs = build_vision_request(model, payload, system_prompt, user_prompt, temperature, json_response)
+
+        async def create_completion() -> str:
+            async with get_call_semaphore():
+                response = await rate_limited_call_async(
+                    f"openai:{model}",
+                    estimate_request_tokens(request_kwargs, payload.estimated_tokens),
+                    lambda: openai_client.chat.completions.create(**request_kwargs),
+                    lambda r: r.usage.total_tokens if r.usage else None,
+                )
+            if usage is not None:
+                usage.record_image(payload)
+                usage.record_call(stage, "openai", model, response.usage, payload.estimated_tokens)
+            return response.choices[0].message.content.strip()
+
+        return await memoize_call_async("openai", model, request_kwargs, create_completion)
+
+    except Exception as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        raise
+
+
+async def analyze_main_design_choices_async(image: VisionImage, temp: float = 0.1,
+                                            usage: Optional[RequestUsage] = None) -> str:
+    """Analyze the main flow/purpose of the entire image, returns main_image_caption"""
+    logger.info("Analyzing main design choices")
+    try:
+        return await call_vision_api_async(
+            model="gpt-4o",
+            image=image,
+            system_prompt=MAIN_DESIGN_ANALYSIS_PROMPT,
+            user_prompt="Analyze this interface's complete design system and structure.",
+            temperature=temp,
+            json_response=False,
+            usage=usage,
+            stage="main_design"
+        )
+    except Exception as e:
+        logger.error(f"Error analyzing main design: {str(e)}")
+        return "Error analyzing main design structure"
+
+
+async def describe_activity_async(image: VisionImage, usage: Optional[RequestUsage] = None) -> str:
+    """Describe the activity shown in the image"""
+    logger.info("Describing activity in image")
+    return await call_vision_api_async(
+        model="gpt-4o",
+        image=image,
+        system_prompt="Describe the activity of this webpage in a few sentences.",
+        user_prompt="What activity is shown in this image?",
+        temperature=0.1,
+        json_response=False,
+        usage=usage,
+        stage="activity"
+    )
+
+
+async def analyze_detection_async(args, options: PipelineOptions, usage: Optional[RequestUsage] = None) -> str:
+    """Analyze individual detection (region/component) of the image"""
+    detection_image, index, location = args
+    logger.info(f"Analyzing {options.detection_term} {index} in {location}")
+    analysis = await call_vision_api_async(
+        model="gpt-4o-mini",
+        image=detection_image,
+        system_prompt=VISION_ANALYSIS_PROMPT,
+        user_prompt=build_detection_prompt(index, location, options.detection_term),
+        usage=usage,
+        stage="regions"
+    )
+    return f"[Location: {location}]\n{analysis}"
+
+
+async def call_super_prompt_async(main_image_caption: str, component_captions: List[str],
+                                  activity_description: str, options: PipelineOptions,
+                                  usage: Optional[RequestUsage] = None) -> str:
+    """Build and send the super prompt integrating all analyses"""
+    try:
+        final_prompt = prepare_super_prompt(main_image_caption, component_captions, activity_description, options)
+        _, super_prompt_function = get_async_clients()
+        if not super_prompt_function:
+            raise ValueError("No API client available for super prompt generation")
+        async with get_call_semaphore():
+            return await super_prompt_function(final_prompt, usage=usage)
+    except Exception as e:
+        logger.error("Error in super prompt generation: %s", str(e))
+        raise
+
+
+async def _timed(stage: str, awaitable):
+    with time_stage(stage):
+        return await awaitable
+
+
+async def process_image_async(image: ImageSource, options: Optional[PipelineOptions] = None,
+                              usage: Optional[RequestUsage] = None, artifacts: Optional[ArtifactSink] = None):
+    """Asyncio version of pipeline.process_image taking the same image sources.
+
+    Provider calls are awaited on async clients, bounded by a per-process
+    semaphore; decoding, detection and file I/O run in worker threads.
+    """
+    options = options or PipelineOptions()
+    usage = usage if usage is not None else RequestUsage()
+    try:
+        if isinstance(image, str) or hasattr(image, "read"):
+            image_data, image_path = await asyncio.to_thread(read_image_source, image)
+        else:
+            image_data, image_path = read_image_source(image)
+    except (OSError, TypeError) as e:
+        logger.error(f"Error reading image: {str(e)}")
+        return "Error processing image", [], "Error in final analysis"
+
+    started = pipeline_started()
+    # Hashing the image and the SQLite cache transactions block, so they run off the event loop
+    cache_key = await asyncio.to_thread(pipeline_cache_key, image_data, options)
+    if cache_key is not None:
+        cached_result = await asyncio.to_thread(lookup_cached_result, cache_key)
+        if cached_result is not None:
+            pipeline_finished(started, "cached")
+            return cached_result
+
+    outcome = "error"
+    artifacts = artifacts if artifacts is not None else create_artifact_sink()
+    try:
+        decoded = await _timed("decode", asyncio.to_thread(DecodedImage.from_data, image_data, image_path))
+
+        # Full-image analyses start immediately and run alongside detection and regions
+        main_task = asyncio.create_task(_timed("main_design", analyze_main_design_choices_async(decoded, usage=usage)))
+        activity_task = asyncio.create_task(_timed("activity", describe_activity_async(decoded, usage=usage)))
+        try:
+            detector, detections = await _timed("detect", asyncio.to_thread(
+                run_detection, decoded, options
+            ))
+            analysis_args = [(decoded.crop(d.bbox), i, d.text) for i, d in enumerate(detections)]
+            if artifacts.enabled:
+                await asyncio.to_thread(
+                    lambda: [save_detection_crop(artifacts, i, crop, options.detection_term) for crop, i, _ in analysis_args]
+                )
+            detection_analyses = await _timed("regions", asyncio.gather(
+                *(analyze_detection_async(args, options, usage=usage) for args in analysis_args)
+            ))
+            main_design_choices, activity_description = await asyncio.gather(main_task, activity_task)
+        except BaseException:
+            main_task.cancel()
+            activity_task.cancel()
+            raise
+
+        descriptions = link_descriptions(detections, detection_analyses)
+        final_analysis = await _timed(
+            "super_prompt",
+            call_super_prompt_async(main_design_choices, descriptions, activity_description, options, usage=usage)
+        )
+
+        if artifacts.enabled:
+            await asyncio.to_thread(save_visualization, artifacts, detector, decoded.rgb, detections)
+
+        logger.info("Image processing completed successfully")
+        await asyncio.to_thread(store_cached_result, cache_key, main_design_choices, descriptions, final_analysis)
+        outcome = "ok"
+        return main_design_choices, descriptions, final_analysis
+
+    except NoDetectionsError as e:
+        outcome = "no_detections"
+        logger.error(f"{str(e)} Exiting processing.")
+        return str(e), [], "Error in final analysis"
+
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        return "Error processing image", [], "Error in final analysis"
+
+    finally:
+        artifacts.close()
+        pipeline_finished(started, outcome)
@@ -0,0 +1,472 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from config import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_PATH,
+    RESULT_CACHE_TTL_SECONDS,
+    RESULT_CACHE_MAX_BYTES,
+    CALL_CACHE_BACKEND,
+    CALL_CACHE_PATH,
+    CALL_CACHE_MAX_BYTES,
+    CALL_CACHE_MAX_ENTRIES,
+    CALL_CACHE_TTL_SECONDS,
+)
+from sqlite_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached payload layout or the pipeline output changes shape
+RESULT_CACHE_VERSION = "v1"
+# Hit/miss counters and LRU access times are written in batches at most this often
+DISK_CACHE_FLUSH_SECONDS = 1.0
+
+
+class DiskCache:
+    """SQLite-backed key/value cache with TTL and size-based LRU eviction.
+
+    SQLite serialises writers with file locks, so a single cache file can be
+    shared by every gunicorn worker process on the host. Values are stored
+    as JSON; hit/miss counters live in the same file so they are aggregated
+    across workers. Lookups only read: counters and LRU access times are
+    buffered per process and written in one transaction at most every
+    DISK_CACHE_FLUSH_SECONDS, or with the next set().
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._connections = SQLiteConnections(path)
+        self._pending_lock = threading.Lock()
+        self._reset_pending()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.connect()
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries(expires_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    def _reset_pending(self):
+        """Start a new batch of buffered counter increments and access times (pending lock held)"""
+        self._pending_pid = os.getpid()
+        self._pending_counts = {"hits": 0, "misses": 0}
+        self._pending_access: Dict[str, float] = {}
+        self._pending_since = time.monotonic()
+
+    def _record_lookup(self, key: str, hit: bool, now: float) -> bool:
+        """Buffer a lookup; returns True when the buffer is due to be flushed"""
+        with self._pending_lock:
+            # A forked child must not flush its parent's lookups a second time
+            if self._pending_pid != os.getpid():
+                self._reset_pending()
+            self._pending_counts["hits" if hit else "misses"] += 1
+            if hit:
+                self._pending_access[key] = now
+            return time.monotonic() - self._pending_since >= DISK_CACHE_FLUSH_SECONDS
+
+    def _take_pending(self) -> Tuple[Dict[str, int], Dict[str, float]]:
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                self._reset_pending()
+            counts, access = self._pending_counts, self._pending_access
+            self._reset_pending()
+            return counts, access
+
+    def _write_pending(self, conn: sqlite3.Connection, counts: Dict[str, int], access: Dict[str, float]):
+        """Apply buffered lookups inside the caller's write transaction"""
+        for name, value in counts.items():
+            if value:
+                conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+        if access:
+            conn.executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in access.items()],
+            )
+
+    def flush(self):
+        """Write this process's buffered hit/miss counters and LRU access times"""
+        counts, access = self._take_pending()
+        if not any(counts.values()) and not access:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_pending(conn, counts, access)
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logger.warning(f"Failed to write cache counters to {self.path}: {str(e)}")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss or expiry"""
+        now = time.time()
+        # A plain read: WAL readers never wait for writers or for each other.
+        # Expired rows are left for the next set() to evict.
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        hit = row is not None and row[1] > now
+        if self._record_lookup(key, hit, now):
+            self.flush()
+        return json.loads(row[0]) if hit else None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Store value under key and evict expired/least recently used entries"""
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            logger.warning(f"Cache entry of {size} bytes exceeds cache size limit, not storing")
+            return
+
+        conn = self._connect()
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        # Write buffered lookups first so eviction sees current access times
+        counts, access = self._take_pending()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._write_pending(conn, counts, access)
+            conn.execute(
+                """INSERT OR REPLACE INTO entries
+                   (key, value, size, created_at, expires_at, last_access)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, payload, size, now, now + ttl, now),
+            )
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} cache entries from {self.path}")
+
+    def delete(self, key: str):
+        """Remove a single entry"""
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        """Remove all entries and reset counters"""
+        self._take_pending()
+        conn = self._connect()
+        conn.execute("DELETE FROM entries")
+        conn.execute("UPDATE counters SET value = 0")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current occupancy"""
+        self.flush()
+        conn = self._connect()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        entries, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+class MemoryCache:
+    """In-process LRU cache with the same interface as DiskCache.
+
+    Entries are bounded both by count and by their JSON-encoded size.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss or expiry"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= now:
+                if entry is not None:
+                    self._remove(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        """Store value under key and evict least recently used entries"""
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            logger.warning(f"Cache entry of {size} bytes exceeds cache size limit, not storing")
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.time() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def delete(self, key: str):
+        """Remove a single entry"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Remove all entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+def create_cache_backend(backend: str, path: str, ttl_seconds: float, max_bytes: int,
+                         max_entries: int) -> Optional[Any]:
+    """Factory for cache backends: 'memory', 'disk' or 'none'"""
+    backend = (backend or "none").lower()
+    if backend == "memory":
+        return MemoryCache(ttl_seconds=ttl_seconds, max_bytes=max_bytes, max_entries=max_entries)
+    elif backend == "disk":
+        return DiskCache(path, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+    elif backend == "none":
+        return None
+    else:
+        raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def result_cache_key(
+    image_bytes: bytes,
+    detection_method: str,
+    max_detections: int,
+    min_width: int,
+    min_height: int,
+    prompt_choice: str,
+) -> str:
+    """Build a content-addressed key for a full process_image result"""
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    params = json.dumps(
+        {
+            "detection_method": (detection_method or "").lower(),
+            "max_detections": int(max_detections),
+            "min_width": int(min_width),
+            "min_height": int(min_height),
+            "prompt_choice": (prompt_choice or "").lower(),
+        },
+        sort_keys=True,
+    )
+    params_digest = hashlib.sha256(params.encode("utf-8")).hexdigest()[:16]
+    return f"result:{RESULT_CACHE_VERSION}:{image_digest}:{params_digest}"
+
+
+_result_cache: Optional[DiskCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[DiskCache]:
+    """Return the process-wide result cache, or None when disabled"""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = DiskCache(
+                    RESULT_CACHE_PATH,
+                    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+                    max_bytes=RESULT_CACHE_MAX_BYTES,
+                )
+                logger.info(f"Result cache opened at {RESULT_CACHE_PATH}")
+    return _result_cache
+
+
+_call_cache: Optional[Any] = None
+_call_cache_initialized = False
+_call_cache_lock = threading.Lock()
+
+
+def get_call_cache() -> Optional[Any]:
+    """Return the process-wide provider call cache, or None when disabled"""
+    global _call_cache, _call_cache_initialized
+    if not _call_cache_initialized:
+        with _call_cache_lock:
+            if not _call_cache_initialized:
+                _call_cache = create_cache_backend(
+                    CALL_CACHE_BACKEND,
+                    CALL_CACHE_PATH,
+                    ttl_seconds=call_cache_ttl("default"),
+                    max_bytes=CALL_CACHE_MAX_BYTES,
+                    max_entries=CALL_CACHE_MAX_ENTRIES,
+                )
+                _call_cache_initialized = True
+                logger.info(f"Provider call cache backend: {CALL_CACHE_BACKEND}")
+    return _call_cache
+
+
+def call_cache_ttl(model: str) -> float:
+    """Return the TTL configured for a model, falling back to the default"""
+    return CALL_CACHE_TTL_SECONDS.get(model, CALL_CACHE_TTL_SECONDS["default"])
+
+
+def call_cache_key(provider: str, payload: Dict[str, Any]) -> str:
+    """Hash the full request payload (including encoded image bytes) of a provider call"""
+    serialized = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return f"call:{provider}:{hashlib.sha256(serialized.encode('utf-8')).hexdigest()}"
+
+
+def memoize_call(provider: str, model: str, payload: Dict[str, Any], compute: Callable[[], str]) -> str:
+    """Return the cached response for payload, or run compute() and cache its result"""
+    call_cache = get_call_cache()
+    if call_cache is None:
+        return compute()
+
+    key = call_cache_key(provider, payload)
+    try:
+        cached = call_cache.get(key)
+    except Exception as e:
+        logger.warning(f"Call cache lookup failed: {str(e)}")
+        cached = None
+    if cached is not None:
+        logger.info(f"Call cache hit for {provider}/{model}")
+        return cached["response"]
+
+    response = compute()
+    try:
+        call_cache.set(key, {"response": response}, ttl_seconds=call_cache_ttl(model))
+    except Exception as e:
+        logger.warning(f"Call cache store failed: {str(e)}")
+    return response
+
+
+async def memoize_call_async(provider: str, model: str, payload: Dict[str, Any],
+                             compute: Callable[[], Awaitable[str]]) -> str:
+    """Async counterpart of memoize_call; hashing and cache I/O run in a worker thread"""
+    call_cache = get_call_cache()
+    if call_cache is None:
+        return await compute()
+
+    # The payload carries the base64 image and a disk cache lookup is a SQLite
+    # read, so neither may run on the event loop
+    key = await asyncio.to_thread(call_cache_key, provider, payload)
+    try:
+        cached = await asyncio.to_thread(call_cache.get, key)
+    except Exception as e:
+        logger.warning(f"Call cache lookup failed: {str(e)}")
+        cached = None
+    if cached is not None:
+        logger.info(f"Call cache hit for {provider}/{model}")
+        return cached["response"]
+
+    response = await compute()
+    try:
+        await asyncio.to_thread(call_cache.set, key, {"response": response}, call_cache_ttl(model))
+    except Exception as e:
+        logger.warning(f"Call cache store failed: {str(e)}")
+    return response
+
+
+def memoize_stream(provider: str, model: str, payload: Dict[str, Any],
+                   stream: Callable[[], Iterator[str]]) -> Iterator[str]:
+    """Streaming counterpart of memoize_call: a cached response is yielded as one chunk,
+    otherwise chunks are passed through and the full text is cached once the stream ends"""
+    call_cache = get_call_cache()
+    if call_cache is None:
+        yield from stream()
+        return
+
+    key = call_cache_key(provider, payload)
+    try:
+        cached = call_cache.get(key)
+    except Exception as e:
+        logger.warning(f"Call cache lookup failed: {str(e)}")
+        cached = None
+    if cached is not None:
+        logger.info(f"Call cache hit for {provider}/{model}")
+        yield cached["response"]
+        return
+
+    chunks = []
+    parts = stream()
+    try:
+        for chunk in parts:
+            chunks.append(chunk)
+            yield chunk
+    finally:
+        # Close the provider stream right away if our consumer stopped early
+        parts.close()
+    try:
+        call_cache.set(key, {"response": "".join(chunks)}, ttl_seconds=call_cache_ttl(model))
+    except Exception as e:
+        logger.warning(f"Call cache store failed: {str(e)}")
@@ -0,0 +1,257 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Set
+
+from tqdm import tqdm
+
+from config import MAX_UI_COMPONENTS, MIN_REGION_WIDTH_SIMPLE, MIN_REGION_HEIGHT_SIMPLE, DEFAULT_PROMPT_CHOICE
+from decoded_image import DecodedImage
+from detect_components import create_detector
+from image_payload import build_image_payload
+from pipeline_options import PipelineOptions
+from usage import RequestUsage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+def collect_images(inputs: Iterable[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted list of image paths"""
+    paths = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, files in os.walk(entry):
+                paths.update(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.update(p for p in glob.glob(entry, recursive=True) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in paths)
+
+
+def load_finished(manifest_path: str, include_failed: bool = False) -> Set[str]:
+    """Paths already recorded in the manifest; a torn last line is ignored"""
+    finished = set()
+    if not os.path.exists(manifest_path):
+        return finished
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok" or include_failed:
+                finished.add(record["path"])
+    return finished
+
+
+def detect_image(path: str, options: PipelineOptions) -> Dict[str, Any]:
+    """Decode, detect, crop and encode one screenshot (runs in a worker process).
+
+    Returns encoded payloads rather than pixel buffers so only a few KB per
+    region cross the process boundary.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    decoded = DecodedImage.from_bytes(data, filename=path)
+    detector = create_detector(options, decoded)
+    detections = detector.get_components()[:options.max_detections]
+    return {
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "image": build_image_payload(decoded),
+        "regions": [
+            {"location": d.text, "bbox": list(d.bbox), "payload": build_image_payload(decoded.crop(d.bbox))}
+            for d in detections
+        ],
+        "detect_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def build_analysis_graph(detected: Dict[str, Any], options: PipelineOptions, usage: RequestUsage):
+    """Provider stages for one detected screenshot"""
+    from pipeline import analyze_main_design_choices, describe_activity, analyze_detection, call_super_prompt
+    from stage_graph import StageGraph
+
+    image = detected["image"]
+
+    def descriptions(regions):
+        # Same "[location] analysis" shape as link_descriptions
+        return [f"[{region['location']}] {analysis}" for region, analysis in zip(detected["regions"], regions)]
+
+    graph = StageGraph()
+    graph.add_stage("crops", lambda: [(r["payload"], i, r["location"]) for i, r in enumerate(detected["regions"])])
+    graph.add_stage("main_design", lambda: analyze_main_design_choices(image, usage=usage))
+    graph.add_stage("activity", lambda: describe_activity(image, usage=usage))
+    graph.add_map_stage("regions", lambda item: analyze_detection(item, options, usage=usage), over="crops")
+    graph.add_stage("descriptions", descriptions, deps=["regions"])
+    graph.add_stage(
+        "super_prompt",
+        lambda main_design, activity, descriptions: call_super_prompt(main_design, descriptions, activity, options,
+                                                                      usage=usage),
+        deps=["main_design", "activity", "descriptions"]
+    )
+    return graph
+
+
+class Manifest:
+    """Append-only JSONL file with one record per finished screenshot"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Flushed per record so an interrupted run loses at most the items in flight
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def run(paths: List[str], manifest: Manifest, options: PipelineOptions, detect_workers: int, io_workers: int,
+        max_in_flight: int) -> Dict[str, int]:
+    """Stream paths through the detection process pool and the provider thread pool"""
+    from executor import FairExecutor
+
+    io_executor = FairExecutor(io_workers, name="cli-io")
+    # spawn: workers only import the detection modules, never the Gradio app or API clients
+    detect_pool = ProcessPoolExecutor(detect_workers, mp_context=multiprocessing.get_context("spawn"))
+    events: "queue.Queue" = queue.Queue()
+    pending = iter(paths)
+    counts = {"ok": 0, "error": 0}
+    started_at: Dict[str, float] = {}
+    in_flight = 0
+
+    def submit_next() -> bool:
+        path = next(pending, None)
+        if path is None:
+            return False
+        started_at[path] = time.monotonic()
+        # The options are pickled to the worker, so detection there uses this run's settings
+        future = detect_pool.submit(detect_image, path, options)
+        future.add_done_callback(lambda f, path=path: events.put(("detected", path, f)))
+        return True
+
+    def record(path: str, status: str, started: float, **fields):
+        counts[status] += 1
+        manifest.write({
+            "path": path,
+            "status": status,
+            **fields,
+            "seconds": round(time.monotonic() - started, 3),
+            "finished_at": time.time(),
+        })
+
+    progress = tqdm(total=len(paths), unit="img", smoothing=0.05)
+    try:
+        while in_flight < max_in_flight and submit_next():
+            in_flight += 1
+
+        while in_flight:
+            kind, path, payload = events.get()
+            if kind == "detected":
+                try:
+                    detected = payload.result()
+                    if not detected["regions"]:
+                        raise ValueError("No regions detected.")
+                except Exception as e:
+                    logger.error(f"Detection failed for {path}: {e}")
+                    record(path, "error", started_at.pop(path), error=str(e))
+                else:
+                    usage = RequestUsage()
+                    run_handle = build_analysis_graph(detected, options, usage).start(io_executor.lane(path))
+                    run_handle.add_done_callback(
+                        lambda r, path=path, detected=detected, usage=usage:
+                            events.put(("analyzed", path, (detected, usage, r)))
+                    )
+                    continue
+            else:
+                detected, usage, run_handle = payload
+                try:
+                    results = run_handle.wait()
+                except Exception as e:
+                    logger.error(f"Analysis failed for {path}: {e}")
+                    record(path, "error", started_at.pop(path), sha256=detected["sha256"], error=str(e))
+                else:
+                    record(
+                        path,
+                        "ok",
+                        started_at.pop(path),
+                        sha256=detected["sha256"],
+                        detections=[{"location": r["location"], "bbox": r["bbox"]} for r in detected["regions"]],
+                        main_design_choices=results["main_design"],
+                        analyses=results["regions"],
+                        final_analysis=results["super_prompt"],
+                        detect_seconds=detected["detect_seconds"],
+                        usage=usage.summary(),
+                    )
+
+            in_flight -= 1
+            progress.update()
+            progress.set_postfix(ok=counts["ok"], failed=counts["error"])
+            if submit_next():
+                in_flight += 1
+    finally:
+        progress.close()
+        detect_pool.shutdown(wait=False, cancel_futures=True)
+        io_executor.shutdown(wait=False)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate prompts for a directory or glob of UI screenshots")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns (quote '**' globs)")
+    parser.add_argument("-o", "--output", default="manifest.jsonl",
+                        help="JSONL manifest; finished images already in it are skipped")
+    parser.add_argument("--mode", choices=["basic", "advanced"], default="basic", help="Detection method")
+    parser.add_argument("--prompt", choices=["concise", "extensive"], default=DEFAULT_PROMPT_CHOICE,
+                        help="Super prompt detail level")
+    parser.add_argument("--max-detections", type=int, default=MAX_UI_COMPONENTS)
+    parser.add_argument("--min-width", type=int, default=MIN_REGION_WIDTH_SIMPLE)
+    parser.add_argument("--min-height", type=int, default=MIN_REGION_HEIGHT_SIMPLE)
+    parser.add_argument("--detect-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for decoding, detection and OCR")
+    parser.add_argument("--io-workers", type=int, default=16, help="Concurrent provider calls")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Images held in memory at once (default: 2 x detect workers + io workers)")
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry images recorded as failed")
+    args = parser.parse_args(argv)
+
+    paths = collect_images(args.inputs)
+    finished = load_finished(args.output, include_failed=args.skip_failed)
+    todo = [p for p in paths if p not in finished]
+    logger.info(f"{len(paths)} images found, {len(paths) - len(todo)} already in {args.output}, {len(todo)} to process")
+    if not todo:
+        return 0
+
+    max_in_flight = args.max_in_flight or 2 * args.detect_workers + args.io_workers
+    options = PipelineOptions(
+        detection_method=args.mode,
+        prompt_choice=args.prompt,
+        max_detections=args.max_detections,
+        min_width=args.min_width,
+        min_height=args.min_height,
+    )
+    manifest = Manifest(args.output)
+    started = time.monotonic()
+    try:
+        counts = run(todo, manifest, options, args.detect_workers, args.io_workers, max_in_flight)
+    finally:
+        manifest.close()
+    elapsed = time.monotonic() - started
+    logger.info(f"Processed {len(todo)} images in {elapsed:.1f}s ({len(todo) / elapsed:.2f} img/s): "
+                f"{counts['ok']} ok, {counts['error']} failed")
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    raise SystemExit(main())
@@ -1,13 +1,14 @@
-from typing import List, Callable, Tuple, Optional
+import asyncio
+from typing import List, Callable, Tuple, Optional, Awaitable, Iterator, TYPE_CHECKING
 from dotenv import load_dotenv
 import os
 import logging
 import json
-import boto3
-import uuid
-import shutil
-from openai import OpenAI, AzureOpenAI
-from anthropic import Anthropic
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+    from pipeline_options import PipelineOptions
+    from usage import RequestUsage
 
 # Load environment variables
 load_dotenv()
@@ -15,9 +16,8 @@ load_dotenv()
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-# Global configuration variables
-DETECTION_METHOD = 'basic'
-DETECTION_TERM = 'region' if DETECTION_METHOD == 'basic' else 'component'
+# Defaults for PipelineOptions (per-request settings are never stored in module globals)
+DEFAULT_DETECTION_METHOD = 'basic'
 
 # Default component dimensions
 MIN_COMPONENT_WIDTH_ADVANCED = 50
@@ -27,52 +27,163 @@ MAX_UI_COMPONENTS = 6
 MIN_REGION_WIDTH_SIMPLE = 200
 MIN_REGION_HEIGHT_SIMPLE = 200
 
-def generate_temp_dir() -> str:
-    """生成临时目录路径"""
-    base_dir = "split_detections"
-    if not os.path.exists(base_dir):
-        os.makedirs(base_dir)
-    temp_dir = os.path.join(base_dir, str(uuid.uuid4()))
-    os.makedirs(temp_dir)
-    return temp_dir
-
-
-def cleanup_temp_dir(dir_path: str) -> None:
-    """清理临时目录"""
-    try:
-        if os.path.exists(dir_path):
-            shutil.rmtree(dir_path)
-            logger.info(f"Cleaned up temporary directory: {dir_path}")
-    except Exception as e:
-        logger.error(f"Failed to cleanup temporary directory {dir_path}: {str(e)}")
-
-
-def set_detection_method(method: str):
-    """Update the detection method configuration"""
-    global DETECTION_METHOD, DETECTION_TERM
-    if method.lower() not in ['basic', 'advanced']:
-        raise ValueError("Invalid detection method. Must be 'basic' or 'advanced'")
-    DETECTION_METHOD = method.lower()
-    DETECTION_TERM = 'region' if DETECTION_METHOD == 'basic' else 'component'
-    logger.info(f"Detection method set to: {DETECTION_METHOD} ({DETECTION_TERM}s)")
-
-def get_detection_method() -> str:
-    """Get current detection method"""
-    return DETECTION_METHOD
-
-def get_detection_term() -> str:
-    """Get current detection terminology"""
-    return DETECTION_TERM
-
-def set_prompt_choice(choice: str):
-    """Update the prompt choice configuration"""
-    global PROMPT_CHOICE
-    if choice.lower() not in ['concise', 'extensive']:
-        raise ValueError("Invalid prompt choice. Must be 'concise' or 'extensive'")
-    PROMPT_CHOICE = choice.lower()
-    logger.info(f"Prompt choice set to: {PROMPT_CHOICE}")
-
-def load_and_initialize_clients() -> Tuple[OpenAI, Optional[Callable[[str], str]]]:
+# Super prompt models per provider
+BEDROCK_SUPER_PROMPT_MODEL = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+ANTHROPIC_SUPER_PROMPT_MODEL = "claude-3-sonnet-latest"
+OPENROUTER_SUPER_PROMPT_MODEL = "anthropic/claude-3-sonnet"
+
+# Provider endpoint overrides, e.g. to run against benchmarks/fake_provider.py (unset = provider default).
+# Azure OpenAI is redirected with AZURE_OPENAI_ENDPOINT itself.
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")
+
+# Threads in the per-process executor shared by all requests, i.e. the max
+# number of pipeline stages (and so provider calls) in flight per process
+EXECUTOR_MAX_WORKERS = int(os.getenv("EXECUTOR_MAX_WORKERS", 64))
+
+# Batch endpoint limits: images per request, and images in progress at once per batch
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", 500))
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", 16))
+
+# Max provider calls in flight per process for the asyncio pipeline
+ASYNC_MAX_CONCURRENT_CALLS = int(os.getenv("ASYNC_MAX_CONCURRENT_CALLS", 200))
+
+# Provider HTTP clients (see http_transport.py); pools default to the calls a process can have in flight
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", EXECUTOR_MAX_WORKERS))
+HTTP_ASYNC_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_POOL_MAX_CONNECTIONS", ASYNC_MAX_CONCURRENT_CALLS))
+# Idle connections are kept this long, so bursts skip the TCP and TLS handshakes
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 90))
+# Multiplex calls over fewer connections where the provider supports it (needs the h2 package)
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+# Super prompts can stream for several minutes
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 300))
+
+# Super prompt detail level ('concise' or 'extensive')
+DEFAULT_PROMPT_CHOICE = 'concise'
+
+# OCR reader pool (one pool per process)
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "en").split(",")
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", 1))
+# 'per_component': OCR each text_input/button crop separately
+# 'full_image': OCR the whole screenshot once and assign text to every component
+OCR_MODE = os.getenv("OCR_MODE", "per_component")
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", 16))
+# Load OCR models at startup instead of on the first advanced-mode request
+OCR_WARMUP = os.getenv("OCR_WARMUP", "false").lower() == "true"
+# Load OCR models in the gunicorn master so workers share them copy-on-write
+OCR_PRELOAD = os.getenv("OCR_PRELOAD", "false").lower() == "true"
+# Import the app and provider SDKs once in the gunicorn master instead of in every worker
+PRELOAD_APP = os.getenv("PRELOAD_APP", "false").lower() == "true"
+
+# API server worker profile: 'sync', 'gthread', 'gevent' or 'uvicorn' (see server_profiles.py)
+SERVER_PROFILE = os.getenv("SERVER_PROFILE", "sync").lower()
+# Worker processes, and threads/connections per process; 0 derives them from the provider quota
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 0))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", 0))
+# Typical end-to-end latency of one screenshot, used to turn the quota into requests in flight
+SERVER_EXPECTED_REQUEST_SECONDS = float(os.getenv("SERVER_EXPECTED_REQUEST_SECONDS", 30))
+# Upper bound on the derived number of requests in flight per host
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", 256))
+
+# Vision payload optimisation (resize to what the model sees, pick format by content)
+IMAGE_PAYLOAD_OPTIMIZE = os.getenv("IMAGE_PAYLOAD_OPTIMIZE", "true").lower() == "true"
+# 'auto' picks 'low' for images that fit in 512x512, 'high' otherwise
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto").lower()
+# Max estimated tokens per image (0 = only limited by the provider's own resizing)
+IMAGE_TOKEN_BUDGET = int(os.getenv("IMAGE_TOKEN_BUDGET", 0))
+IMAGE_LOSSY_FORMAT = os.getenv("IMAGE_LOSSY_FORMAT", "jpeg").lower()
+IMAGE_LOSSY_QUALITY = int(os.getenv("IMAGE_LOSSY_QUALITY", 90))
+# Images with more distinct colours than this are treated as photographic
+IMAGE_PHOTO_COLOR_THRESHOLD = int(os.getenv("IMAGE_PHOTO_COLOR_THRESHOLD", 4096))
+
+# Where each run's detection crops and visualization go: 'none' (default, nothing is
+# drawn or written), 'memory' (kept for the caller, e.g. the Gradio UI) or 'directory'
+ARTIFACT_SINK = os.getenv("ARTIFACT_SINK", "none").lower()
+# The 'directory' sink writes <ARTIFACT_DIR>/<run id>/*.png and keeps them
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "split_detections")
+
+# On-disk result cache shared by all worker processes
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join("cache", "results.sqlite3"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Per-call provider cache ('memory', 'disk' or 'none')
+CALL_CACHE_BACKEND = os.getenv("CALL_CACHE_BACKEND", "memory")
+CALL_CACHE_PATH = os.getenv("CALL_CACHE_PATH", os.path.join("cache", "calls.sqlite3"))
+CALL_CACHE_MAX_BYTES = int(os.getenv("CALL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CALL_CACHE_MAX_ENTRIES = int(os.getenv("CALL_CACHE_MAX_ENTRIES", 10000))
+# TTL per model in seconds; override with a JSON object, e.g. {"gpt-4o": 3600}
+CALL_CACHE_TTL_SECONDS = {"default": 24 * 3600, **json.loads(os.getenv("CALL_CACHE_TTLS", "{}"))}
+
+# Shared provider rate limits (token buckets in a SQLite file used by all workers)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", os.path.join("cache", "rate_limits.sqlite3"))
+# Requests and tokens per minute per deployment ("<provider>:<model>"); override with JSON,
+# e.g. {"openai:gpt-4o": {"rpm": 480, "tpm": 80000}}
+RATE_LIMITS = {
+    "default": {
+        "rpm": int(os.getenv("RATE_LIMIT_DEFAULT_RPM", 600)),
+        "tpm": int(os.getenv("RATE_LIMIT_DEFAULT_TPM", 100000)),
+    },
+    **json.loads(os.getenv("RATE_LIMITS", "{}")),
+}
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", 6))
+RATE_LIMIT_BASE_BACKOFF = float(os.getenv("RATE_LIMIT_BASE_BACKOFF", 1.0))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", 60.0))
+# The shared limiter retries 429s itself; SDK-level retries would hide them from other workers
+PROVIDER_SDK_MAX_RETRIES = 0 if RATE_LIMIT_ENABLED else 2
+
+# USD per million input/output tokens; the longest model-name prefix that matches wins.
+# Extend or override with JSON, e.g. {"my-azure-deployment": {"input": 2.5, "output": 10}}
+MODEL_PRICING = {
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "claude-3-sonnet": {"input": 3.00, "output": 15.00},
+    "claude-3-5-sonnet": {"input": 3.00, "output": 15.00},
+    "anthropic.claude-3-5-sonnet": {"input": 3.00, "output": 15.00},
+    "anthropic/claude-3-sonnet": {"input": 3.00, "output": 15.00},
+    **json.loads(os.getenv("MODEL_PRICING", "{}")),
+}
+
+# Background jobs (POST /jobs); the job table is shared by all worker processes
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join("cache", "jobs.sqlite3"))
+# Jobs run concurrently per API worker process (0 = only dedicated `python jobs.py` workers)
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", 2))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", 10))
+# Running jobs without a heartbeat for this long are requeued
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", 60))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+
+# Prometheus metrics are written here by every worker process and merged on /metrics
+METRICS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", os.path.join("cache", "metrics"))
+
+
+def use_multiprocess_metrics():
+    """Make this server and its worker processes share Prometheus metrics through METRICS_DIR.
+
+    Only the API servers call this, before anything imports prometheus_client
+    (which picks its storage backend at import time); the Gradio app and the
+    CLI keep the default in-process registry.
+    """
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.abspath(METRICS_DIR))
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+def load_and_initialize_clients() -> Tuple["OpenAI", Optional[Callable[..., str]], Optional[Callable[..., Iterator[str]]]]:
+    """Return the OpenAI client plus blocking and streaming super prompt functions"""
+    # Imported here because cache and rate_limit read their settings from this module
+    from cache import memoize_call, memoize_stream
+    from rate_limit import rate_limited_call, estimate_request_tokens
+    # The provider SDKs take most of the import time; only load them when clients are built
+    import boto3
+    from openai import OpenAI, AzureOpenAI
+    from anthropic import Anthropic
+    from http_transport import create_http_client, http_timeout, botocore_config, instrument_boto_client
+
     # Load environment variables from the .env file
     load_dotenv()
     logger.info("Environment variables loaded")
@@ -90,12 +201,18 @@ def load_and_initialize_clients() -> Tuple[OpenAI, Optional[Callable[[str], str]
     azure_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
     azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
 
+    # One keep-alive connection pool for every httpx-based SDK client in this process
+    http_client = create_http_client()
+
     # 初始化 OpenAI 客户端（优先使用标准 OpenAI，如果没有则使用 Azure OpenAI）
     if azure_api_key and azure_endpoint:
         openai_client = AzureOpenAI(
             api_key=azure_api_key,
             api_version=azure_api_version,
             azure_endpoint=azure_endpoint,
+            max_retries=PROVIDER_SDK_MAX_RETRIES,
+            http_client=http_client,
+            timeout=http_timeout(),
         )
         logger.info("Azure OpenAI client initialized")
     else:
@@ -104,8 +221,9 @@ def load_and_initialize_clients() -> Tuple[OpenAI, Optional[Callable[[str], str]
         )
         raise ValueError("Missing OpenAI or Azure OpenAI credentials")
 
-    # Initialize super prompt function
-    super_prompt_function: Optional[Callable[[str], str]] = None
+    # Initialize super prompt functions
+    super_prompt_function: Optional[Callable[..., str]] = None
+    super_prompt_stream_function: Optional[Callable[..., Iterator[str]]] = None
 
     # 优先使用 AWS Bedrock
     if aws_access_key and aws_secret_key:
@@ -115,68 +233,368 @@ def load_and_initialize_clients() -> Tuple[OpenAI, Optional[Callable[[str], str]
                 aws_access_key_id=aws_access_key,
                 aws_secret_access_key=aws_secret_key,
                 region_name=aws_region,
+                endpoint_url=BEDROCK_ENDPOINT_URL,
+                config=botocore_config(),
             )
-
-            def bedrock_super_prompt(prompt: str) -> str:
-                body = json.dumps(
-                    {
-                        "anthropic_version": "bedrock-2023-05-31",
-                        "max_tokens": 8096,
-                        "messages": [{"role": "user", "content": prompt}],
-                    }
-                )
-
-                response = bedrock_runtime.invoke_model(
-                    modelId="anthropic.claude-3-5-sonnet-20241022-v2:0", body=body
-                )
-                logger.info("Bedrock Called")
-                response_body = json.loads(response["body"].read())
-                return response_body["content"][0]["text"]
+            instrument_boto_client(bedrock_runtime)
+
+            def bedrock_super_prompt(prompt: str, usage: Optional["RequestUsage"] = None) -> str:
+                model_id = BEDROCK_SUPER_PROMPT_MODEL
+                payload = {
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": 8096,
+                    "messages": [{"role": "user", "content": prompt}],
+                }
+
+                def invoke_model() -> dict:
+                    response = bedrock_runtime.invoke_model(
+                        modelId=model_id, body=json.dumps(payload)
+                    )
+                    logger.info("Bedrock Called")
+                    return json.loads(response["body"].read())
+
+                def invoke() -> str:
+                    response_body = rate_limited_call(
+                        f"bedrock:{model_id}",
+                        estimate_request_tokens(payload),
+                        invoke_model,
+                        lambda body: body["usage"]["input_tokens"] + body["usage"]["output_tokens"],
+                    )
+                    if usage is not None:
+                        usage.record_call("super_prompt", "bedrock", model_id, response_body.get("usage"))
+                    return response_body["content"][0]["text"]
+
+                return memoize_call("bedrock", model_id, {"model": model_id, **payload}, invoke)
+
+            def bedrock_super_prompt_stream(prompt: str, usage: Optional["RequestUsage"] = None) -> Iterator[str]:
+                model_id = BEDROCK_SUPER_PROMPT_MODEL
+                payload = {
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": 8096,
+                    "messages": [{"role": "user", "content": prompt}],
+                }
+
+                def stream() -> Iterator[str]:
+                    response = rate_limited_call(
+                        f"bedrock:{model_id}",
+                        estimate_request_tokens(payload),
+                        lambda: bedrock_runtime.invoke_model_with_response_stream(
+                            modelId=model_id, body=json.dumps(payload)
+                        ),
+                    )
+                    logger.info("Bedrock stream opened")
+                    reported = {}
+                    try:
+                        for event in response["body"]:
+                            chunk = json.loads(event["chunk"]["bytes"]) if "chunk" in event else None
+                            if not chunk:
+                                continue
+                            if chunk["type"] == "content_block_delta" and chunk["delta"].get("type") == "text_delta":
+                                yield chunk["delta"]["text"]
+                            elif chunk["type"] == "message_start":
+                                reported.update(chunk["message"].get("usage", {}))
+                            elif chunk["type"] == "message_delta":
+                                reported.update(chunk.get("usage", {}))
+                    finally:
+                        # Return the pooled connection even when the consumer stops early
+                        response["body"].close()
+                    if usage is not None:
+                        usage.record_call("super_prompt", "bedrock", model_id, reported)
+
+                return memoize_stream("bedrock", model_id, {"model": model_id, **payload}, stream)
 
             super_prompt_function = bedrock_super_prompt
+            super_prompt_stream_function = bedrock_super_prompt_stream
             logger.info("AWS Bedrock client initialized and set as super prompt client")
         except Exception as e:
             logger.error(f"Failed to initialize AWS Bedrock client: {str(e)}")
             # 如果 AWS Bedrock 初始化失败，继续尝试其他选项
             super_prompt_function = None
+            super_prompt_stream_function = None
 
     # 如果没有 AWS Bedrock，尝试使用 Anthropic
     elif anthropic_api_key:
-        anthropic_client = Anthropic(api_key=anthropic_api_key)
+        anthropic_client = Anthropic(
+            api_key=anthropic_api_key,
+            base_url=ANTHROPIC_BASE_URL,
+            max_retries=PROVIDER_SDK_MAX_RETRIES,
+            http_client=http_client,
+            timeout=http_timeout(),
+        )
         
-        def anthropic_super_prompt(prompt: str) -> str:
-            response = anthropic_client.messages.create(
-                model="claude-3-sonnet-latest",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4096 
-            )
-            logger.info("Anthropic Called")
-            return response.content[0].text
+        def anthropic_super_prompt(prompt: str, usage: Optional["RequestUsage"] = None) -> str:
+            request_kwargs = {
+                "model": ANTHROPIC_SUPER_PROMPT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 4096,
+            }
+
+            def create_message() -> str:
+                response = rate_limited_call(
+                    f"anthropic:{request_kwargs['model']}",
+                    estimate_request_tokens(request_kwargs),
+                    lambda: anthropic_client.messages.create(**request_kwargs),
+                    lambda r: r.usage.input_tokens + r.usage.output_tokens,
+                )
+                logger.info("Anthropic Called")
+                if usage is not None:
+                    usage.record_call("super_prompt", "anthropic", request_kwargs["model"], response.usage)
+                return response.content[0].text
+
+            return memoize_call("anthropic", request_kwargs["model"], request_kwargs, create_message)
+
+        def anthropic_super_prompt_stream(prompt: str, usage: Optional["RequestUsage"] = None) -> Iterator[str]:
+            request_kwargs = {
+                "model": ANTHROPIC_SUPER_PROMPT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 4096,
+            }
+
+            def stream() -> Iterator[str]:
+                # Enter the stream inside the rate limiter: the request (and any 429) happens there
+                message_stream = rate_limited_call(
+                    f"anthropic:{request_kwargs['model']}",
+                    estimate_request_tokens(request_kwargs),
+                    lambda: anthropic_client.messages.stream(**request_kwargs).__enter__(),
+                )
+                logger.info("Anthropic stream opened")
+                with message_stream:
+                    yield from message_stream.text_stream
+                    if usage is not None:
+                        usage.record_call("super_prompt", "anthropic", request_kwargs["model"],
+                                          message_stream.get_final_message().usage)
+
+            return memoize_stream("anthropic", request_kwargs["model"], request_kwargs, stream)
 
         super_prompt_function = anthropic_super_prompt
+        super_prompt_stream_function = anthropic_super_prompt_stream
         logger.info("Anthropic client initialized and set as super prompt client")
 
     # 如果前两个都没有，尝试使用 OpenRouter
     elif openrouter_api_key:
         openrouter_client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=OPENROUTER_BASE_URL,
             api_key=openrouter_api_key,
+            max_retries=PROVIDER_SDK_MAX_RETRIES,
+            http_client=http_client,
+            timeout=http_timeout(),
         )
         
-        def openrouter_super_prompt(prompt: str) -> str:
-            response = openrouter_client.chat.completions.create(
-                model="anthropic/claude-3-sonnet",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=4096 
-            )
-            logger.info("OpenRouter Called")
-            return response.choices[0].message.content
+        def openrouter_super_prompt(prompt: str, usage: Optional["RequestUsage"] = None) -> str:
+            request_kwargs = {
+                "model": OPENROUTER_SUPER_PROMPT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 4096,
+            }
+
+            def create_completion() -> str:
+                response = rate_limited_call(
+                    f"openrouter:{request_kwargs['model']}",
+                    estimate_request_tokens(request_kwargs),
+                    lambda: openrouter_client.chat.completions.create(**request_kwargs),
+                    lambda r: r.usage.total_tokens if r.usage else None,
+                )
+                logger.info("OpenRouter Called")
+                if usage is not None:
+                    usage.record_call("super_prompt", "openrouter", request_kwargs["model"], response.usage)
+                return response.choices[0].message.content
+
+            return memoize_call("openrouter", request_kwargs["model"], request_kwargs, create_completion)
+
+        def openrouter_super_prompt_stream(prompt: str, usage: Optional["RequestUsage"] = None) -> Iterator[str]:
+            request_kwargs = {
+                "model": OPENROUTER_SUPER_PROMPT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 4096,
+            }
+
+            def stream() -> Iterator[str]:
+                completion_stream = rate_limited_call(
+                    f"openrouter:{request_kwargs['model']}",
+                    estimate_request_tokens(request_kwargs),
+                    lambda: openrouter_client.chat.completions.create(
+                        **request_kwargs, stream=True, stream_options={"include_usage": True}
+                    ),
+                )
+                logger.info("OpenRouter stream opened")
+                reported = None
+                with completion_stream:
+                    for chunk in completion_stream:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                        if chunk.usage:
+                            # Sent in a final chunk without choices
+                            reported = chunk.usage
+                if usage is not None:
+                    usage.record_call("super_prompt", "openrouter", request_kwargs["model"], reported)
+
+            return memoize_stream("openrouter", request_kwargs["model"], request_kwargs, stream)
 
         super_prompt_function = openrouter_super_prompt
+        super_prompt_stream_function = openrouter_super_prompt_stream
         logger.info("OpenRouter client initialized and set as super prompt client")
     else:
         logger.warning("No client available for super prompt generation")
 
+    return openai_client, super_prompt_function, super_prompt_stream_function
+
+def load_and_initialize_async_clients() -> Tuple["AsyncOpenAI", Optional[Callable[..., Awaitable[str]]]]:
+    """Async counterpart of load_and_initialize_clients for the asyncio pipeline"""
+    # Imported here because cache and rate_limit read their settings from this module
+    from cache import memoize_call_async
+    from rate_limit import rate_limited_call_async, estimate_request_tokens
+    import boto3
+    from openai import AsyncOpenAI, AsyncAzureOpenAI
+    from anthropic import AsyncAnthropic
+    from http_transport import create_async_http_client, http_timeout, botocore_config, instrument_boto_client
+
+    load_dotenv()
+
+    aws_access_key = os.getenv("AWS_ACCESS_KEY_ID")
+    aws_secret_key = os.getenv("AWS_SECRET_ACCESS_KEY")
+    aws_region = os.getenv("AWS_REGION", "us-east-1")
+    anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
+    openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+
+    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
+    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+
+    http_client = create_async_http_client()
+
+    if azure_api_key and azure_endpoint:
+        openai_client = AsyncAzureOpenAI(
+            api_key=azure_api_key,
+            api_version=azure_api_version,
+            azure_endpoint=azure_endpoint,
+            max_retries=PROVIDER_SDK_MAX_RETRIES,
+            http_client=http_client,
+            timeout=http_timeout(),
+        )
+        logger.info("Async Azure OpenAI client initialized")
+    else:
+        logger.error(
+            "Neither OpenAI API key nor Azure OpenAI credentials are set in the environment variables."
+        )
+        raise ValueError("Missing OpenAI or Azure OpenAI credentials")
+
+    super_prompt_function: Optional[Callable[..., Awaitable[str]]] = None
+
+    if aws_access_key and aws_secret_key:
+        try:
+            bedrock_runtime = boto3.client(
+                service_name="bedrock-runtime",
+                aws_access_key_id=aws_access_key,
+                aws_secret_access_key=aws_secret_key,
+                region_name=aws_region,
+                endpoint_url=BEDROCK_ENDPOINT_URL,
+                config=botocore_config(),
+            )
+            instrument_boto_client(bedrock_runtime)
+
+            async def bedrock_super_prompt(prompt: str, usage: Optional["RequestUsage"] = None) -> str:
+                model_id = BEDROCK_SUPER_PROMPT_MODEL
+                payload = {
+                    "anthropic_version": "bedrock-2023-05-31",
+                    "max_tokens": 8096,
+                    "messages": [{"role": "user", "content": prompt}],
+                }
+
+                def invoke_model() -> dict:
+                    response = bedrock_runtime.invoke_model(
+                        modelId=model_id, body=json.dumps(payload)
+                    )
+                    logger.info("Bedrock Called")
+                    return json.loads(response["body"].read())
+
+                async def invoke() -> str:
+                    # boto3 has no asyncio API; run the blocking call off the event loop
+                    response_body = await rate_limited_call_async(
+                        f"bedrock:{model_id}",
+                        estimate_request_tokens(payload),
+                        lambda: asyncio.to_thread(invoke_model),
+                        lambda body: body["usage"]["input_tokens"] + body["usage"]["output_tokens"],
+                    )
+                    if usage is not None:
+                        usage.record_call("super_prompt", "bedrock", model_id, response_body.get("usage"))
+                    return response_body["content"][0]["text"]
+
+                return await memoize_call_async("bedrock", model_id, {"model": model_id, **payload}, invoke)
+
+            super_prompt_function = bedrock_super_prompt
+            logger.info("AWS Bedrock client initialized and set as async super prompt client")
+        except Exception as e:
+            logger.error(f"Failed to initialize AWS Bedrock client: {str(e)}")
+            super_prompt_function = None
+
+    elif anthropic_api_key:
+        anthropic_client = AsyncAnthropic(
+            api_key=anthropic_api_key,
+            base_url=ANTHROPIC_BASE_URL,
+            max_retries=PROVIDER_SDK_MAX_RETRIES,
+            http_client=http_client,
+            timeout=http_timeout(),
+        )
+
+        async def anthropic_super_prompt(prompt: str, usage: Optional["RequestUsage"] = None) -> str:
+            request_kwargs = {
+                "model": ANTHROPIC_SUPER_PROMPT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 4096,
+            }
+
+            async def create_message() -> str:
+                response = await rate_limited_call_async(
+                    f"anthropic:{request_kwargs['model']}",
+                    estimate_request_tokens(request_kwargs),
+                    lambda: anthropic_client.messages.create(**request_kwargs),
+                    lambda r: r.usage.input_tokens + r.usage.output_tokens,
+                )
+                logger.info("Anthropic Called")
+                if usage is not None:
+                    usage.record_call("super_prompt", "anthropic", request_kwargs["model"], response.usage)
+                return response.content[0].text
+
+            return await memoize_call_async("anthropic", request_kwargs["model"], request_kwargs, create_message)
+
+        super_prompt_function = anthropic_super_prompt
+        logger.info("Async Anthropic client initialized and set as super prompt client")
+
+    elif openrouter_api_key:
+        openrouter_client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=openrouter_api_key,
+            max_retries=PROVIDER_SDK_MAX_RETRIES,
+            http_client=http_client,
+            timeout=http_timeout(),
+        )
+
+        async def openrouter_super_prompt(prompt: str, usage: Optional["RequestUsage"] = None) -> str:
+            request_kwargs = {
+                "model": OPENROUTER_SUPER_PROMPT_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 4096,
+            }
+
+            async def create_completion() -> str:
+                response = await rate_limited_call_async(
+                    f"openrouter:{request_kwargs['model']}",
+                    estimate_request_tokens(request_kwargs),
+                    lambda: openrouter_client.chat.completions.create(**request_kwargs),
+                    lambda r: r.usage.total_tokens if r.usage else None,
+                )
+                logger.info("OpenRouter Called")
+                if usage is not None:
+                    usage.record_call("super_prompt", "openrouter", request_kwargs["model"], response.usage)
+                return response.choices[0].message.content
+
+            return await memoize_call_async("openrouter", request_kwargs["model"], request_kwargs, create_completion)
+
+        super_prompt_function = openrouter_super_prompt
+        logger.info("Async OpenRouter client initialized and set as super prompt client")
+    else:
+        logger.warning("No client available for super prompt generation")
+
     return openai_client, super_prompt_function
 
 VISION_ANALYSIS_PROMPT = """You are an expert AI system analyzing UI components for development replication.
@@ -290,7 +708,7 @@ def build_super_prompt(
     main_image_caption: str, 
     region_descriptions: List[str],
     activity_description: str,
-    prompt_size: str = "concise"
+    options: "PipelineOptions"
 ) -> str:
     """Build UI recreation prompt with configurable detail level
     
@@ -298,11 +716,12 @@ def build_super_prompt(
         main_image_caption: Overall layout description
         region_descriptions: List of detected UI regions from image splitting
         activity_description: User interaction patterns
-        prompt_size: Size of prompt - "concise" or "extensive" (default: "concise")
+        options: Request options; prompt_choice picks "concise" or "extensive",
+            detection_term names the regions/components
     """
     
-    # Get current detection terminology
-    detection_term = get_detection_term()
+    # Terminology of this request's detection method
+    detection_term = options.detection_term
     
     # Build the region specifications string with proper terminology
     region_specs = "\n".join([
@@ -313,7 +732,7 @@ def build_super_prompt(
     # Format main caption if it's not empty
     layout_section = main_image_caption if main_image_caption else "No layout analysis available"
 
-    if prompt_size == "concise":
+    if options.prompt_choice == "concise":
         prompt = f"""This study presents a systematic analysis framework for precise UI replication, incorporating component specifications and visual hierarchy assessment. The framework examines:
 
         [{detection_term.title()} Analysis]
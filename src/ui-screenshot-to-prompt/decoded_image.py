@@ -0,0 +1,118 @@
+import hashlib
+import threading
+from typing import Any, BinaryIO, Callable, Dict, Hashable, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+# What the pipeline accepts: a file path, encoded bytes, a readable file-like object
+# (e.g. an upload stream) or an already decoded RGB array
+ImageSource = Union[str, bytes, bytearray, memoryview, BinaryIO, np.ndarray]
+# What a source is read into: encoded bytes, or the RGB array itself
+ImageData = Union[bytes, np.ndarray]
+
+
+class DecodedImage:
+    """A screenshot decoded once into a single RGB buffer.
+
+    Detectors, crop extraction, encoding and visualization all work on NumPy
+    views of `rgb`; derived data (grayscale, encoded payloads) is computed
+    lazily at most once and shared by every stage of a request.
+    """
+
+    def __init__(self, rgb: np.ndarray, source_bytes: Optional[bytes] = None, filename: Optional[str] = None):
+        self.rgb = rgb
+        self.source_bytes = source_bytes
+        self.filename = filename
+        self.height, self.width = rgb.shape[:2]
+        self._gray: Optional[np.ndarray] = None
+        self._derived: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, filename: Optional[str] = None) -> "DecodedImage":
+        """Decode encoded image bytes (PNG, JPEG, ...)"""
+        bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError(f"Failed to decode image: {filename or '<bytes>'}")
+        # Convert in place so only one full-size buffer is ever allocated
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr)
+        return cls(rgb, source_bytes=data, filename=filename)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, filename: Optional[str] = None) -> "DecodedImage":
+        """Wrap an already decoded RGB array (grayscale and RGBA are converted)"""
+        if array.dtype != np.uint8:
+            raise ValueError(f"Unsupported image array dtype: {array.dtype}")
+        if array.ndim == 2:
+            array = cv2.cvtColor(array, cv2.COLOR_GRAY2RGB)
+        elif array.ndim == 3 and array.shape[2] == 4:
+            array = cv2.cvtColor(array, cv2.COLOR_RGBA2RGB)
+        elif array.ndim != 3 or array.shape[2] != 3:
+            raise ValueError(f"Unsupported image array shape: {array.shape}")
+        return cls(array, filename=filename)
+
+    @classmethod
+    def from_data(cls, data: ImageData, filename: Optional[str] = None) -> "DecodedImage":
+        """Decode encoded bytes or wrap an RGB array, as returned by read_image_source"""
+        if isinstance(data, np.ndarray):
+            return cls.from_array(data, filename)
+        return cls.from_bytes(data, filename)
+
+    @classmethod
+    def from_path(cls, image_path: str) -> "DecodedImage":
+        """Read and decode an image file"""
+        try:
+            with open(image_path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise ValueError(f"Failed to load image: {image_path}") from e
+        return cls.from_bytes(data, filename=image_path)
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Grayscale version of the image, computed once"""
+        if self._gray is None:
+            with self._lock:
+                if self._gray is None:
+                    self._gray = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    def crop(self, bbox: Tuple[int, int, int, int]) -> np.ndarray:
+        """Return a zero-copy view of the region (x, y, w, h)"""
+        x, y, w, h = bbox
+        return self.rgb[y:y + h, x:x + w]
+
+    def derived(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return a value derived from the image, computing it at most once per key"""
+        if key not in self._derived:
+            with self._lock:
+                if key not in self._derived:
+                    self._derived[key] = factory()
+        return self._derived[key]
+
+
+def read_image_source(source: ImageSource) -> Tuple[ImageData, Optional[str]]:
+    """Read a source into (encoded bytes or RGB array, filename), without touching disk unless it is a path"""
+    if isinstance(source, np.ndarray):
+        return source, None
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(), source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source), None
+    if isinstance(source, bytes):
+        return source, None
+    if hasattr(source, "read"):
+        name = getattr(source, "filename", None) or getattr(source, "name", None)
+        return source.read(), name if isinstance(name, str) else None
+    raise TypeError(f"Unsupported image source: {type(source).__name__}")
+
+
+def image_cache_bytes(data: ImageData) -> bytes:
+    """Bytes identifying an image for the result cache: the encoded bytes, or a digest of the pixels and shape"""
+    if isinstance(data, np.ndarray):
+        digest = hashlib.sha256(f"{data.shape}:{data.dtype}:".encode())
+        digest.update(np.ascontiguousarray(data).data)
+        return digest.digest()
+    return data
@@ -1,17 +1,17 @@
 import cv2
-import easyocr
 import numpy as np
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union
 from dataclasses import dataclass
 from logging import getLogger
 from config import (
     MIN_REGION_WIDTH_SIMPLE, 
     MIN_REGION_HEIGHT_SIMPLE, 
-    MIN_COMPONENT_WIDTH_ADVANCED, 
-    MIN_COMPONENT_HEIGHT_ADVANCED,
-    MAX_UI_COMPONENTS,
-    get_detection_term,
+    OCR_MODE,
 )
+from ocr import get_ocr_pool, read_text_boxes, assign_text_to_components
+from decoded_image import DecodedImage
+from metrics import time_stage
+from pipeline_options import PipelineOptions
 
 
 logger = getLogger(__name__)
@@ -33,11 +33,105 @@ class UIDetection:
             'text': self.text
         }
 
+# Compact per-contour candidate record used by AdvancedDetector
+CANDIDATE_DTYPE = np.dtype([
+    ('x', np.int32),
+    ('y', np.int32),
+    ('w', np.int32),
+    ('h', np.int32),
+    ('area', np.float64),
+    ('aspect', np.float64),
+])
+
+def build_candidates(contours, min_width: int, min_height: int) -> np.ndarray:
+    """Build a structured array of candidate boxes, dropping those below the minimum size"""
+    if len(contours) == 0:
+        return np.empty(0, dtype=CANDIDATE_DTYPE)
+    
+    rects = np.array([cv2.boundingRect(contour) for contour in contours], dtype=np.int32)
+    keep = np.flatnonzero((rects[:, 2] >= min_width) & (rects[:, 3] >= min_height))
+    
+    candidates = np.empty(len(keep), dtype=CANDIDATE_DTYPE)
+    candidates['x'] = rects[keep, 0]
+    candidates['y'] = rects[keep, 1]
+    candidates['w'] = rects[keep, 2]
+    candidates['h'] = rects[keep, 3]
+    # Contour area is only computed for contours that survive the size filter
+    candidates['area'] = [cv2.contourArea(contours[i]) for i in keep]
+    candidates['aspect'] = candidates['w'] / candidates['h'].astype(np.float64)
+    return candidates
+
+def _overlap_matrix(ax, ay, aw, ah, bx, by, bw, bh, threshold: float) -> np.ndarray:
+    """Boolean matrix: intersection / smaller box area > threshold for each (a, b) pair"""
+    x_left = np.maximum(ax[:, None], bx[None, :])
+    y_top = np.maximum(ay[:, None], by[None, :])
+    x_right = np.minimum((ax + aw)[:, None], (bx + bw)[None, :])
+    y_bottom = np.minimum((ay + ah)[:, None], (by + bh)[None, :])
+    intersection = np.clip(x_right - x_left, 0, None) * np.clip(y_bottom - y_top, 0, None)
+    smaller_area = np.minimum((aw * ah)[:, None], (bw * bh)[None, :])
+    return intersection / smaller_area > threshold
+
+def suppress_overlaps(candidates: np.ndarray, max_keep: int, threshold: float = 0.5,
+                      block_size: int = 256) -> np.ndarray:
+    """Greedy largest-first overlap suppression over a CANDIDATE_DTYPE array.
+
+    Candidates are visited by descending contour area (ties keep input order);
+    one is kept unless it overlaps an already kept box by more than threshold
+    of the smaller box's area. Stops after max_keep boxes. Work is done a
+    block at a time: each block is first checked against all kept boxes in
+    one vectorized pass, then resolved greedily against itself.
+    """
+    if max_keep <= 0 or len(candidates) == 0:
+        return candidates[:0]
+    
+    ordered = candidates[np.argsort(-candidates['area'], kind='stable')]
+    x = ordered['x'].astype(np.int64)
+    y = ordered['y'].astype(np.int64)
+    w = ordered['w'].astype(np.int64)
+    h = ordered['h'].astype(np.int64)
+    
+    kept_indices: List[int] = []
+    kept = np.empty(0, dtype=np.int64)
+    for start in range(0, len(ordered), block_size):
+        block = np.arange(start, min(start + block_size, len(ordered)))
+        
+        # Drop everything already suppressed by previously kept boxes
+        if len(kept):
+            hits = _overlap_matrix(x[block], y[block], w[block], h[block],
+                                   x[kept], y[kept], w[kept], h[kept], threshold)
+            block = block[~hits.any(axis=1)]
+        if len(block) == 0:
+            continue
+        
+        # Resolve the survivors against each other in area order
+        pairwise = _overlap_matrix(x[block], y[block], w[block], h[block],
+                                   x[block], y[block], w[block], h[block], threshold)
+        suppressed = np.zeros(len(block), dtype=bool)
+        for i in range(len(block)):
+            if suppressed[i]:
+                continue
+            kept_indices.append(int(block[i]))
+            if len(kept_indices) >= max_keep:
+                return ordered[kept_indices]
+            suppressed |= pairwise[i]
+        kept = np.asarray(kept_indices, dtype=np.int64)
+    
+    return ordered[kept_indices]
+
+def load_decoded_image(image: Union[str, DecodedImage]) -> DecodedImage:
+    """Accept an already decoded image or decode one from a file path"""
+    if isinstance(image, DecodedImage):
+        return image
+    return DecodedImage.from_path(image)
+
 class DetectorBase:
     """Shared base functionality for all detectors"""
     
-    @staticmethod
+    # What this detector's detections are called ('region' or 'component')
+    detection_term = "region"
+    
     def create_detection(
+        self,
         bbox: Tuple[int, int, int, int], 
         detection_type: str = "unknown",
         location: str = "",
@@ -45,7 +139,7 @@ class DetectorBase:
         text: str = ""
     ) -> UIDetection:
         """Create a detection with consistent naming"""
-        detection_term = get_detection_term()
+        detection_term = self.detection_term
         
         return UIDetection(
             bbox=bbox,
@@ -54,9 +148,8 @@ class DetectorBase:
             confidence=confidence
         )
 
-    def visualize_detections(self, image: np.ndarray, detections: List[UIDetection], output_path: str):
-        """Visualize detections on the image"""
-        # Make a copy of the image to draw on
+    def draw_detections(self, image: np.ndarray, detections: List[UIDetection]) -> np.ndarray:
+        """Return a copy of the RGB image with the detections drawn on it"""
         viz_image = image.copy()
         
         # Draw each detection
@@ -92,18 +185,19 @@ class DetectorBase:
                        font_scale,
                        (0, 0, 0),  # Black text
                        font_thickness)
-        
-        # Save the visualization
-        cv2.imwrite(output_path, viz_image)
+        return viz_image
+
+    def visualize_detections(self, image: np.ndarray, detections: List[UIDetection], output_path: str):
+        """Visualize detections on the RGB image and save it"""
+        cv2.imwrite(output_path, cv2.cvtColor(self.draw_detections(image, detections), cv2.COLOR_RGB2BGR))
 
 class BasicRegionDetector(DetectorBase):
     """Base class for grid-based region detection"""
     
-    def __init__(self, image_path: str):
-        self.image = cv2.imread(image_path)
-        if self.image is None:
-            raise ValueError(f"Failed to load image: {image_path}")
-        self.height, self.width = self.image.shape[:2]
+    def __init__(self, image: Union[str, DecodedImage]):
+        self.decoded = load_decoded_image(image)
+        self.image = self.decoded.rgb
+        self.height, self.width = self.decoded.height, self.decoded.width
         
     def get_grid_pattern(self) -> Tuple[Tuple[int, int], List[str]]:
         """Return grid size and location names based on image dimensions"""
@@ -178,11 +272,12 @@ class BasicRegionDetector(DetectorBase):
 class ComponentDetectorBase(DetectorBase):
     """Base class for UI component detection"""
     
-    def __init__(self, image_path: str):
-        self.image = cv2.imread(image_path)
-        if self.image is None:
-            raise ValueError(f"Failed to load image: {image_path}")
-        self.height, self.width = self.image.shape[:2]
+    detection_term = "component"
+    
+    def __init__(self, image: Union[str, DecodedImage]):
+        self.decoded = load_decoded_image(image)
+        self.image = self.decoded.rgb
+        self.height, self.width = self.decoded.height, self.decoded.width
         
     def get_components(self) -> List[UIDetection]:
         """Get detected UI components - must be implemented by derived classes"""
@@ -190,20 +285,18 @@ class ComponentDetectorBase(DetectorBase):
 
 class AdvancedDetector(ComponentDetectorBase):
     """Advanced detector using OCR and traditional CV approaches"""
-    def __init__(self, image_path: str, max_components: int, min_width: int, min_height: int):
-        super().__init__(image_path)
-        self.image_path = image_path
+    def __init__(self, image: Union[str, DecodedImage], max_components: int, min_width: int, min_height: int):
+        super().__init__(image)
         self.min_width = min_width
         self.min_height = min_height
         self.MIN_DETECTION_AREA = self.min_width * self.min_height
         self.max_ui_components = max_components
-        print("Initializing EasyOCR (this may download models on first run)...")
-        self.reader = easyocr.Reader(['en'], download_enabled=True)
-        print("EasyOCR initialization complete!")
+        # Readers are loaded once per process and shared across requests
+        self.ocr_pool = get_ocr_pool()
     
     def detect_edges(self) -> np.ndarray:
         """Detect edges in the image using Canny edge detector"""
-        gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        gray = self.decoded.gray
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
         return cv2.Canny(blurred, 50, 150)
     
@@ -223,101 +316,75 @@ class AdvancedDetector(ComponentDetectorBase):
         edges = self.detect_edges()
         contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        # Create list to store all potential components
-        potential_components = []
-        for contour in contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Filter out components that are too small
-            if w < self.min_width or h < self.min_height:
-                continue
-                
-            area = cv2.contourArea(contour)
-            potential_components.append({
-                'bbox': (x, y, w, h),
-                'area': area,
-                'aspect_ratio': w / float(h)
-            })
-        
-        # Sort components by area (largest first)
-        potential_components.sort(key=lambda x: x['area'], reverse=True)
+        # Compact candidate storage and vectorized overlap suppression
+        candidates = build_candidates(contours, self.min_width, self.min_height)
+        kept = suppress_overlaps(candidates, self.max_ui_components)
         
-        # Filter overlapping components (keep only the largest)
-        filtered_components = []
-        for comp in potential_components:
-            x1, y1, w1, h1 = comp['bbox']
-            
-            # Check if this component significantly overlaps with any larger component
-            is_overlapping = False
-            for existing in filtered_components:
-                x2, y2, w2, h2 = existing['bbox']
-                
-                # Calculate intersection
-                x_left = max(x1, x2)
-                y_top = max(y1, y2)
-                x_right = min(x1 + w1, x2 + w2)
-                y_bottom = min(y1 + h1, y2 + h2)
-                
-                if x_right > x_left and y_bottom > y_top:
-                    intersection_area = (x_right - x_left) * (y_bottom - y_top)
-                    smaller_area = min(w1 * h1, w2 * h2)
-                    if intersection_area / smaller_area > 0.5:  # 50% overlap threshold
-                        is_overlapping = True
-                        break
-            
-            if not is_overlapping:
-                filtered_components.append(comp)
-                
-            # Stop if we have enough components
-            if len(filtered_components) >= self.max_ui_components:
-                break
+        bboxes = [(int(c['x']), int(c['y']), int(c['w']), int(c['h'])) for c in kept]
+        component_types = [
+            self.classify_component(float(c['aspect']), float(c['area']))
+            for c in kept
+        ]
+        with time_stage("ocr"):
+            texts = self.extract_texts(bboxes, component_types)
         
         # Convert filtered components to UIDetections
         components = []
-        for comp in filtered_components[:self.max_ui_components]:
-            x, y, w, h = comp['bbox']
-            
-            # Classify component
-            component_type = self.classify_component(comp['aspect_ratio'], comp['area'])
-            
-            # Extract text using OCR if needed
-            text = ""
-            if component_type in ["text_input", "button"]:
-                try:
-                    roi = self.image[y:y+h, x:x+w]
-                    results = self.reader.readtext(roi)
-                    text = " ".join([result[1] for result in results])
-                except Exception as e:
-                    logger.warning(f"OCR failed for component: {e}")
-            
+        for comp, bbox, component_type, text in zip(kept, bboxes, component_types, texts):
             # Create detection with confidence based on area
-            confidence = min(comp['area'] / (self.width * self.height), 1.0)
+            confidence = min(float(comp['area']) / (self.width * self.height), 1.0)
             
             components.append(self.create_detection(
-                bbox=(x, y, w, h),
+                bbox=bbox,
                 detection_type=component_type,
                 confidence=confidence,
                 text=text
             ))
         
-        return components[:self.max_ui_components]
+        return components
+
+    def extract_texts(self, bboxes: List[Tuple[int, int, int, int]], component_types: List[str]) -> List[str]:
+        """Extract text for each component using the configured OCR mode"""
+        if not bboxes:
+            return []
+        
+        if OCR_MODE == "full_image":
+            # One detection/recognition pass over the whole screenshot, then
+            # assign text boxes to every component type spatially
+            try:
+                with self.ocr_pool.reader() as reader:
+                    text_boxes = read_text_boxes(reader, self.image)
+                return assign_text_to_components(text_boxes, bboxes)
+            except Exception as e:
+                logger.warning(f"Full-image OCR failed: {e}")
+                return [""] * len(bboxes)
+        
+        # Per-component mode: OCR only text inputs and buttons, one crop at a time
+        texts = [""] * len(bboxes)
+        if not any(t in ["text_input", "button"] for t in component_types):
+            return texts
+        with self.ocr_pool.reader() as reader:
+            for i, (bbox, component_type) in enumerate(zip(bboxes, component_types)):
+                if component_type not in ["text_input", "button"]:
+                    continue
+                try:
+                    roi = self.decoded.crop(bbox)
+                    results = reader.readtext(roi)
+                    texts[i] = " ".join([result[1] for result in results])
+                except Exception as e:
+                    logger.warning(f"OCR failed for component: {e}")
+        return texts
 
-def create_detector(
-    method: str, 
-    image_path: str,
-    max_components: int = MAX_UI_COMPONENTS,
-    min_width: int = MIN_COMPONENT_WIDTH_ADVANCED,
-    min_height: int = MIN_COMPONENT_HEIGHT_ADVANCED
-) -> DetectorBase:
-    """Factory function to create appropriate detector based on method"""
-    if method.lower() == "basic":
-        return BasicRegionDetector(image_path)
-    elif method.lower() == "advanced":
+def create_detector(options: PipelineOptions, image: Union[str, DecodedImage]) -> DetectorBase:
+    """Factory function to create the detector for the request's detection method"""
+    if options.detection_method == "basic":
+        return BasicRegionDetector(image)
+    elif options.detection_method == "advanced":
         return AdvancedDetector(
-            image_path,
-            max_components=max_components,
-            min_width=min_width,
-            min_height=min_height
+            image,
+            max_components=options.max_detections,
+            min_width=options.min_width,
+            min_height=options.min_height
         )
     else:
-        raise ValueError(f"Unknown detection method: {method}")
+        raise ValueError(f"Unknown detection method: {options.detection_method}")
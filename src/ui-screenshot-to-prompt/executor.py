@@ -0,0 +1,188 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from config import EXECUTOR_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class _WorkItem:
+    __slots__ = ("future", "fn", "args", "kwargs", "submitted_at")
+
+    def __init__(self, future: Future, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted_at = time.monotonic()
+
+
+class FairExecutor:
+    """Long-lived thread pool shared by every request in the process.
+
+    At most max_workers tasks (i.e. provider calls) run at once. Each request
+    submits through its own lane; idle workers take the next task from the
+    lanes in round-robin order, so a screenshot with 50 regions cannot starve
+    requests queued behind it.
+    """
+
+    def __init__(self, max_workers: int, name: str = "pipeline"):
+        self.max_workers = max_workers
+        self.name = name
+        self._condition = threading.Condition()
+        # lane key -> pending work items; lane order is the round-robin order
+        self._lanes: "OrderedDict[Hashable, Deque[_WorkItem]]" = OrderedDict()
+        self._threads = []
+        self._idle = 0
+        self._active = 0
+        self._queued = 0
+        self._completed = 0
+        self._waits: Deque[float] = deque(maxlen=1024)
+        self._max_wait = 0.0
+        self._lane_ids = itertools.count()
+        self._shutdown = False
+
+    def lane(self, key: Optional[Hashable] = None) -> "ExecutorLane":
+        """Return an Executor that submits into its own fair-share lane"""
+        return ExecutorLane(self, key if key is not None else next(self._lane_ids))
+
+    def submit_to(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new work after shutdown")
+            self._lanes.setdefault(key, deque()).append(_WorkItem(future, fn, args, kwargs))
+            self._queued += 1
+            # Idle workers that were already notified may not have woken up yet
+            if self._queued > self._idle and len(self._threads) < self.max_workers:
+                self._spawn()
+            self._condition.notify()
+        return future
+
+    def _spawn(self):
+        thread = threading.Thread(
+            target=self._worker, name=f"{self.name}-{len(self._threads)}", daemon=True
+        )
+        self._threads.append(thread)
+        thread.start()
+
+    def _next_item(self) -> Optional[_WorkItem]:
+        """Pop the next item round-robin across lanes (condition held)"""
+        while self._lanes:
+            key, queue = self._lanes.popitem(last=False)
+            item = queue.popleft()
+            if queue:
+                # Lane goes to the back of the line behind every other request
+                self._lanes[key] = queue
+            self._queued -= 1
+            return item
+        return None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                item = self._next_item()
+                while item is None:
+                    if self._shutdown:
+                        return
+                    self._idle += 1
+                    self._condition.wait()
+                    self._idle -= 1
+                    item = self._next_item()
+                wait = time.monotonic() - item.submitted_at
+                self._waits.append(wait)
+                self._max_wait = max(self._max_wait, wait)
+                self._active += 1
+
+            try:
+                if item.future.set_running_or_notify_cancel():
+                    try:
+                        result = item.fn(*item.args, **item.kwargs)
+                    except BaseException as e:
+                        item.future.set_exception(e)
+                    else:
+                        item.future.set_result(result)
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._completed += 1
+                # Drop references before blocking for the next item
+                item = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, wait time and active-task gauges"""
+        with self._condition:
+            waits = sorted(self._waits)
+            return {
+                "max_workers": self.max_workers,
+                "threads": len(self._threads),
+                "active": self._active,
+                "queue_depth": self._queued,
+                "requests_queued": len(self._lanes),
+                "completed": self._completed,
+                "avg_wait_seconds": round(sum(waits) / len(waits), 4) if waits else 0.0,
+                "p95_wait_seconds": round(waits[int(len(waits) * 0.95)], 4) if waits else 0.0,
+                "max_wait_seconds": round(self._max_wait, 4),
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class ExecutorLane(Executor):
+    """Executor view of one request's lane in a FairExecutor"""
+
+    def __init__(self, executor: FairExecutor, key: Hashable):
+        self.executor = executor
+        self.key = key
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        return self.executor.submit_to(self.key, fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        # The shared executor outlives its lanes
+        pass
+
+
+_executor: Optional[FairExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> FairExecutor:
+    """Return the process-wide executor, created on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = FairExecutor(EXECUTOR_MAX_WORKERS)
+                logger.info(f"Shared executor started with {EXECUTOR_MAX_WORKERS} workers")
+    return _executor
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Executor gauges, without starting the executor"""
+    if _executor is None:
+        return {"max_workers": EXECUTOR_MAX_WORKERS, "threads": 0, "active": 0, "queue_depth": 0}
+    return _executor.stats()
+
+
+def _reset_after_fork():
+    # Worker threads do not survive fork; the child builds its own executor
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
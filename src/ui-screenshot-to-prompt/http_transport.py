@@ -0,0 +1,194 @@
+import logging
+import threading
+from importlib.util import find_spec
+from typing import Any, Optional
+
+import httpx
+
+from config import (
+    HTTP_POOL_MAX_CONNECTIONS,
+    HTTP_ASYNC_POOL_MAX_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP2_ENABLED,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    PROVIDER_SDK_MAX_RETRIES,
+)
+from metrics import observe_http_pool, set_http_pool_capacity
+
+logger = logging.getLogger(__name__)
+
+
+def http2_enabled() -> bool:
+    """HTTP/2 needs the optional h2 package (httpx[http2]); without it clients fall back to HTTP/1.1"""
+    if not HTTP2_ENABLED:
+        return False
+    if find_spec("h2") is None:
+        logger.warning("HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def http_timeout() -> httpx.Timeout:
+    """Connect fast, but let super prompts stream for minutes"""
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def http_limits(max_connections: int) -> httpx.Limits:
+    # Every connection may stay idle in the pool, so a burst of region calls reuses them all
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class _PoolTracker:
+    """Publishes the requests in flight and the open connections of one transport's pool"""
+
+    def __init__(self, name: str, pool: Any, max_connections: int):
+        self.name = name
+        self.pool = pool
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        set_http_pool_capacity(name, max_connections)
+
+    def update(self, delta: int):
+        with self.lock:
+            self.in_flight += delta
+            # httpcore's public view of the pool; a connection is active while it serves a request
+            connections = list(self.pool.connections)
+            idle = sum(1 for connection in connections if connection.is_idle())
+            observe_http_pool(self.name, self.in_flight, len(connections) - idle, idle)
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """Response body that releases its pool slot when closed, i.e. once the connection is free again"""
+
+    def __init__(self, stream: httpx.SyncByteStream, tracker: _PoolTracker):
+        self.stream = stream
+        self.tracker = tracker
+        self.closed = False
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            if not self.closed:
+                self.closed = True
+                self.tracker.update(-1)
+
+
+class _TrackedAsyncStream(httpx.AsyncByteStream):
+    """Async counterpart of _TrackedStream"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, tracker: _PoolTracker):
+        self.stream = stream
+        self.tracker = tracker
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if not self.closed:
+                self.closed = True
+                self.tracker.update(-1)
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """HTTPTransport that exports its connection pool utilisation as metrics"""
+
+    def __init__(self, name: str, max_connections: int, **kwargs):
+        super().__init__(limits=http_limits(max_connections), **kwargs)
+        self.tracker = _PoolTracker(name, self._pool, max_connections)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.tracker.update(1)
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self.tracker.update(-1)
+            raise
+        response.stream = _TrackedStream(response.stream, self.tracker)
+        return response
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that exports its connection pool utilisation as metrics"""
+
+    def __init__(self, name: str, max_connections: int, **kwargs):
+        super().__init__(limits=http_limits(max_connections), **kwargs)
+        self.tracker = _PoolTracker(name, self._pool, max_connections)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.tracker.update(1)
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self.tracker.update(-1)
+            raise
+        response.stream = _TrackedAsyncStream(response.stream, self.tracker)
+        return response
+
+
+def create_http_client(max_connections: int = HTTP_POOL_MAX_CONNECTIONS) -> httpx.Client:
+    """Keep-alive client shared by the OpenAI, Azure OpenAI and Anthropic SDK clients of one process.
+
+    Must be created after fork, like the SDK clients that use it.
+    """
+    http2 = http2_enabled()
+    logger.info(f"HTTP client: {max_connections} pooled connections, http2={http2}")
+    return httpx.Client(
+        transport=InstrumentedTransport("httpx", max_connections, http2=http2),
+        timeout=http_timeout(),
+    )
+
+
+def create_async_http_client(max_connections: int = HTTP_ASYNC_POOL_MAX_CONNECTIONS) -> httpx.AsyncClient:
+    """Async counterpart of create_http_client, for the asyncio pipeline's SDK clients"""
+    http2 = http2_enabled()
+    logger.info(f"Async HTTP client: {max_connections} pooled connections, http2={http2}")
+    return httpx.AsyncClient(
+        transport=InstrumentedAsyncTransport("httpx_async", max_connections, http2=http2),
+        timeout=http_timeout(),
+    )
+
+
+def botocore_config(max_connections: Optional[int] = None):
+    """botocore Config with the same pool size, timeouts and keep-alive as the httpx clients"""
+    from botocore.config import Config as BotoConfig
+
+    max_connections = max_connections or HTTP_POOL_MAX_CONNECTIONS
+    set_http_pool_capacity("botocore", max_connections)
+    return BotoConfig(
+        # botocore's default of 10 connections queues a 50-region fan-out
+        max_pool_connections=max_connections,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        tcp_keepalive=True,
+        retries={"mode": "standard", "total_max_attempts": PROVIDER_SDK_MAX_RETRIES + 1},
+    )
+
+
+def instrument_boto_client(client: Any) -> Any:
+    """Export the requests a boto3 client has in flight (urllib3 does not expose its pool state)"""
+    lock = threading.Lock()
+    in_flight = [0]
+
+    def update(delta: int):
+        with lock:
+            in_flight[0] += delta
+            observe_http_pool("botocore", in_flight[0])
+
+    # needs-retry fires after every attempt, whether it got a response or an error
+    client.meta.events.register("before-send", lambda **kwargs: update(1))
+    client.meta.events.register("needs-retry", lambda **kwargs: update(-1))
+    return client
@@ -0,0 +1,215 @@
+import base64
+import math
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import (
+    IMAGE_PAYLOAD_OPTIMIZE,
+    IMAGE_DETAIL,
+    IMAGE_TOKEN_BUDGET,
+    IMAGE_LOSSY_FORMAT,
+    IMAGE_LOSSY_QUALITY,
+    IMAGE_PHOTO_COLOR_THRESHOLD,
+)
+from decoded_image import DecodedImage
+from metrics import time_stage
+
+# OpenAI vision pricing model: images are fitted into 2048x2048, the
+# shortest side is scaled down to 768, then billed per 512px tile
+TILE_SIZE = 512
+MAX_SIDE = 2048
+SHORT_SIDE = 768
+BASE_TOKENS = 85
+TILE_TOKENS = 170
+LOW_DETAIL_SIDE = 512
+
+PayloadImage = Union[DecodedImage, np.ndarray, Image.Image]
+
+
+@dataclass
+class ImagePayload:
+    """An encoded image ready to embed in a chat message"""
+    data_url: str
+    detail: str
+    media_type: str
+    width: int
+    height: int
+    estimated_tokens: int
+    baseline_tokens: int
+    encoded_bytes: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.estimated_tokens
+
+    def to_content(self) -> dict:
+        """Return the image_url content part for a chat message"""
+        return {"type": "image_url", "image_url": {"url": self.data_url, "detail": self.detail}}
+
+
+def effective_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the provider resizes a high-detail image to before tiling"""
+    scale = min(1.0, MAX_SIDE / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, SHORT_SIDE / min(w, h))
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+
+def count_tiles(width: int, height: int) -> int:
+    return math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """Estimate image input tokens for an image of the given size"""
+    if detail == "low":
+        return BASE_TOKENS
+    w, h = effective_size(width, height)
+    return BASE_TOKENS + TILE_TOKENS * count_tiles(w, h)
+
+
+def fit_to_tile_budget(width: int, height: int, max_tiles: int) -> Tuple[int, int]:
+    """Largest size (not above width x height) whose tile count is within max_tiles"""
+    if count_tiles(width, height) <= max_tiles:
+        return width, height
+    best_scale = 0.0
+    for columns in range(1, math.ceil(width / TILE_SIZE) + 1):
+        scale = min(1.0, columns * TILE_SIZE / width)
+        rows = math.ceil(height * scale / TILE_SIZE)
+        if columns * rows > max_tiles:
+            # Too many rows at this width: shrink until the rows fit
+            rows = max_tiles // columns
+            if rows == 0:
+                break
+            scale = min(scale, rows * TILE_SIZE / height)
+        best_scale = max(best_scale, scale)
+    return max(1, int(width * best_scale)), max(1, int(height * best_scale))
+
+
+def choose_detail(width: int, height: int) -> str:
+    """'low' when the low-detail 512px rendition already holds every pixel"""
+    if IMAGE_DETAIL in ("low", "high"):
+        return IMAGE_DETAIL
+    return "low" if width <= LOW_DETAIL_SIDE and height <= LOW_DETAIL_SIDE else "high"
+
+
+def target_size(width: int, height: int, detail: str, token_budget: int) -> Tuple[int, int]:
+    """Smallest upload size that keeps everything the model will actually see"""
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_SIDE / max(width, height))
+        return max(1, int(width * scale)), max(1, int(height * scale))
+    w, h = effective_size(width, height)
+    if token_budget:
+        max_tiles = max(1, (token_budget - BASE_TOKENS) // TILE_TOKENS)
+        w, h = fit_to_tile_budget(w, h, max_tiles)
+    return w, h
+
+
+def _sample_colors(rgb: np.ndarray, limit: int) -> int:
+    """Count distinct colours on a pixel subsample, capped at limit + 1"""
+    step = max(1, int(math.sqrt(rgb.shape[0] * rgb.shape[1] / 65536)))
+    sample = rgb[::step, ::step].reshape(-1, 3).astype(np.uint32)
+    packed = (sample[:, 0] << 16) | (sample[:, 1] << 8) | sample[:, 2]
+    return min(len(np.unique(packed)), limit + 1)
+
+
+def encode_payload(rgb: np.ndarray) -> Tuple[str, bytes]:
+    """Pick PNG, palette PNG or a lossy format by content and encode"""
+    colors = _sample_colors(rgb, IMAGE_PHOTO_COLOR_THRESHOLD)
+    if colors <= 256:
+        # Flat UI with few colours: exact palette PNG
+        packed = (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2]
+        palette, indices = np.unique(packed, return_inverse=True)
+        if len(palette) <= 256:
+            height, width = rgb.shape[:2]
+            image = Image.frombytes("P", (width, height), indices.astype(np.uint8).tobytes())
+            palette_rgb = np.stack([(palette >> 16) & 255, (palette >> 8) & 255, palette & 255], axis=1)
+            image.putpalette(palette_rgb.astype(np.uint8).flatten().tolist())
+            buffered = BytesIO()
+            image.save(buffered, format="PNG", optimize=True)
+            return "image/png", buffered.getvalue()
+
+    bgr = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2BGR)
+    if colors > IMAGE_PHOTO_COLOR_THRESHOLD:
+        # Photographic content compresses far better lossy
+        if IMAGE_LOSSY_FORMAT == "webp":
+            ok, buffer = cv2.imencode(".webp", bgr, [cv2.IMWRITE_WEBP_QUALITY, IMAGE_LOSSY_QUALITY])
+            media_type = "image/webp"
+        else:
+            ok, buffer = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, IMAGE_LOSSY_QUALITY])
+            media_type = "image/jpeg"
+    else:
+        ok, buffer = cv2.imencode(".png", bgr)
+        media_type = "image/png"
+    if not ok:
+        raise ValueError(f"Failed to encode image as {media_type}")
+    return media_type, buffer.tobytes()
+
+
+def _to_rgb_array(image: PayloadImage) -> np.ndarray:
+    if isinstance(image, DecodedImage):
+        return image.rgb
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(image.convert("RGB"))
+
+
+def build_image_payload(image: Union[PayloadImage, ImagePayload], detail: Optional[str] = None,
+                        token_budget: int = IMAGE_TOKEN_BUDGET) -> ImagePayload:
+    """Resize and encode an image for a vision call with as few tokens and bytes as possible.
+
+    Payloads for a DecodedImage are computed once and shared by every call
+    that sends the same full image with the same settings. An ImagePayload
+    (e.g. encoded ahead of time in a detection worker) is passed through.
+    """
+    if isinstance(image, ImagePayload):
+        return image
+    if isinstance(image, DecodedImage):
+        return image.derived(
+            ("payload", detail, token_budget),
+            lambda: _build_payload(image.rgb, detail, token_budget),
+        )
+    return _build_payload(_to_rgb_array(image), detail, token_budget)
+
+
+@time_stage("encode")
+def _build_payload(rgb: np.ndarray, detail: Optional[str], token_budget: int) -> ImagePayload:
+    height, width = rgb.shape[:2]
+    baseline_tokens = estimate_image_tokens(width, height, "high")
+
+    if not IMAGE_PAYLOAD_OPTIMIZE:
+        ok, buffer = cv2.imencode(".png", cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2BGR))
+        if not ok:
+            raise ValueError("Failed to encode image as PNG")
+        data = buffer.tobytes()
+        return ImagePayload(
+            data_url=f"data:image/png;base64,{base64.b64encode(data).decode()}",
+            detail="high",
+            media_type="image/png",
+            width=width,
+            height=height,
+            estimated_tokens=baseline_tokens,
+            baseline_tokens=baseline_tokens,
+            encoded_bytes=len(data),
+        )
+
+    detail = detail or choose_detail(width, height)
+    w, h = target_size(width, height, detail, token_budget)
+    if (w, h) != (width, height):
+        rgb = cv2.resize(rgb, (w, h), interpolation=cv2.INTER_AREA)
+
+    media_type, data = encode_payload(rgb)
+    return ImagePayload(
+        data_url=f"data:{media_type};base64,{base64.b64encode(data).decode()}",
+        detail=detail,
+        media_type=media_type,
+        width=w,
+        height=h,
+        estimated_tokens=estimate_image_tokens(w, h, detail),
+        baseline_tokens=baseline_tokens,
+        encoded_bytes=len(data),
+    )
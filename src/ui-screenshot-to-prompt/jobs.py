@@ -0,0 +1,385 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from config import (
+    JOBS_DB_PATH,
+    JOB_WORKER_THREADS,
+    JOB_POLL_INTERVAL,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_STALE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETENTION_SECONDS,
+)
+from pipeline_options import PipelineOptions
+from sqlite_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+# Stages reported to clients as the pipeline makes progress
+PROGRESS_STAGES = ("decode", "detect", "main_design", "activity", "regions", "descriptions", "super_prompt")
+
+
+class JobStore:
+    """Persistent job table in SQLite, shared by every worker process on the host.
+
+    Jobs keep their input image until they finish, so a job whose worker is
+    recycled or killed can be claimed again by another one. Progress, results
+    and failures are only recorded while the reporting worker still owns the
+    job, so a run whose job was released or requeued cannot overwrite the
+    next attempt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connections = SQLiteConnections(path)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.connect()
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                image BLOB,
+                stages TEXT NOT NULL DEFAULT '[]',
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)")
+
+    def create(self, image_bytes: bytes, params: Dict[str, Any]) -> str:
+        """Queue a new job and return its id"""
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, params, image, created_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(params), sqlite3.Binary(image_bytes), time.time()),
+        )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the public view of a job, or None if it does not exist"""
+        row = self._connect().execute(
+            """SELECT id, status, stages, result, error, attempts, created_at, started_at, finished_at
+               FROM jobs WHERE id = ?""",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, status, stages, result, error, attempts, created_at, started_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "stages": json.loads(stages),
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, returning its id, params and image"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, params, image FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    """UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,
+                       started_at = ?, heartbeat_at = ?, stages = '[]' WHERE id = ?""",
+                    (worker, now, now, row[0]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"id": row[0], "params": json.loads(row[1]), "image": bytes(row[2])}
+
+    def add_stage(self, job_id: str, worker: str, stage: str):
+        """Record a completed pipeline stage, if worker still owns the job"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT stages FROM jobs WHERE id = ? AND status = 'running' AND worker = ?", (job_id, worker)
+            ).fetchone()
+            if row is not None:
+                stages = json.loads(row[0])
+                if stage not in stages:
+                    stages.append(stage)
+                conn.execute(
+                    "UPDATE jobs SET stages = ?, heartbeat_at = ? WHERE id = ?",
+                    (json.dumps(stages), time.time(), job_id),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, worker: str, job_ids: List[str]):
+        """Mark worker's running jobs as still alive"""
+        if not job_ids:
+            return
+        now = time.time()
+        self._connect().executemany(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+            [(now, job_id, worker) for job_id in job_ids],
+        )
+
+    def finish(self, job_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        """Store the result; the input image is no longer needed. Returns False if worker lost the job"""
+        return self._connect().execute(
+            """UPDATE jobs SET status = 'succeeded', result = ?, image = NULL, finished_at = ?
+               WHERE id = ? AND status = 'running' AND worker = ?""",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker),
+        ).rowcount > 0
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        """Mark the job failed. Returns False if worker lost the job"""
+        return self._connect().execute(
+            """UPDATE jobs SET status = 'failed', error = ?, image = NULL, finished_at = ?
+               WHERE id = ? AND status = 'running' AND worker = ?""",
+            (error, time.time(), job_id, worker),
+        ).rowcount > 0
+
+    def release(self, job_ids: List[str]):
+        """Put jobs back in the queue, e.g. when their worker is shutting down"""
+        if not job_ids:
+            return
+        self._connect().executemany(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ? AND status = 'running'",
+            [(job_id,) for job_id in job_ids],
+        )
+
+    def requeue_stale(self, stale_seconds: float, max_attempts: int) -> int:
+        """Requeue running jobs whose worker stopped sending heartbeats; fail those out of attempts"""
+        conn = self._connect()
+        cutoff = time.time() - stale_seconds
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', image = NULL,
+                   finished_at = ? WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?""",
+                (time.time(), cutoff, max_attempts),
+            )
+            requeued = conn.execute(
+                """UPDATE jobs SET status = 'queued', worker = NULL
+                   WHERE status = 'running' AND heartbeat_at < ?""",
+                (cutoff,),
+            ).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return requeued
+
+    def purge(self, retention_seconds: float) -> int:
+        """Delete finished jobs older than the retention period"""
+        return self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+            (time.time() - retention_seconds,),
+        ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+def job_params(options: Optional[PipelineOptions] = None) -> Dict[str, Any]:
+    """Pipeline options stored with a job"""
+    return (options or PipelineOptions()).to_dict()
+
+
+class JobRunner:
+    """Background threads that claim queued jobs and run the pipeline on them"""
+
+    def __init__(self, store: JobStore, threads: int):
+        self.store = store
+        self.threads = threads
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._work_loop, name=f"job-runner-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Job runner {self.worker_id} started with {self.threads} threads")
+
+    def stop(self):
+        """Stop claiming jobs and hand running ones back to the queue"""
+        self._stop.set()
+        with self._lock:
+            running = list(self._running)
+        self.store.release(running)
+        if running:
+            logger.info(f"Released {len(running)} running jobs back to the queue")
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.worker_id)
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                job = None
+            if job is None:
+                self._stop.wait(JOB_POLL_INTERVAL)
+                continue
+            with self._lock:
+                self._running[job["id"]] = time.time()
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running.pop(job["id"], None)
+
+    def _run(self, job: Dict[str, Any]):
+        # Imported here so the job table can be used without loading the pipeline
+        from pipeline import run_pipeline, NoDetectionsError
+        from usage import RequestUsage
+
+        job_id, params = job["id"], job["params"]
+        logger.info(f"Running job {job_id} (attempt by {self.worker_id})")
+        usage = RequestUsage()
+
+        def on_stage_complete(name: str, result: Any):
+            if name in PROGRESS_STAGES:
+                self.store.add_stage(job_id, self.worker_id, name)
+
+        try:
+            main_design_choices, analyses, final_analysis = run_pipeline(
+                job["image"],
+                options=PipelineOptions(**params),
+                usage=usage,
+                on_stage_complete=on_stage_complete,
+            )
+        except Exception as e:
+            if self._stop.is_set():
+                # Already handed back to the queue; the failure may just be the shutdown
+                return
+            if not isinstance(e, NoDetectionsError):
+                logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+            if not self.store.fail(job_id, self.worker_id, str(e)):
+                logger.warning(f"Job {job_id} was requeued while running; dropping its failure")
+            return
+
+        if self._stop.is_set():
+            # Already handed back to the queue; another worker will redo it
+            return
+        if not self.store.finish(job_id, self.worker_id, {
+            "main_design_choices": main_design_choices,
+            "analyses": analyses,
+            "final_analysis": final_analysis,
+            "usage": usage.summary(),
+        }):
+            logger.warning(f"Job {job_id} was requeued while running; dropping its result")
+            return
+        logger.info(f"Job {job_id} succeeded")
+
+    def _heartbeat_loop(self):
+        last_purge = 0.0
+        while not self._stop.wait(JOB_HEARTBEAT_SECONDS):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.store.heartbeat(self.worker_id, running)
+                requeued = self.store.requeue_stale(JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+                if requeued:
+                    logger.warning(f"Requeued {requeued} jobs from lost workers")
+                if time.time() - last_purge > 3600:
+                    self.store.purge(JOB_RETENTION_SECONDS)
+                    last_purge = time.time()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {str(e)}")
+
+
+_job_store: Optional[JobStore] = None
+_job_runner: Optional[JobRunner] = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Return the process-wide job store"""
+    global _job_store
+    if _job_store is None:
+        with _jobs_lock:
+            if _job_store is None:
+                _job_store = JobStore(JOBS_DB_PATH)
+    return _job_store
+
+
+def ensure_job_runner() -> Optional[JobRunner]:
+    """Start this process's job runner threads once (no-op when JOB_WORKER_THREADS is 0)"""
+    global _job_runner
+    if JOB_WORKER_THREADS <= 0:
+        return None
+    if _job_runner is None:
+        store = get_job_store()
+        with _jobs_lock:
+            if _job_runner is None:
+                _job_runner = JobRunner(store, JOB_WORKER_THREADS)
+                _job_runner.start()
+    return _job_runner
+
+
+def stop_job_runner():
+    """Stop this process's job runner, requeueing the jobs it was running"""
+    if _job_runner is not None:
+        _job_runner.stop()
+
+
+def _reset_after_fork():
+    # Runner threads do not survive fork
+    global _job_runner, _jobs_lock
+    _job_runner = None
+    _jobs_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+if __name__ == "__main__":
+    # Dedicated job worker process: python jobs.py --threads 4
+    parser = argparse.ArgumentParser(description="Run background pipeline jobs")
+    parser.add_argument("--threads", type=int, default=max(JOB_WORKER_THREADS, 1))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    runner = JobRunner(get_job_store(), args.threads)
+    runner.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        runner.stop()
@@ -0,0 +1,212 @@
+import glob
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Optional, Tuple, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+T = TypeVar("T")
+
+# Provider calls and super prompts can take a minute or more
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, float("inf"))
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Time per pipeline stage (decode, detect, ocr, encode, main_design, activity, regions, super_prompt, ...)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINE_SECONDS = Histogram(
+    "pipeline_seconds",
+    "End-to-end time per screenshot",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+PIPELINE_ERRORS = Counter("pipeline_errors_total", "Screenshots that failed", ["kind"])
+PIPELINES_IN_PROGRESS = Gauge(
+    "pipelines_in_progress", "Screenshots being processed", multiprocess_mode="livesum"
+)
+PROVIDER_CALL_SECONDS = Histogram(
+    "provider_call_seconds",
+    "Time per provider API call attempt",
+    ["provider", "model", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+PROVIDER_ERRORS = Counter("provider_errors_total", "Failed provider API calls", ["provider", "model", "kind"])
+PROVIDER_RETRIES = Counter("provider_retries_total", "Retried provider API calls", ["provider", "model", "reason"])
+PROVIDER_CALLS_IN_PROGRESS = Gauge(
+    "provider_calls_in_progress",
+    "Provider API calls awaiting a response",
+    ["provider", "model"],
+    multiprocess_mode="livesum",
+)
+
+PROVIDER_TOKENS = Counter(
+    "provider_tokens_total",
+    "Tokens billed by providers (kind: prompt, completion, or image, which is part of prompt)",
+    ["provider", "model", "stage", "kind"],
+)
+PROVIDER_COST = Counter("provider_cost_usd_total", "Estimated provider cost in USD", ["provider", "model", "stage"])
+
+HTTP_POOL_MAX_CONNECTIONS = Gauge(
+    "http_pool_max_connections",
+    "Connection pool size of the provider HTTP clients (client: httpx, httpx_async, botocore)",
+    ["client"],
+    multiprocess_mode="livesum",
+)
+HTTP_POOL_REQUESTS_IN_FLIGHT = Gauge(
+    "http_pool_requests_in_flight",
+    "Provider HTTP requests using or waiting for a pooled connection",
+    ["client"],
+    multiprocess_mode="livesum",
+)
+HTTP_POOL_CONNECTIONS = Gauge(
+    "http_pool_connections",
+    "Open provider HTTP connections (state: active, idle)",
+    ["client", "state"],
+    multiprocess_mode="livesum",
+)
+
+
+def split_deployment(deployment: str) -> Tuple[str, str]:
+    """'<provider>:<model>' -> (provider, model)"""
+    provider, _, model = deployment.partition(":")
+    return provider, model
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Record the duration of the enclosed block as a pipeline stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_graph_run(run: Any):
+    """Record the duration of every stage a GraphRun completed"""
+    for stage, seconds in run.stage_seconds.items():
+        observe_stage(stage, seconds)
+
+
+def pipeline_started() -> float:
+    PIPELINES_IN_PROGRESS.inc()
+    return time.perf_counter()
+
+
+def pipeline_finished(started: float, outcome: str):
+    """outcome: 'ok', 'cached', 'no_detections', 'error' or 'cancelled' (client went away)"""
+    PIPELINES_IN_PROGRESS.dec()
+    PIPELINE_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+    if outcome in ("no_detections", "error"):
+        PIPELINE_ERRORS.labels(outcome).inc()
+
+
+def record_retry(deployment: str, reason: str):
+    PROVIDER_RETRIES.labels(*split_deployment(deployment), reason).inc()
+
+
+def record_provider_usage(stage: str, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+                          image_tokens: int, cost: float):
+    PROVIDER_TOKENS.labels(provider, model, stage, "prompt").inc(prompt_tokens)
+    PROVIDER_TOKENS.labels(provider, model, stage, "completion").inc(completion_tokens)
+    if image_tokens:
+        PROVIDER_TOKENS.labels(provider, model, stage, "image").inc(image_tokens)
+    PROVIDER_COST.labels(provider, model, stage).inc(cost)
+
+
+def set_http_pool_capacity(client: str, max_connections: int):
+    HTTP_POOL_MAX_CONNECTIONS.labels(client).set(max_connections)
+
+
+def observe_http_pool(client: str, in_flight: int, active: Optional[int] = None, idle: Optional[int] = None):
+    HTTP_POOL_REQUESTS_IN_FLIGHT.labels(client).set(in_flight)
+    if active is not None:
+        HTTP_POOL_CONNECTIONS.labels(client, "active").set(active)
+        HTTP_POOL_CONNECTIONS.labels(client, "idle").set(idle)
+
+
+def observe_provider_call(deployment: str, call: Callable[[], T],
+                          classify_error: Callable[[Exception], str]) -> T:
+    """Time one provider call attempt and count its failure, if any"""
+    provider, model = split_deployment(deployment)
+    in_progress = PROVIDER_CALLS_IN_PROGRESS.labels(provider, model)
+    in_progress.inc()
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        return call()
+    except Exception as e:
+        outcome = classify_error(e)
+        PROVIDER_ERRORS.labels(provider, model, outcome).inc()
+        raise
+    finally:
+        in_progress.dec()
+        PROVIDER_CALL_SECONDS.labels(provider, model, outcome).observe(time.perf_counter() - start)
+
+
+async def observe_provider_call_async(deployment: str, call: Callable[[], Awaitable[T]],
+                                      classify_error: Callable[[Exception], str]) -> T:
+    """Async counterpart of observe_provider_call"""
+    provider, model = split_deployment(deployment)
+    in_progress = PROVIDER_CALLS_IN_PROGRESS.labels(provider, model)
+    in_progress.inc()
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        return await call()
+    except Exception as e:
+        outcome = classify_error(e)
+        PROVIDER_ERRORS.labels(provider, model, outcome).inc()
+        raise
+    finally:
+        in_progress.dec()
+        PROVIDER_CALL_SECONDS.labels(provider, model, outcome).observe(time.perf_counter() - start)
+
+
+def multiprocess_enabled() -> bool:
+    """Whether config.use_multiprocess_metrics was called, i.e. this is an API server process"""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Metrics of every worker process in the Prometheus text format"""
+    if not multiprocess_enabled():
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def reset_metrics_dir():
+    """Remove values left by a previous server run (call before starting workers)"""
+    if not multiprocess_enabled():
+        return
+    own_suffix = f"_{os.getpid()}.db"
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        # This process already has its files mapped (unlabelled gauges are created at import);
+        # a single-process uvicorn server would otherwise keep writing to deleted files
+        if not path.endswith(own_suffix):
+            os.remove(path)
+
+
+def mark_worker_dead(pid: int):
+    """Drop the live gauges of an exited worker process"""
+    if not multiprocess_enabled():
+        return
+    multiprocess.mark_process_dead(pid)
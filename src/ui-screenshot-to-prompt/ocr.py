@@ -0,0 +1,201 @@
+import os
+import queue
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from config import OCR_LANGUAGES, OCR_POOL_SIZE, OCR_BATCH_SIZE
+
+logger = getLogger(__name__)
+
+
+class OCRReaderPool:
+    """Fixed-size pool of easyocr.Reader instances shared by all requests in a process.
+
+    Readers are created lazily on first use (or eagerly via warm_up) and handed
+    out one caller at a time, since a Reader is not safe for concurrent use.
+    """
+
+    def __init__(self, size: int = OCR_POOL_SIZE, languages: Optional[List[str]] = None):
+        self.size = max(1, size)
+        self.languages = languages or OCR_LANGUAGES
+        self._readers: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_reader(self):
+        # easyocr pulls in torch; only pay for the import when OCR is actually used
+        import easyocr
+
+        logger.info(f"Loading EasyOCR reader for {self.languages}")
+        return easyocr.Reader(self.languages, download_enabled=True, verbose=False)
+
+    def _acquire(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._readers.get()
+
+        try:
+            return self._create_reader()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def reader(self) -> Iterator:
+        """Borrow a reader for the duration of the with block"""
+        reader = self._acquire()
+        try:
+            yield reader
+        finally:
+            self._readers.put(reader)
+
+    def warm_up(self, run_inference: bool = True):
+        """Create every reader in the pool, optionally running one tiny inference each.
+
+        Skip inference when warming up in a process that will fork afterwards
+        (e.g. the gunicorn master): torch thread pools do not survive fork.
+        """
+        readers = []
+        while len(readers) < self.size:
+            readers.append(self._acquire())
+        try:
+            if run_inference:
+                blank = np.full((32, 128, 3), 255, dtype=np.uint8)
+                for reader in readers:
+                    reader.readtext(blank)
+        finally:
+            for reader in readers:
+                self._readers.put(reader)
+        logger.info(f"OCR reader pool warmed up ({self.size} reader(s), inference={run_inference})")
+
+    def _reinit_after_fork(self):
+        """Rebuild synchronisation primitives in a forked child, keeping loaded readers"""
+        readers = []
+        while True:
+            try:
+                readers.append(self._readers.get_nowait())
+            except queue.Empty:
+                break
+        self._lock = threading.Lock()
+        self._readers = queue.Queue()
+        for reader in readers:
+            self._readers.put(reader)
+        self._created = len(readers)
+
+
+@dataclass
+class TextBox:
+    """A piece of recognised text and its axis-aligned bounding box"""
+    bbox: Tuple[int, int, int, int]
+    text: str
+    confidence: float
+
+
+def read_text_boxes(reader, image: np.ndarray, batch_size: int = OCR_BATCH_SIZE) -> List[TextBox]:
+    """Run text detection once over the whole image and recognise all boxes in batches"""
+    text_boxes = []
+    for points, text, confidence in reader.readtext(image, batch_size=batch_size):
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        x, y = int(min(xs)), int(min(ys))
+        w, h = int(max(xs)) - x, int(max(ys)) - y
+        if w > 0 and h > 0 and text.strip():
+            text_boxes.append(TextBox(bbox=(x, y, w, h), text=text, confidence=float(confidence)))
+    return text_boxes
+
+
+class SpatialIndex:
+    """Uniform grid index over bounding boxes for fast rectangle queries"""
+
+    def __init__(self, bboxes: Sequence[Tuple[int, int, int, int]], cell_size: int = 128):
+        self.bboxes = list(bboxes)
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for index, bbox in enumerate(self.bboxes):
+            for cell in self._cells_for(bbox):
+                self._cells[cell].append(index)
+
+    def _cells_for(self, bbox: Tuple[int, int, int, int]) -> Iterator[Tuple[int, int]]:
+        x, y, w, h = bbox
+        size = self.cell_size
+        for cx in range(x // size, (x + max(w, 1) - 1) // size + 1):
+            for cy in range(y // size, (y + max(h, 1) - 1) // size + 1):
+                yield cx, cy
+
+    def query(self, bbox: Tuple[int, int, int, int]) -> Set[int]:
+        """Return indices of indexed boxes that may intersect bbox"""
+        candidates = set()
+        for cell in self._cells_for(bbox):
+            candidates.update(self._cells.get(cell, ()))
+        return candidates
+
+
+def assign_text_to_components(
+    text_boxes: Sequence[TextBox],
+    component_bboxes: Sequence[Tuple[int, int, int, int]],
+    min_overlap: float = 0.5,
+) -> List[str]:
+    """Attach each text box to every component that contains most of it.
+
+    A text box belongs to a component when at least min_overlap of the text
+    box area lies inside the component. Text per component is returned in
+    reading order (top to bottom, then left to right).
+    """
+    index = SpatialIndex([box.bbox for box in text_boxes])
+    texts = []
+    for cx, cy, cw, ch in component_bboxes:
+        matched = []
+        for i in index.query((cx, cy, cw, ch)):
+            tx, ty, tw, th = text_boxes[i].bbox
+            inter_w = min(cx + cw, tx + tw) - max(cx, tx)
+            inter_h = min(cy + ch, ty + th) - max(cy, ty)
+            if inter_w > 0 and inter_h > 0 and inter_w * inter_h >= min_overlap * tw * th:
+                matched.append(text_boxes[i])
+        matched.sort(key=lambda box: (box.bbox[1], box.bbox[0]))
+        texts.append(" ".join(box.text for box in matched))
+    return texts
+
+
+_ocr_pool: Optional[OCRReaderPool] = None
+_ocr_pool_lock = threading.Lock()
+
+
+def get_ocr_pool() -> OCRReaderPool:
+    """Return the process-wide OCR reader pool"""
+    global _ocr_pool
+    if _ocr_pool is None:
+        with _ocr_pool_lock:
+            if _ocr_pool is None:
+                _ocr_pool = OCRReaderPool()
+    return _ocr_pool
+
+
+def warm_up_ocr(run_inference: bool = True):
+    """Load OCR models ahead of the first request"""
+    get_ocr_pool().warm_up(run_inference=run_inference)
+
+
+def _after_fork_in_child():
+    global _ocr_pool_lock
+    _ocr_pool_lock = threading.Lock()
+    if _ocr_pool is not None:
+        _ocr_pool._reinit_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,651 @@
+import hashlib
+import os
+import numpy as np
+from PIL import Image
+import queue
+import threading
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import logging
+
+
+# Configuration imports consolidated
+from config import (
+    build_super_prompt,
+    VISION_ANALYSIS_PROMPT,
+    MAIN_DESIGN_ANALYSIS_PROMPT,
+    load_and_initialize_clients,
+    BATCH_MAX_IN_FLIGHT,
+)
+
+from detect_components import create_detector  # Only import what we use
+from cache import get_result_cache, result_cache_key, memoize_call
+from rate_limit import rate_limited_call, estimate_request_tokens
+from stage_graph import StageGraph, GraphRun
+from executor import get_executor
+from decoded_image import DecodedImage, ImageData, ImageSource, read_image_source, image_cache_bytes
+from artifacts import ArtifactSink, create_artifact_sink
+from image_payload import build_image_payload, ImagePayload
+from usage import RequestUsage
+from metrics import observe_graph_run, pipeline_started, pipeline_finished, time_stage
+from pipeline_options import PipelineOptions
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,  # Set to INFO for general logs
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('image_processing.log'),
+        logging.StreamHandler()
+    ]
+)
+
+logger = logging.getLogger(__name__)
+
+# Disable debug logging for openai to reduce noise
+logging.getLogger("openai").setLevel(logging.WARNING)
+
+
+_clients = None
+_clients_lock = threading.Lock()
+
+def get_clients():
+    """Return (OpenAI client, super prompt function, streaming super prompt function), created on first use.
+
+    Clients hold connection pools that must not be shared across fork, so
+    each worker process creates its own after it starts.
+    """
+    global _clients
+    if _clients is None:
+        with _clients_lock:
+            if _clients is None:
+                _clients = load_and_initialize_clients()
+    return _clients
+
+def _reset_after_fork():
+    # A client created in the parent (e.g. by a preloaded app) is not reused by the child
+    global _clients, _clients_lock
+    _clients = None
+    _clients_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def preload_shared_state():
+    """Import the provider SDKs without creating clients, e.g. in the gunicorn master before fork.
+
+    Workers then share the imported modules copy-on-write and only create
+    their own clients (and connection pools) after they start.
+    """
+    import anthropic  # noqa: F401
+    import boto3  # noqa: F401
+    import openai  # noqa: F401
+    import http_transport  # noqa: F401
+    logger.info("Provider SDKs preloaded")
+
+# Images accepted by the vision helpers: a decoded screenshot, an RGB array/view, a PIL image
+# or an already encoded payload
+VisionImage = Union[DecodedImage, np.ndarray, Image.Image, ImagePayload]
+
+def build_vision_request(model: str, payload: ImagePayload, system_prompt: str, user_prompt: str,
+                         temperature: float, json_response: bool) -> dict:
+    """Chat completion arguments for a single-image vision call"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user", 
+            "content": [
+                {"type": "text", "text": user_prompt},
+                payload.to_content()
+            ]
+        }
+    ]
+    
+    return {
+        "model": model,
+        "messages": messages,
+        "max_tokens": 1024,
+        "temperature": temperature,
+        "response_format": {"type": "json_object"} if json_response else None
+    }
+
+def call_vision_api(model: str, image: VisionImage, system_prompt: str, user_prompt: str, 
+                   temperature: float = 0.1, json_response: bool = True,
+                   usage: Optional[RequestUsage] = None, stage: str = "vision") -> str:
+    """Unified function for calling OpenAI Vision API"""
+    try:
+        # Resized/re-encoded to the smallest payload that keeps what the model sees
+        payload = build_image_payload(image)
+        request_kwargs = build_vision_request(model, payload, system_prompt, user_prompt, temperature, json_response)
+        
+        def create_completion() -> str:
+            response = rate_limited_call(
+                f"openai:{model}",
+                estimate_request_tokens(request_kwargs, payload.estimated_tokens),
+                lambda: get_clients()[0].chat.completions.create(**request_kwargs),
+                lambda r: r.usage.total_tokens if r.usage else None,
+            )
+            if usage is not None:
+                usage.record_image(payload)
+                usage.record_call(stage, "openai", model, response.usage, payload.estimated_tokens)
+            return response.choices[0].message.content.strip()
+        
+        return memoize_call("openai", model, request_kwargs, create_completion)
+        
+    except Exception as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        raise
+
+def analyze_main_design_choices(image: VisionImage, temp: float = 0.1,
+                                usage: Optional[RequestUsage] = None) -> str:
+    """Analyze the main flow/purpose of the entire image, returns main_image_caption"""
+    logger.info("Analyzing main design choices")
+    
+    try:
+        return call_vision_api(
+            model="gpt-4o",
+            image=image, 
+            system_prompt=MAIN_DESIGN_ANALYSIS_PROMPT, 
+            user_prompt="Analyze this interface's complete design system and structure.", 
+            temperature=temp,
+            json_response=False,
+            usage=usage,
+            stage="main_design"
+        )
+    except Exception as e:
+        logger.error(f"Error analyzing main design: {str(e)}")
+        return "Error analyzing main design structure"
+
+def describe_activity(image: VisionImage, usage: Optional[RequestUsage] = None) -> str:
+    """Describe the activity shown in the image"""
+    logger.info("Describing activity in image")
+    logger.debug(f"Activity image: {getattr(image, 'filename', None) or 'image without filename'}")
+
+    return call_vision_api(
+        model="gpt-4o",
+        image=image,
+        system_prompt="Describe the activity of this webpage in a few sentences.",
+        user_prompt="What activity is shown in this image?",
+        temperature=0.1,
+        json_response=False,
+        usage=usage,
+        stage="activity"
+    )
+
+def build_detection_prompt(index: int, location: str, detection_term: str) -> str:
+    """User prompt for the analysis of a single detection"""
+    return f"""Analyze this UI {detection_term}:
+    - Located in: {location}
+    - {detection_term.title()} number: {index}
+    
+    Provide structured analysis following the JSON schema in the system prompt.
+    Focus on implementation-relevant details."""
+
+def analyze_detection(args, options: PipelineOptions, usage: Optional[RequestUsage] = None):
+    """Analyze individual detection (region/component) of the image"""
+    detection_image, index, location = args
+    logger.info(f"Analyzing {options.detection_term} {index} in {location}")
+    
+    prompt = build_detection_prompt(index, location, options.detection_term)
+    analysis = call_vision_api(model="gpt-4o-mini", image=detection_image, system_prompt=VISION_ANALYSIS_PROMPT,
+                               user_prompt=prompt, usage=usage, stage="regions")
+    return f"[Location: {location}]\n{analysis}"
+
+def save_detection_crop(artifacts: ArtifactSink, index: int, crop: np.ndarray, detection_term: str):
+    """Hand an RGB detection crop to the run's artifact sink"""
+    artifacts.save(f"{detection_term}_{index}", crop)
+
+def save_visualization(artifacts: ArtifactSink, detector, image: np.ndarray, detections):
+    """Draw the detections for the artifact sink; skipped when the sink discards everything"""
+    if artifacts.enabled:
+        artifacts.save("visualization", detector.draw_detections(image, detections))
+
+def link_descriptions(detections, analyses: List[str]) -> List[str]:
+    """Link analyses to detections"""
+    linked = []
+    for detection, analysis in zip(detections, analyses):
+        location_info = f"[{detection.text}] "
+        full_analysis = location_info + analysis
+        detection.text = full_analysis
+        linked.append(full_analysis)
+    return linked
+
+class NoDetectionsError(Exception):
+    """Raised when the detector finds nothing to analyze"""
+
+def run_detection(decoded: DecodedImage, options: PipelineOptions):
+    """Run the request's detector, returning (detector, detections)"""
+    detector = create_detector(options, decoded)
+    detections = detector.get_components()[:options.max_detections]  # Limit detections here too
+    if not detections:
+        raise NoDetectionsError(f"No {options.detection_term}s detected.")
+    return detector, detections
+
+def build_pipeline_graph(image_data: ImageData, image_path: Optional[str], artifacts: ArtifactSink, options: PipelineOptions,
+                         usage: RequestUsage, include_super_prompt: bool = True) -> StageGraph:
+    """Express the pipeline as stages: decode -> detect -> {main design, activity, regions} -> super prompt
+
+    Streaming callers leave out the super prompt stage and stream it themselves.
+    """
+    def decode():
+        # Single RGB buffer shared by detection, crops, encoding and visualization
+        return DecodedImage.from_data(image_data, filename=image_path)
+
+    def detect(decode):
+        return run_detection(decode, options)
+
+    def crops(decode, detect):
+        """Prepare detection analysis arguments"""
+        _, detections = detect
+        analysis_args = []
+        for i, detection in enumerate(detections):
+            # Zero-copy view into the decoded RGB buffer
+            detection_img = decode.crop(detection.bbox)
+            analysis_args.append((detection_img, i, detection.text))
+            save_detection_crop(artifacts, i, detection_img, options.detection_term)
+        return analysis_args
+
+    def descriptions(detect, regions):
+        _, detections = detect
+        return link_descriptions(detections, regions)
+
+    def super_prompt(main_design, activity, descriptions):
+        return call_super_prompt(main_design, descriptions, activity, options, usage=usage)
+
+    graph = StageGraph()
+    graph.add_stage("decode", decode)
+    graph.add_stage("detect", detect, deps=["decode"])
+    graph.add_stage("crops", crops, deps=["decode", "detect"])
+    graph.add_stage("main_design", lambda decode: analyze_main_design_choices(decode, usage=usage), deps=["decode"])
+    graph.add_stage("activity", lambda decode: describe_activity(decode, usage=usage), deps=["decode"])
+    graph.add_map_stage("regions", lambda item: analyze_detection(item, options, usage=usage), over="crops")
+    graph.add_stage("descriptions", descriptions, deps=["detect", "regions"])
+    if include_super_prompt:
+        graph.add_stage("super_prompt", super_prompt, deps=["main_design", "activity", "descriptions"])
+    return graph
+
+def pipeline_cache_key(image_data: ImageData, options: PipelineOptions) -> Optional[str]:
+    """Result cache key for the request's options, or None when the result cache is disabled"""
+    if get_result_cache() is None:
+        return None
+    return result_cache_key(
+        image_cache_bytes(image_data),
+        options.detection_method,
+        options.max_detections,
+        options.min_width,
+        options.min_height,
+        options.prompt_choice,
+    )
+
+def lookup_cached_result(cache_key: Optional[str]):
+    """Return a cached (main_design_choices, analyses, final_analysis) tuple, if any"""
+    result_cache = get_result_cache()
+    if result_cache is None or cache_key is None:
+        return None
+    try:
+        cached = result_cache.get(cache_key)
+    except Exception as e:
+        logger.warning(f"Result cache lookup failed: {str(e)}")
+        return None
+    if cached is None:
+        return None
+    logger.info(f"Result cache hit for {cache_key}")
+    return cached["main_design_choices"], cached["analyses"], cached["final_analysis"]
+
+def store_cached_result(cache_key: Optional[str], main_design_choices: str, analyses: List[str], final_analysis: str):
+    """Store a successful pipeline result in the result cache"""
+    result_cache = get_result_cache()
+    if result_cache is None or cache_key is None:
+        return
+    try:
+        result_cache.set(cache_key, {
+            "main_design_choices": main_design_choices,
+            "analyses": analyses,
+            "final_analysis": final_analysis,
+        })
+    except Exception as e:
+        logger.warning(f"Result cache store failed: {str(e)}")
+
+@dataclass
+class PipelineRun:
+    """A pipeline started on the shared executor, or a result served from the cache"""
+    cache_key: Optional[str]
+    usage: RequestUsage
+    cached: Optional[Tuple[str, List[str], str]] = None
+    artifacts: Optional[ArtifactSink] = None
+    run: Optional[GraphRun] = None
+    started: float = 0.0
+
+def start_pipeline(image_data: ImageData, image_path: Optional[str], options: PipelineOptions,
+                   usage: Optional[RequestUsage] = None, executor: Optional[Executor] = None,
+                   on_stage_complete: Optional[Callable[[str, Any], None]] = None,
+                   artifacts: Optional[ArtifactSink] = None) -> PipelineRun:
+    """Look up the result cache and, on a miss, start the stage graph without blocking"""
+    usage = usage if usage is not None else RequestUsage()
+    started = pipeline_started()
+    cache_key = pipeline_cache_key(image_data, options)
+    cached_result = lookup_cached_result(cache_key)
+    if cached_result is not None:
+        pipeline_finished(started, "cached")
+        return PipelineRun(cache_key=cache_key, usage=usage, cached=cached_result)
+
+    artifacts = artifacts if artifacts is not None else create_artifact_sink()
+    try:
+        graph = build_pipeline_graph(image_data, image_path, artifacts, options, usage)
+        # Full-image analyses and region analyses run concurrently on the shared
+        # executor, in this request's own round-robin lane unless one is given
+        run = graph.start(executor or get_executor().lane(), on_stage_complete=on_stage_complete)
+    except BaseException:
+        artifacts.close()
+        pipeline_finished(started, "error")
+        raise
+    return PipelineRun(cache_key=cache_key, usage=usage, artifacts=artifacts, run=run, started=started)
+
+def finish_pipeline(pipeline: PipelineRun) -> Tuple[str, List[str], str]:
+    """Wait for a started pipeline, write its visualization and cache its result"""
+    if pipeline.cached is not None:
+        return pipeline.cached
+
+    outcome = "error"
+    try:
+        results = pipeline.run.wait()
+
+        detector, detections = results["detect"]
+        main_design_choices = results["main_design"]
+        descriptions = results["descriptions"]
+        final_analysis = results["super_prompt"]
+
+        # Visualize all detections
+        save_visualization(pipeline.artifacts, detector, results["decode"].rgb, detections)
+        outcome = "ok"
+    except NoDetectionsError:
+        outcome = "no_detections"
+        raise
+    finally:
+        pipeline.artifacts.close()
+        observe_graph_run(pipeline.run)
+        pipeline_finished(pipeline.started, outcome)
+
+    image_usage = pipeline.usage.summary()
+    logger.info(
+        f"Sent {image_usage['images']} images, ~{image_usage['estimated_image_tokens']} image tokens "
+        f"(saved ~{image_usage['estimated_image_tokens_saved']} vs full-size PNG); "
+        f"{image_usage['prompt_tokens']} prompt + {image_usage['completion_tokens']} completion tokens, "
+        f"~${image_usage['cost_usd']:.4f}"
+    )
+    logger.info("Image processing completed successfully")
+    store_cached_result(pipeline.cache_key, main_design_choices, descriptions, final_analysis)
+    return main_design_choices, descriptions, final_analysis
+
+def run_pipeline(image_data: ImageData, image_path: Optional[str] = None, options: Optional[PipelineOptions] = None,
+                 usage: Optional[RequestUsage] = None,
+                 on_stage_complete: Optional[Callable[[str, Any], None]] = None,
+                 artifacts: Optional[ArtifactSink] = None) -> Tuple[str, List[str], str]:
+    """Analyze encoded image bytes or an RGB array, raising on failure (NoDetectionsError when nothing is found)"""
+    pipeline = start_pipeline(image_data, image_path, options or PipelineOptions(),
+                              usage=usage, on_stage_complete=on_stage_complete, artifacts=artifacts)
+    return finish_pipeline(pipeline)
+
+def run_pipeline_batch(images: List[bytes], options: Optional[PipelineOptions] = None) -> List[Tuple[Optional[Tuple[str, List[str], str]], Optional[Exception]]]:
+    """Analyze many images as one unit of work, returning (result, error) per image.
+
+    All stages of all images share a single lane of the shared executor, so a
+    batch gets the same fair share as one interactive request and its calls
+    are paced by the executor and rate limiter rather than by HTTP overhead.
+    At most BATCH_MAX_IN_FLIGHT images are decoded and in progress at once.
+    """
+    options = options or PipelineOptions()
+    lane = get_executor().lane()
+    completed: "queue.Queue[int]" = queue.Queue()
+    outcomes: List[Tuple[Optional[Tuple[str, List[str], str]], Optional[Exception]]] = [(None, None)] * len(images)
+    in_flight: Dict[int, PipelineRun] = {}
+    next_index = 0
+
+    while next_index < len(images) or in_flight:
+        while next_index < len(images) and len(in_flight) < BATCH_MAX_IN_FLIGHT:
+            index = next_index
+            next_index += 1
+            try:
+                pipeline = start_pipeline(images[index], None, options, executor=lane)
+            except Exception as e:
+                outcomes[index] = (None, e)
+                continue
+            if pipeline.cached is not None:
+                outcomes[index] = (pipeline.cached, None)
+                continue
+            in_flight[index] = pipeline
+            pipeline.run.add_done_callback(lambda _, index=index: completed.put(index))
+
+        if in_flight:
+            index = completed.get()
+            try:
+                outcomes[index] = (finish_pipeline(in_flight.pop(index)), None)
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {str(e)}")
+                outcomes[index] = (None, e)
+
+    return outcomes
+
+def run_batch_items(items: List[Dict[str, Any]], options: Optional[PipelineOptions] = None) -> Dict[str, Any]:
+    """Analyze the items of a batch request, each a dict with "source" and either "image" bytes or an "error".
+
+    Identical images are analyzed once; results come back per item, in order.
+    """
+    unique_index: Dict[str, int] = {}
+    unique_images: List[bytes] = []
+    for item in items:
+        if "image" in item:
+            image = item.pop("image")
+            item["sha256"] = hashlib.sha256(image).hexdigest()
+            if item["sha256"] not in unique_index:
+                unique_index[item["sha256"]] = len(unique_images)
+                unique_images.append(image)
+
+    outcomes = run_pipeline_batch(unique_images, options)
+
+    results = []
+    for i, item in enumerate(items):
+        entry = {"index": i, "source": item["source"], "sha256": item.get("sha256")}
+        if "error" in item:
+            entry.update(status="error", error=item["error"])
+        else:
+            result, error = outcomes[unique_index[item["sha256"]]]
+            if error is not None:
+                entry.update(status="error", error=str(error))
+            else:
+                main_design_choices, analyses, final_analysis = result
+                entry.update(
+                    status="ok",
+                    main_design_choices=main_design_choices,
+                    analyses=analyses,
+                    final_analysis=final_analysis,
+                )
+        results.append(entry)
+    return {"results": results, "unique_images": len(unique_images)}
+
+def process_image(image: ImageSource, options: Optional[PipelineOptions] = None, usage: Optional[RequestUsage] = None,
+                  artifacts: Optional[ArtifactSink] = None):
+    """Main function to process and analyze an image path, bytes, file-like object or RGB array"""
+    try:
+        # Read exactly once, in memory; decoding happens inside the graph
+        image_data, image_path = read_image_source(image)
+    except (OSError, TypeError) as e:
+        logger.error(f"Error reading image: {str(e)}")
+        return "Error processing image", [], "Error in final analysis"
+
+    try:
+        return run_pipeline(image_data, image_path, options, usage, artifacts=artifacts)
+
+    except NoDetectionsError as e:
+        logger.error(f"{str(e)} Exiting processing.")
+        return str(e), [], "Error in final analysis"
+        
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        return "Error processing image", [], "Error in final analysis"
+
+def process_image_events(image: ImageSource, image_path: Optional[str] = None,
+                         options: Optional[PipelineOptions] = None,
+                         usage: Optional[RequestUsage] = None,
+                         artifacts: Optional[ArtifactSink] = None) -> Iterator[Dict[str, Any]]:
+    """Run the pipeline, yielding event dicts in completion order.
+
+    Events: "detections" once regions are found, "main_design", "activity"
+    and one "region" per region analysis as each finishes, "analyses" with
+    all linked descriptions, one "final_chunk" per streamed super prompt
+    chunk, then "done" with the full result, or a single "error" event.
+    A result cache hit replays "main_design", "analyses", the whole super
+    prompt as one "final_chunk" and "done"; the cache does not keep
+    detections or the activity analysis, so those events are absent.
+    "done" carries "cached" to tell the two apart.
+    """
+    options = options or PipelineOptions()
+    usage = usage if usage is not None else RequestUsage()
+    started = pipeline_started()
+    outcome = "error"
+    try:
+        image_data, source_name = read_image_source(image)
+        image_path = image_path or source_name
+        cache_key = pipeline_cache_key(image_data, options)
+        cached_result = lookup_cached_result(cache_key)
+        if cached_result is not None:
+            outcome = "cached"
+            main_design_choices, descriptions, final_analysis = cached_result
+            yield {"type": "main_design", "text": main_design_choices}
+            yield {"type": "analyses", "main_design_choices": main_design_choices, "analyses": descriptions}
+            yield {"type": "final_chunk", "text": final_analysis}
+            yield {"type": "done", "main_design_choices": main_design_choices, "analyses": descriptions,
+                   "final_analysis": final_analysis, "usage": usage.summary(), "cached": True}
+            return
+
+        events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        locations: Dict[int, str] = {}
+
+        def on_stage_complete(name: str, result: Any):
+            if name == "detect":
+                _, detections = result
+                locations.update((i, d.text) for i, d in enumerate(detections))
+                events.put({
+                    "type": "detections",
+                    "count": len(detections),
+                    "detections": [
+                        {"index": i, "location": d.text, "bbox": [int(v) for v in d.bbox]}
+                        for i, d in enumerate(detections)
+                    ],
+                })
+            elif name in ("main_design", "activity"):
+                events.put({"type": name, "text": result})
+
+        def on_item_complete(name: str, index: int, result: Any):
+            if name == "regions":
+                events.put({"type": "region", "index": index, "location": locations.get(index), "analysis": result})
+
+        artifacts = artifacts if artifacts is not None else create_artifact_sink()
+        run = None
+        try:
+            graph = build_pipeline_graph(image_data, image_path, artifacts, options, usage,
+                                         include_super_prompt=False)
+            run = graph.start(get_executor().lane(), on_stage_complete, on_item_complete)
+            while not (run.done() and events.empty()):
+                try:
+                    yield events.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            results = run.wait()
+            detector, detections = results["detect"]
+            save_visualization(artifacts, detector, results["decode"].rgb, detections)
+        finally:
+            artifacts.close()
+            if run is not None:
+                # The consumer stopped early (e.g. the client disconnected): drop queued provider calls
+                if not run.done():
+                    run.cancel()
+                observe_graph_run(run)
+
+        main_design_choices = results["main_design"]
+        descriptions = results["descriptions"]
+        yield {"type": "analyses", "main_design_choices": main_design_choices, "analyses": descriptions}
+
+        chunks = []
+        with time_stage("super_prompt"):
+            for text in call_super_prompt_stream(main_design_choices, descriptions, results["activity"], options,
+                                                 usage=usage):
+                chunks.append(text)
+                yield {"type": "final_chunk", "text": text}
+        final_analysis = "".join(chunks)
+
+        logger.info("Image processing completed successfully")
+        store_cached_result(cache_key, main_design_choices, descriptions, final_analysis)
+        outcome = "ok"
+        yield {"type": "done", "main_design_choices": main_design_choices, "analyses": descriptions,
+               "final_analysis": final_analysis, "usage": usage.summary(), "cached": False}
+
+    except NoDetectionsError as e:
+        outcome = "no_detections"
+        logger.error(f"{str(e)} Exiting processing.")
+        yield {"type": "error", "error": str(e)}
+
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        yield {"type": "error", "error": "Error processing image"}
+
+    finally:
+        pipeline_finished(started, outcome)
+
+
+def prepare_super_prompt(main_image_caption: str, component_captions: List[str], activity_description: str,
+                         options: PipelineOptions) -> str:
+    """Build the final super prompt text integrating all analyses"""
+    # First build the base super prompt
+    super_prompt = build_super_prompt(
+        main_image_caption,
+        component_captions,
+        activity_description,
+        options
+    )
+    
+    # Clean up the prompt by removing first/last lines and extra whitespace
+    cleaned_prompt = "\n".join(
+        line for line in super_prompt.split("\n")[1:-1] 
+        if line.strip()
+    ).strip()
+    
+    # Add the "Build this app:" prefix
+    final_prompt = f"Build this app: {cleaned_prompt}"
+    
+    logger.info("Generated super prompt: %s", final_prompt)
+    return final_prompt
+
+def call_super_prompt_stream(main_image_caption: str, component_captions: List[str], activity_description: str,
+                            options: PipelineOptions, usage: Optional[RequestUsage] = None) -> Iterator[str]:
+    """Build the super prompt and stream the generated text in chunks"""
+    final_prompt = prepare_super_prompt(main_image_caption, component_captions, activity_description, options)
+    _, super_prompt_function, super_prompt_stream_function = get_clients()
+    if super_prompt_stream_function:
+        yield from super_prompt_stream_function(final_prompt, usage=usage)
+    elif super_prompt_function:
+        yield super_prompt_function(final_prompt, usage=usage)
+    else:
+        raise ValueError("No API client available for super prompt generation")
+
+def call_super_prompt(main_image_caption: str, component_captions: List[str], activity_description: str,
+                      options: PipelineOptions, usage: Optional[RequestUsage] = None) -> str:
+    """Build and send the super prompt integrating all analyses"""
+    try:
+        final_prompt = prepare_super_prompt(main_image_caption, component_captions, activity_description, options)
+        _, super_prompt_function, _ = get_clients()
+        
+        if not super_prompt_function:
+            raise ValueError("No API client available for super prompt generation")
+            
+        return super_prompt_function(final_prompt, usage=usage)
+        
+    except Exception as e:
+        logger.error("Error in super prompt generation: %s", str(e))
+        raise
+
@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from config import (
+    DEFAULT_DETECTION_METHOD,
+    DEFAULT_PROMPT_CHOICE,
+    MAX_UI_COMPONENTS,
+    MIN_COMPONENT_WIDTH_ADVANCED,
+    MIN_COMPONENT_HEIGHT_ADVANCED,
+)
+
+DETECTION_METHODS = ("basic", "advanced")
+PROMPT_CHOICES = ("concise", "extensive")
+
+
+@dataclass(frozen=True)
+class PipelineOptions:
+    """Settings of one pipeline run.
+
+    Passed explicitly to every stage instead of being read from module
+    globals, so concurrent requests in one process cannot see each other's
+    settings.
+    """
+    detection_method: str = DEFAULT_DETECTION_METHOD
+    prompt_choice: str = DEFAULT_PROMPT_CHOICE
+    max_detections: int = MAX_UI_COMPONENTS
+    min_width: int = MIN_COMPONENT_WIDTH_ADVANCED
+    min_height: int = MIN_COMPONENT_HEIGHT_ADVANCED
+
+    def __post_init__(self):
+        # Normalised here so UI labels ("Advanced", "Concise") can be passed as is
+        object.__setattr__(self, "detection_method", self.detection_method.lower())
+        object.__setattr__(self, "prompt_choice", self.prompt_choice.lower())
+        if self.detection_method not in DETECTION_METHODS:
+            raise ValueError("Invalid detection method. Must be 'basic' or 'advanced'")
+        if self.prompt_choice not in PROMPT_CHOICES:
+            raise ValueError("Invalid prompt choice. Must be 'concise' or 'extensive'")
+        for name in ("max_detections", "min_width", "min_height"):
+            object.__setattr__(self, name, int(getattr(self, name)))
+
+    @property
+    def detection_term(self) -> str:
+        """What detections are called in prompts and logs: 'region' (basic) or 'component' (advanced)"""
+        return "region" if self.detection_method == "basic" else "component"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serialisable form, e.g. for job parameters (PipelineOptions(**d) restores it)"""
+        return {
+            "detection_method": self.detection_method,
+            "prompt_choice": self.prompt_choice,
+            "max_detections": self.max_detections,
+            "min_width": self.min_width,
+            "min_height": self.min_height,
+        }
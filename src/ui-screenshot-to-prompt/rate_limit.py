@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from config import (
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_PATH,
+    RATE_LIMITS,
+    RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BASE_BACKOFF,
+    RATE_LIMIT_MAX_BACKOFF,
+)
+from metrics import observe_provider_call, observe_provider_call_async, record_retry
+from sqlite_store import SQLiteConnections
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Provider error codes that mean "slow down" rather than "this request is bad"
+THROTTLING_ERROR_CODES = ("ThrottlingException", "TooManyRequestsException")
+_connection_errors: Optional[Tuple[type, ...]] = None
+
+
+def connection_errors() -> Tuple[type, ...]:
+    """Exception types for network failures; the SDKs are imported on first use, not with this module"""
+    global _connection_errors
+    if _connection_errors is None:
+        import anthropic
+        import openai
+        _connection_errors = (openai.APIConnectionError, anthropic.APIConnectionError, ConnectionError, TimeoutError)
+    return _connection_errors
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call is still rate limited after all retries"""
+
+
+class RateLimiter:
+    """Token buckets for requests/minute and tokens/minute per deployment.
+
+    Bucket levels live in a SQLite file so every gunicorn worker on the host
+    draws from the same quota. A 429 from the provider blocks the deployment
+    for all workers until its Retry-After has passed.
+    """
+
+    def __init__(self, path: str, limits: Dict[str, Dict[str, float]]):
+        self.path = path
+        self.limits = limits
+        self._connections = SQLiteConnections(path)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        return self._connections.connect()
+
+    def _init_schema(self):
+        self._connect().execute(
+            """CREATE TABLE IF NOT EXISTS buckets (
+                deployment TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                blocked_until REAL NOT NULL DEFAULT 0,
+                throttled INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+
+    def limits_for(self, deployment: str) -> Tuple[float, float]:
+        """(requests per minute, tokens per minute) for a deployment"""
+        limits = self.limits.get(deployment, self.limits["default"])
+        return float(limits["rpm"]), float(limits["tpm"])
+
+    def _refill(self, conn: sqlite3.Connection, deployment: str, now: float) -> Tuple[float, float, float]:
+        """Bring the deployment's buckets up to date and return (requests, tokens, blocked_until)"""
+        rpm, tpm = self.limits_for(deployment)
+        row = conn.execute(
+            "SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE deployment = ?",
+            (deployment,),
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO buckets (deployment, requests, tokens, updated_at) VALUES (?, ?, ?, ?)",
+                (deployment, rpm, tpm, now),
+            )
+            return rpm, tpm, 0.0
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(0.0, now - updated_at)
+        requests = min(rpm, requests + elapsed * rpm / 60.0)
+        tokens = min(tpm, tokens + elapsed * tpm / 60.0)
+        return requests, tokens, blocked_until
+
+    def try_acquire(self, deployment: str, tokens: float) -> float:
+        """Take one request and `tokens` tokens; return 0 on success or seconds to wait"""
+        rpm, tpm = self.limits_for(deployment)
+        # A single call larger than the whole minute's quota can still run once the bucket is full
+        tokens = min(tokens, tpm)
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests, available, blocked_until = self._refill(conn, deployment, now)
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif requests >= 1 and available >= tokens:
+                requests -= 1
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = max(
+                    (1 - requests) * 60.0 / rpm if requests < 1 else 0.0,
+                    (tokens - available) * 60.0 / tpm if available < tokens else 0.0,
+                )
+            conn.execute(
+                "UPDATE buckets SET requests = ?, tokens = ?, updated_at = ? WHERE deployment = ?",
+                (requests, available, now, deployment),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def refund(self, deployment: str, tokens: float):
+        """Return tokens to the bucket (negative values take more) once actual usage is known"""
+        if not tokens:
+            return
+        _, tpm = self.limits_for(deployment)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests, available, _ = self._refill(conn, deployment, time.time())
+            conn.execute(
+                "UPDATE buckets SET requests = ?, tokens = ?, updated_at = ? WHERE deployment = ?",
+                (requests, min(tpm, available + tokens), time.time(), deployment),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def block(self, deployment: str, seconds: float):
+        """Stop every worker from calling the deployment for `seconds` after a 429"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests, available, _ = self._refill(conn, deployment, now)
+            # The provider says the quota is exhausted: drain our view of it as well
+            conn.execute(
+                """UPDATE buckets SET requests = ?, tokens = ?, updated_at = ?,
+                   blocked_until = MAX(blocked_until, ?), throttled = throttled + 1
+                   WHERE deployment = ?""",
+                (min(requests, 0.0), min(available, 0.0), now, now + seconds, deployment),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def levels(self) -> Dict[str, Dict[str, Any]]:
+        """Current bucket levels for every deployment seen so far"""
+        conn = self._connect()
+        now = time.time()
+        levels = {}
+        for deployment, requests, tokens, updated_at, blocked_until, throttled in conn.execute(
+            "SELECT deployment, requests, tokens, updated_at, blocked_until, throttled FROM buckets"
+        ).fetchall():
+            rpm, tpm = self.limits_for(deployment)
+            elapsed = max(0.0, now - updated_at)
+            levels[deployment] = {
+                "requests_available": round(min(rpm, requests + elapsed * rpm / 60.0), 2),
+                "requests_per_minute": rpm,
+                "tokens_available": round(min(tpm, tokens + elapsed * tpm / 60.0)),
+                "tokens_per_minute": tpm,
+                "blocked_for_seconds": round(max(0.0, blocked_until - now), 2),
+                "throttled_responses": throttled,
+            }
+        return levels
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Return the process-wide rate limiter, or None when rate limiting is disabled"""
+    global _rate_limiter
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter(RATE_LIMIT_PATH, RATE_LIMITS)
+    return _rate_limiter
+
+
+def get_bucket_levels() -> Dict[str, Any]:
+    """Bucket levels for the rate limit endpoint"""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, "deployments": limiter.levels()}
+
+
+def estimate_request_tokens(request_kwargs: Dict[str, Any], image_tokens: int = 0) -> int:
+    """Rough token cost of a chat request as providers count it against TPM quotas.
+
+    Text is counted at ~4 characters per token; max_tokens is included because
+    Azure reserves the completion allowance up front.
+    """
+    chars = 0
+    for message in request_kwargs.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get("text", "")) for part in content if part.get("type") == "text")
+    return chars // 4 + image_tokens + int(request_kwargs.get("max_tokens") or 0)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After hint of a throttling error, 0 if it has none, None if it is not throttling"""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", status)
+        if code in THROTTLING_ERROR_CODES:
+            status = 429
+    if status != 429:
+        return None
+
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Server-side or connection failures worth retrying with backoff"""
+    if isinstance(error, connection_errors()):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+def classify_error(error: Exception) -> str:
+    """Metrics label for a failed provider call"""
+    if retry_after_seconds(error) is not None:
+        return "rate_limited"
+    return "transient" if is_transient_error(error) else "error"
+
+
+def backoff_delay(attempt: int, retry_after: float) -> float:
+    """Delay before retry `attempt`: Retry-After plus jitter, or full-jitter exponential backoff"""
+    if retry_after > 0:
+        # Spread the retries of all workers over a short window after the reset
+        return min(RATE_LIMIT_MAX_BACKOFF, retry_after) + random.uniform(0, min(1.0, retry_after * 0.2))
+    return random.uniform(0, min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BASE_BACKOFF * 2 ** attempt))
+
+
+def rate_limited_call(deployment: str, estimated_tokens: int, call: Callable[[], T],
+                      actual_tokens: Optional[Callable[[T], Optional[int]]] = None) -> T:
+    """Run a provider call within the shared rate limit.
+
+    429s block the deployment for every worker and are retried after the
+    Retry-After delay; 5xx and connection errors are retried with backoff.
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return observe_provider_call(deployment, call, classify_error)
+
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        while True:
+            wait = limiter.try_acquire(deployment, estimated_tokens)
+            if wait <= 0:
+                break
+            time.sleep(wait + random.uniform(0, 0.05))
+
+        try:
+            result = observe_provider_call(deployment, call, classify_error)
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is None and not is_transient_error(e):
+                raise
+            if attempt == RATE_LIMIT_MAX_RETRIES:
+                if retry_after is not None:
+                    raise RateLimitExceeded(f"{deployment} still rate limited after {attempt + 1} attempts") from e
+                raise
+            delay = backoff_delay(attempt, retry_after or 0.0)
+            record_retry(deployment, "rate_limited" if retry_after is not None else "transient")
+            if retry_after is not None:
+                limiter.block(deployment, delay)
+                logger.warning(f"Rate limited by {deployment}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            else:
+                logger.warning(f"{deployment} call failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+            continue
+
+        if actual_tokens is not None:
+            used = actual_tokens(result)
+            if used is not None:
+                limiter.refund(deployment, estimated_tokens - used)
+        return result
+
+
+async def rate_limited_call_async(deployment: str, estimated_tokens: int, call: Callable[[], Awaitable[T]],
+                                  actual_tokens: Optional[Callable[[T], Optional[int]]] = None) -> T:
+    """Async counterpart of rate_limited_call; waits without blocking the event loop"""
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return await observe_provider_call_async(deployment, call, classify_error)
+
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        while True:
+            wait = await asyncio.to_thread(limiter.try_acquire, deployment, estimated_tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+        try:
+            result = await observe_provider_call_async(deployment, call, classify_error)
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            if retry_after is None and not is_transient_error(e):
+                raise
+            if attempt == RATE_LIMIT_MAX_RETRIES:
+                if retry_after is not None:
+                    raise RateLimitExceeded(f"{deployment} still rate limited after {attempt + 1} attempts") from e
+                raise
+            delay = backoff_delay(attempt, retry_after or 0.0)
+            record_retry(deployment, "rate_limited" if retry_after is not None else "transient")
+            if retry_after is not None:
+                await asyncio.to_thread(limiter.block, deployment, delay)
+                logger.warning(f"Rate limited by {deployment}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            else:
+                logger.warning(f"{deployment} call failed ({e}), retrying in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            continue
+
+        if actual_tokens is not None:
+            used = actual_tokens(result)
+            if used is not None:
+                await asyncio.to_thread(limiter.refund, deployment, estimated_tokens - used)
+        return result
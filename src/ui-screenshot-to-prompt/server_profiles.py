@@ -0,0 +1,118 @@
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from config import (
+    RATE_LIMITS,
+    MAX_UI_COMPONENTS,
+    BEDROCK_SUPER_PROMPT_MODEL,
+    ANTHROPIC_SUPER_PROMPT_MODEL,
+    OPENROUTER_SUPER_PROMPT_MODEL,
+    SERVER_EXPECTED_REQUEST_SECONDS,
+    SERVER_MAX_CONCURRENCY,
+)
+
+PROFILES = ("sync", "gthread", "gevent", "uvicorn")
+
+# Rough tokens charged against TPM per call (prompt + image + max_tokens, as in
+# estimate_request_tokens): full-screenshot vision call, region call, super prompt
+SCREENSHOT_CALL_TOKENS = 2800
+REGION_CALL_TOKENS = 1800
+SUPER_PROMPT_PROMPT_TOKENS = 3000
+
+# Most sync worker processes started by default: each holds its own torch/EasyOCR
+# copy, so the quota-derived concurrency would run the host out of memory
+SYNC_MAX_WORKERS = 6
+# Processes for the threaded/async profiles: enough to keep serving while one is
+# restarted after max_requests, without a copy of the OCR models per request in flight
+DEFAULT_CONCURRENT_WORKERS = 2
+# Connections a uvicorn worker accepts on top of its share of the quota, for health checks and /metrics
+UVICORN_EXTRA_CONNECTIONS = 16
+
+
+def super_prompt_deployment() -> Tuple[str, int]:
+    """Rate-limit deployment and max_tokens of the super prompt provider load_and_initialize_clients picks"""
+    if os.getenv("AWS_ACCESS_KEY_ID") and os.getenv("AWS_SECRET_ACCESS_KEY"):
+        return f"bedrock:{BEDROCK_SUPER_PROMPT_MODEL}", 8096
+    if os.getenv("ANTHROPIC_API_KEY"):
+        return f"anthropic:{ANTHROPIC_SUPER_PROMPT_MODEL}", 4096
+    return f"openrouter:{OPENROUTER_SUPER_PROMPT_MODEL}", 4096
+
+
+def calls_per_request(max_detections: int = MAX_UI_COMPONENTS) -> Dict[str, Tuple[int, int]]:
+    """(calls, tokens) one screenshot costs each deployment"""
+    super_prompt, super_prompt_max_tokens = super_prompt_deployment()
+    calls = {
+        "openai:gpt-4o": (2, 2 * SCREENSHOT_CALL_TOKENS),
+        "openai:gpt-4o-mini": (max_detections, max_detections * REGION_CALL_TOKENS),
+    }
+    calls[super_prompt] = (1, SUPER_PROMPT_PROMPT_TOKENS + super_prompt_max_tokens)
+    return calls
+
+
+def quota_requests_per_second(max_detections: int = MAX_UI_COMPONENTS) -> float:
+    """Screenshots per second the tightest deployment's RPM/TPM quota sustains"""
+    rate = math.inf
+    for deployment, (calls, tokens) in calls_per_request(max_detections).items():
+        limits = RATE_LIMITS.get(deployment, RATE_LIMITS["default"])
+        rate = min(rate, limits["rpm"] / 60.0 / calls, limits["tpm"] / 60.0 / tokens)
+    return rate
+
+
+def quota_concurrency(max_detections: int = MAX_UI_COMPONENTS) -> int:
+    """Requests in flight needed to use the whole quota (Little's law: rate x latency)"""
+    in_flight = math.ceil(quota_requests_per_second(max_detections) * SERVER_EXPECTED_REQUEST_SECONDS)
+    return max(1, min(SERVER_MAX_CONCURRENCY, in_flight))
+
+
+@dataclass(frozen=True)
+class WorkerProfile:
+    """How the API server runs: worker type, processes and requests in flight per process"""
+    name: str
+    workers: int
+    threads: int
+
+    @property
+    def concurrency(self) -> int:
+        return self.workers * self.threads
+
+    def gunicorn_options(self) -> Dict[str, Any]:
+        """Worker settings for StandaloneApplication (not used by the uvicorn profile)"""
+        if self.name == "gthread":
+            return {"worker_class": "gthread", "workers": self.workers, "threads": self.threads}
+        if self.name == "gevent":
+            return {"worker_class": "gevent", "workers": self.workers, "worker_connections": self.threads}
+        return {"worker_class": "sync", "workers": self.workers}
+
+    def uvicorn_options(self) -> Dict[str, Any]:
+        """Worker settings for uvicorn.run; connections beyond the limit get a 503 instead of queueing"""
+        return {"workers": self.workers, "limit_concurrency": self.threads + UVICORN_EXTRA_CONNECTIONS}
+
+    def describe(self) -> str:
+        unit = {"gthread": "threads", "gevent": "connections", "uvicorn": "requests"}.get(self.name)
+        if unit is None:
+            return f"{self.name}: {self.workers} workers"
+        return f"{self.name}: {self.workers} workers x {self.threads} {unit}"
+
+
+def resolve_profile(name: str, workers: Optional[int] = None, threads: Optional[int] = None,
+                    cpu_count: Optional[int] = None) -> WorkerProfile:
+    """Worker profile with processes and threads derived from the provider quota unless given.
+
+    sync workers handle one request each and hold a full copy of the models, so
+    they stay capped by CPU count and memory as before; the other profiles wait
+    on providers with threads, greenlets or coroutines in a couple of processes
+    and are sized from the quota.
+    """
+    name = name.lower()
+    if name not in PROFILES:
+        raise ValueError(f"Invalid server profile '{name}'. Must be one of: {', '.join(PROFILES)}")
+    concurrency = quota_concurrency()
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if name == "sync":
+        return WorkerProfile(name, workers or min(cpu_count + 2, SYNC_MAX_WORKERS, concurrency), 1)
+
+    workers = workers or min(cpu_count, DEFAULT_CONCURRENT_WORKERS, concurrency)
+    threads = threads or math.ceil(concurrency / workers)
+    return WorkerProfile(name, workers, threads)
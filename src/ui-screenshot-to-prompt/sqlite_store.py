@@ -0,0 +1,37 @@
+import os
+import sqlite3
+import threading
+
+# How long a writer waits for another process's transaction before giving up
+SQLITE_BUSY_TIMEOUT_SECONDS = 30
+
+
+class SQLiteConnections:
+    """Connections to one SQLite file, one per thread and process.
+
+    Used by the stores that share a file between every gunicorn worker on the
+    host (result/call cache, rate limiter buckets, job table). The file is put
+    in WAL mode so readers never wait for writers, and autocommit is on so each
+    store opens its own BEGIN IMMEDIATE transactions where it needs them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def connect(self) -> sqlite3.Connection:
+        """Return the connection owned by the current thread and process"""
+        conn = getattr(self._local, "conn", None)
+        # Connections must never cross a fork, so key them on the pid as well
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_SECONDS * 1000}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Executor, Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """A unit of work in a StageGraph.
+
+    func is called with the results of its dependencies as keyword arguments.
+    Map stages call func once per item of the `over` dependency (passed as
+    `item`, together with the remaining dependencies) and complete with the
+    list of per-item results in input order.
+    """
+    name: str
+    func: Callable[..., Any]
+    deps: List[str] = field(default_factory=list)
+    over: Optional[str] = None
+
+
+class StageGraph:
+    """Small dependency graph that starts each stage as soon as its inputs are ready.
+
+    Stages are scheduled from completion callbacks, so no worker thread ever
+    blocks waiting on another stage and the graph can safely share a bounded
+    executor with other work.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add_stage(self, name: str, func: Callable[..., Any], deps: Sequence[str] = ()) -> "StageGraph":
+        """Add a stage that runs once all deps have completed"""
+        self._add(Stage(name=name, func=func, deps=list(deps)))
+        return self
+
+    def add_map_stage(self, name: str, func: Callable[..., Any], over: str,
+                      deps: Sequence[str] = ()) -> "StageGraph":
+        """Add a stage that fans out func over each item produced by `over`"""
+        self._add(Stage(name=name, func=func, deps=[over, *deps], over=over))
+        return self
+
+    def _add(self, stage: Stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage: {stage.name}")
+        for dep in stage.deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+        self.stages[stage.name] = stage
+
+    def run(self, executor: Executor,
+            on_stage_complete: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        """Run all stages on executor and return their results keyed by stage name.
+
+        on_stage_complete(name, result) is called as each stage finishes. The
+        first stage failure stops scheduling of further stages and is
+        re-raised here once in-flight work has settled.
+        """
+        return self.start(executor, on_stage_complete).wait()
+
+    def start(self, executor: Executor,
+              on_stage_complete: Optional[Callable[[str, Any], None]] = None,
+              on_item_complete: Optional[Callable[[str, int, Any], None]] = None) -> "GraphRun":
+        """Start running the graph without blocking; call wait() on the result for the stage results.
+
+        on_item_complete(name, index, result) is called as each item of a map
+        stage finishes, in completion order.
+        """
+        return GraphRun(self, executor, on_stage_complete, on_item_complete)
+
+
+class GraphRun:
+    """Execution state of a single StageGraph run"""
+
+    def __init__(self, graph: StageGraph, executor: Executor,
+                 on_stage_complete: Optional[Callable[[str, Any], None]] = None,
+                 on_item_complete: Optional[Callable[[str, int, Any], None]] = None):
+        self.graph = graph
+        self.executor = executor
+        self.on_stage_complete = on_stage_complete
+        self.on_item_complete = on_item_complete
+        self.results: Dict[str, Any] = {}
+        # Wall time from a stage being started (inputs ready) to its completion
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_started: Dict[str, float] = {}
+        self.error: Optional[BaseException] = None
+        self.in_flight = 0
+        # Submitted tasks that have not finished yet, so cancel() can drop the queued ones
+        self.futures: Set[Future] = set()
+        self.started = set()
+        # Re-entrant: futures that are already done run their callbacks inline
+        self.lock = threading.RLock()
+        self.finished = threading.Event()
+        self.done_callbacks: List[Callable[["GraphRun"], None]] = []
+
+        with self.lock:
+            self._schedule_ready()
+            self._check_finished()
+
+    def done(self) -> bool:
+        return self.finished.is_set()
+
+    def add_done_callback(self, fn: Callable[["GraphRun"], None]):
+        """Call fn(run) once the run has finished (immediately if it already has)"""
+        with self.lock:
+            if not self.finished.is_set():
+                self.done_callbacks.append(fn)
+                return
+        fn(self)
+
+    def cancel(self):
+        """Stop scheduling stages and cancel queued tasks; tasks already running finish on their own"""
+        with self.lock:
+            if self.error is None:
+                self.error = CancelledError("Stage graph run cancelled")
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+
+    def wait(self) -> Dict[str, Any]:
+        self.finished.wait()
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+    def _schedule_ready(self):
+        """Start every stage whose dependencies are satisfied (lock held)"""
+        if self.error is not None:
+            return
+        for stage in self.graph.stages.values():
+            if stage.name in self.started:
+                continue
+            if all(dep in self.results for dep in stage.deps):
+                self.started.add(stage.name)
+                self._start(stage)
+
+    def _start(self, stage: Stage):
+        self.stage_started[stage.name] = time.perf_counter()
+        inputs = {dep: self.results[dep] for dep in stage.deps}
+        if stage.over is None:
+            self._submit(lambda: stage.func(**inputs), lambda result: self._complete(stage.name, result))
+            return
+
+        items = list(inputs.pop(stage.over))
+        if not items:
+            self._complete(stage.name, [])
+            return
+        item_results: List[Any] = [None] * len(items)
+        remaining = [len(items)]
+
+        def make_callback(index: int):
+            def on_item_done(result: Any):
+                item_results[index] = result
+                remaining[0] -= 1
+                self._notify(self.on_item_complete, stage.name, index, result)
+                if remaining[0] == 0:
+                    self._complete(stage.name, item_results)
+
+            return on_item_done
+
+        for index, item in enumerate(items):
+            self._submit(lambda item=item: stage.func(item=item, **inputs), make_callback(index))
+
+    def _submit(self, fn: Callable[[], Any], on_success: Callable[[Any], None]):
+        self.in_flight += 1
+        future = self.executor.submit(fn)
+        self.futures.add(future)
+
+        def on_done(f):
+            with self.lock:
+                self.futures.discard(f)
+                try:
+                    on_success(f.result())
+                except BaseException as e:
+                    if self.error is None:
+                        self.error = e
+                self.in_flight -= 1
+                self._check_finished()
+
+        future.add_done_callback(on_done)
+
+    def _complete(self, name: str, result: Any):
+        """Record a stage result and schedule its dependents (lock held)"""
+        self.results[name] = result
+        self.stage_seconds[name] = time.perf_counter() - self.stage_started[name]
+        self._schedule_ready()
+        self._notify(self.on_stage_complete, name, result)
+
+    def _notify(self, callback: Optional[Callable[..., None]], name: str, *args: Any):
+        if callback is None:
+            return
+        try:
+            callback(name, *args)
+        except Exception as e:
+            # Progress reporting must never fail the pipeline
+            logger.warning(f"Progress callback failed for {name}: {str(e)}")
+
+    def _check_finished(self):
+        if self.finished.is_set():
+            return
+        if self.in_flight == 0 and (self.error is not None or len(self.results) == len(self.graph.stages)):
+            self.finished.set()
+            for fn in self.done_callbacks:
+                fn(self)
@@ -0,0 +1,108 @@
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from config import MODEL_PRICING
+from image_payload import ImagePayload
+from metrics import record_provider_usage
+
+
+def model_pricing(model: str) -> Optional[Dict[str, float]]:
+    """Price per million tokens for model (longest matching prefix), None if unknown"""
+    matches = [name for name in MODEL_PRICING if model.startswith(name)]
+    return MODEL_PRICING[max(matches, key=len)] if matches else None
+
+
+def call_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """USD cost of a call, 0 for models without a price"""
+    pricing = model_pricing(model)
+    if pricing is None:
+        return 0.0
+    return (prompt_tokens * pricing["input"] + completion_tokens * pricing["output"]) / 1_000_000
+
+
+def token_counts(reported: Any) -> Tuple[int, int]:
+    """(prompt, completion) tokens from an OpenAI, Anthropic or Bedrock usage object or dict"""
+    if reported is None:
+        return 0, 0
+    if isinstance(reported, dict):
+        get = reported.get
+    else:
+        def get(key):
+            return getattr(reported, key, None)
+    prompt = get("prompt_tokens") or get("input_tokens") or 0
+    completion = get("completion_tokens") or get("output_tokens") or 0
+    return int(prompt), int(completion)
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "image_tokens": 0, "cost_usd": 0.0}
+
+
+class RequestUsage:
+    """Thread-safe accumulator of what a single pipeline request sent to providers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.image_tokens = 0
+        self.baseline_image_tokens = 0
+        self.image_bytes = 0
+        # (stage, model) -> call totals; served-from-cache calls cost nothing and are not counted
+        self.calls: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def record_image(self, payload: ImagePayload):
+        """Record an image payload that was actually sent"""
+        with self._lock:
+            self.images += 1
+            self.image_tokens += payload.estimated_tokens
+            self.baseline_image_tokens += payload.baseline_tokens
+            self.image_bytes += payload.encoded_bytes
+
+    def record_call(self, stage: str, provider: str, model: str, reported: Any, image_tokens: int = 0):
+        """Record the token usage a provider reported for one call"""
+        prompt_tokens, completion_tokens = token_counts(reported)
+        cost = call_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            totals = self.calls.setdefault((stage, model), _empty_totals())
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["image_tokens"] += image_tokens
+            totals["cost_usd"] += cost
+        record_provider_usage(stage, provider, model, prompt_tokens, completion_tokens, image_tokens, cost)
+
+    @property
+    def image_tokens_saved(self) -> int:
+        return self.baseline_image_tokens - self.image_tokens
+
+    @property
+    def cost_usd(self) -> float:
+        with self._lock:
+            return sum(totals["cost_usd"] for totals in self.calls.values())
+
+    def summary(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable summary"""
+        with self._lock:
+            by_stage: Dict[str, Dict[str, Any]] = {}
+            by_model: Dict[str, Dict[str, Any]] = {}
+            overall = _empty_totals()
+            for (stage, model), totals in self.calls.items():
+                for group in (by_stage.setdefault(stage, _empty_totals()),
+                              by_model.setdefault(model, _empty_totals()), overall):
+                    for key, value in totals.items():
+                        group[key] += value
+            for group in (*by_stage.values(), *by_model.values(), overall):
+                group["cost_usd"] = round(group["cost_usd"], 6)
+            return {
+                "images": self.images,
+                "estimated_image_tokens": self.image_tokens,
+                "baseline_image_tokens": self.baseline_image_tokens,
+                "estimated_image_tokens_saved": self.baseline_image_tokens - self.image_tokens,
+                "image_bytes": self.image_bytes,
+                "calls": overall["calls"],
+                "prompt_tokens": overall["prompt_tokens"],
+                "completion_tokens": overall["completion_tokens"],
+                "cost_usd": overall["cost_usd"],
+                "by_stage": by_stage,
+                "by_model": by_model,
+            }
@@ -0,0 +1,115 @@
+import asyncio
+
+import cache
+from cache import DiskCache, MemoryCache
+
+
+def test_disk_cache_round_trip_and_ttl(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(cache, "time", clock)
+    disk = DiskCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, max_bytes=10_000)
+
+    disk.set("a", {"text": "hello"})
+    disk.set("short", [1, 2], ttl_seconds=5)
+    assert disk.get("a") == {"text": "hello"}
+    assert disk.get("short") == [1, 2]
+
+    clock.advance(10)
+    assert disk.get("short") is None
+    assert disk.get("a") == {"text": "hello"}
+
+    clock.advance(60)
+    assert disk.get("a") is None
+    assert disk.get("missing") is None
+
+
+def test_disk_cache_counters_are_buffered_until_flush(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(cache, "time", clock)
+    path = str(tmp_path / "cache.sqlite")
+    disk = DiskCache(path, ttl_seconds=60, max_bytes=10_000)
+    disk.set("a", 1)
+    disk.get("a")
+    disk.get("a")
+    disk.get("b")
+
+    # Another process sharing the file only sees lookups once they are flushed
+    other = DiskCache(path, ttl_seconds=60, max_bytes=10_000)
+    assert other.stats()["hits"] == 0
+
+    clock.advance(cache.DISK_CACHE_FLUSH_SECONDS)
+    disk.get("a")
+    stats = other.stats()
+    assert (stats["hits"], stats["misses"]) == (3, 1)
+    assert stats["hit_rate"] == 0.75
+    assert stats["entries"] == 1
+
+
+def test_disk_cache_evicts_least_recently_read(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(cache, "time", clock)
+    disk = DiskCache(str(tmp_path / "cache.sqlite"), ttl_seconds=600, max_bytes=30)
+    value = "x" * 8  # 10 bytes as JSON
+    for key in ("a", "b", "c"):
+        disk.set(key, value)
+        clock.advance(1)
+
+    # The read of "a" is still buffered; set() must apply it before evicting
+    assert disk.get("a") == value
+    clock.advance(1)
+    disk.set("d", value)
+
+    assert disk.get("b") is None
+    assert [disk.get(key) for key in ("a", "c", "d")] == [value] * 3
+    assert disk.stats()["bytes"] == 30
+
+
+def test_disk_cache_skips_oversized_entries(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, max_bytes=10)
+    disk.set("big", "x" * 100)
+    assert disk.get("big") is None
+    assert disk.stats()["entries"] == 0
+
+
+def test_disk_cache_clear_resets_entries_and_counters(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, max_bytes=10_000)
+    disk.set("a", 1)
+    disk.get("a")
+    disk.clear()
+    stats = disk.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (0, 0, 0)
+
+
+def test_memory_cache_lru_by_count_and_bytes(clock, monkeypatch):
+    monkeypatch.setattr(cache, "time", clock)
+    memory = MemoryCache(ttl_seconds=60, max_bytes=25, max_entries=2)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    assert memory.get("a") == 1
+    memory.set("c", 3)
+    assert memory.get("b") is None
+    assert (memory.get("a"), memory.get("c")) == (1, 3)
+
+    # 25 bytes as JSON: only room for itself
+    memory.set("big", "x" * 23)
+    assert memory.get("a") is None and memory.get("c") is None
+    stats = memory.stats()
+    assert (stats["entries"], stats["bytes"]) == (1, 25)
+
+    clock.advance(61)
+    assert memory.get("big") is None
+    assert memory.stats()["entries"] == 0
+
+
+def test_memoize_call_async_serves_repeat_calls_from_cache(monkeypatch):
+    memory = MemoryCache(ttl_seconds=60, max_bytes=10_000, max_entries=10)
+    monkeypatch.setattr(cache, "get_call_cache", lambda: memory)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return "described"
+
+    payload = {"model": "gpt-4o", "image": "data:image/png;base64,AAAA"}
+    first = asyncio.run(cache.memoize_call_async("openai", "gpt-4o", payload, compute))
+    second = asyncio.run(cache.memoize_call_async("openai", "gpt-4o", dict(payload), compute))
+    assert (first, second) == ("described", "described")
+    assert len(calls) == 1
+    assert memory.stats()["hits"] == 1
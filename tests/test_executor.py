@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from executor import FairExecutor
+from stage_graph import StageGraph
+
+
+@pytest.fixture
+def executor():
+    executor = FairExecutor(max_workers=1, name="test")
+    yield executor
+    executor.shutdown()
+
+
+def test_lanes_are_served_round_robin(executor):
+    running, release = threading.Event(), threading.Event()
+    order = []
+
+    def block():
+        running.set()
+        release.wait(5)
+
+    blocker = executor.submit_to("blocker", block)
+    assert running.wait(5)
+    a, b = executor.lane("a"), executor.lane("b")
+    futures = [a.submit(order.append, "a1"), a.submit(order.append, "a2"), a.submit(order.append, "a3"),
+               b.submit(order.append, "b1")]
+    stats = executor.stats()
+    assert (stats["active"], stats["queue_depth"], stats["requests_queued"]) == (1, 4, 2)
+
+    release.set()
+    blocker.result(5)
+    for future in futures:
+        future.result(5)
+    assert order == ["a1", "b1", "a2", "a3"]
+    assert executor.stats()["completed"] == 5
+
+
+def test_never_runs_more_than_max_workers():
+    executor = FairExecutor(max_workers=2, name="test")
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        threading.Event().wait(0.01)
+        with lock:
+            active[0] -= 1
+
+    try:
+        futures = [executor.lane(i % 3).submit(work) for i in range(12)]
+        for future in futures:
+            future.result(5)
+    finally:
+        executor.shutdown()
+    assert peak[0] <= 2
+    assert executor.stats()["threads"] <= 2
+
+
+def test_task_errors_reach_the_future(executor):
+    future = executor.lane().submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        future.result(5)
+
+
+def test_stage_graph_runs_on_a_single_worker_lane(executor):
+    # Stages are chained from completion callbacks, so one worker cannot deadlock the graph
+    graph = (
+        StageGraph()
+        .add_stage("items", lambda: [1, 2, 3])
+        .add_map_stage("square", lambda item: item * item, over="items")
+        .add_stage("total", lambda square: sum(square), deps=["square"])
+    )
+    assert graph.run(executor.lane())["total"] == 14
+
+
+def test_submit_after_shutdown_is_rejected():
+    executor = FairExecutor(max_workers=1, name="test")
+    executor.shutdown()
+    with pytest.raises(RuntimeError):
+        executor.lane().submit(print)
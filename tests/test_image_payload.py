@@ -0,0 +1,88 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import image_payload
+from image_payload import (
+    choose_detail,
+    count_tiles,
+    effective_size,
+    encode_payload,
+    estimate_image_tokens,
+    fit_to_tile_budget,
+    target_size,
+)
+
+
+@pytest.mark.parametrize("size, expected", [
+    ((4096, 2048), (1536, 768)),
+    ((2048, 4096), (768, 1536)),
+    ((1024, 1024), (768, 768)),
+    ((300, 200), (300, 200)),
+])
+def test_effective_size_fits_2048_then_768(size, expected):
+    assert effective_size(*size) == expected
+
+
+def test_tiles_are_512px():
+    assert count_tiles(512, 512) == 1
+    assert count_tiles(513, 512) == 2
+    assert count_tiles(1536, 768) == 6
+
+
+@pytest.mark.parametrize("size, detail, tokens", [
+    ((1024, 1024), "high", 85 + 170 * 4),
+    ((4096, 2048), "high", 85 + 170 * 6),
+    ((300, 200), "high", 85 + 170),
+    ((4096, 2048), "low", 85),
+])
+def test_estimate_image_tokens(size, detail, tokens):
+    assert estimate_image_tokens(*size, detail) == tokens
+
+
+def test_auto_detail_is_low_only_when_512px_holds_every_pixel(monkeypatch):
+    monkeypatch.setattr(image_payload, "IMAGE_DETAIL", "auto")
+    assert choose_detail(512, 512) == "low"
+    assert choose_detail(513, 100) == "high"
+    assert choose_detail(100, 513) == "high"
+    monkeypatch.setattr(image_payload, "IMAGE_DETAIL", "high")
+    assert choose_detail(100, 100) == "high"
+
+
+def test_low_detail_target_is_512px():
+    assert target_size(1024, 512, "low", 0) == (512, 256)
+    assert target_size(300, 200, "low", 0) == (300, 200)
+
+
+def test_token_budget_downscales_to_fewer_tiles():
+    # Two tiles' worth of tokens
+    w, h = target_size(4096, 2048, "high", 85 + 170 * 2)
+    assert (w, h) == (1024, 512)
+    assert estimate_image_tokens(w, h) <= 85 + 170 * 2
+    assert target_size(4096, 2048, "high", 0) == (1536, 768)
+
+
+@pytest.mark.parametrize("width, height, max_tiles", [(1536, 768, 2), (1536, 768, 5), (768, 1536, 3), (2000, 700, 1)])
+def test_fit_to_tile_budget_respects_budget_and_aspect(width, height, max_tiles):
+    w, h = fit_to_tile_budget(width, height, max_tiles)
+    assert count_tiles(w, h) <= max_tiles
+    assert w <= width and h <= height
+    assert abs(w / h - width / height) < 0.02
+
+
+def test_fit_to_tile_budget_keeps_images_already_within_budget():
+    assert fit_to_tile_budget(1000, 500, 2) == (1000, 500)
+
+
+def test_palette_png_round_trip_is_lossless():
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, size=(200, 3), dtype=np.uint8)
+    rgb = colors[rng.integers(0, len(colors), size=(120, 90))]
+
+    media_type, data = encode_payload(rgb)
+    decoded = Image.open(BytesIO(data))
+    assert media_type == "image/png"
+    assert decoded.mode == "P"
+    np.testing.assert_array_equal(np.asarray(decoded.convert("RGB")), rgb)
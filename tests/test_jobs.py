@@ -0,0 +1,125 @@
+import pytest
+
+import jobs
+import pipeline
+from jobs import JobRunner, JobStore
+
+
+@pytest.fixture
+def store(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(jobs, "time", clock)
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_claim_takes_oldest_queued_job(store, clock):
+    first = store.create(b"one", {"mode": "basic"})
+    clock.advance(1)
+    store.create(b"two", {})
+
+    job = store.claim("w1")
+    assert job == {"id": first, "params": {"mode": "basic"}, "image": b"one"}
+    assert store.get(first)["status"] == "running"
+    assert store.get(first)["attempts"] == 1
+    assert store.claim("w2")["image"] == b"two"
+    assert store.claim("w3") is None
+
+
+def test_finish_and_stages_by_owner(store):
+    job_id = store.create(b"img", {})
+    store.claim("w1")
+    store.add_stage(job_id, "w1", "detect")
+    store.add_stage(job_id, "w1", "detect")
+    assert store.finish(job_id, "w1", {"final_analysis": "done"})
+
+    job = store.get(job_id)
+    assert (job["status"], job["stages"], job["result"]) == ("succeeded", ["detect"], {"final_analysis": "done"})
+    # A finished job is never reported on again
+    assert not store.fail(job_id, "w1", "late error")
+    assert store.get(job_id)["status"] == "succeeded"
+
+
+def test_released_job_ignores_its_old_worker(store):
+    job_id = store.create(b"img", {})
+    store.claim("w1")
+    store.release([job_id])
+
+    assert not store.fail(job_id, "w1", "interrupted by shutdown")
+    assert not store.finish(job_id, "w1", {})
+    store.add_stage(job_id, "w1", "detect")
+    job = store.get(job_id)
+    assert (job["status"], job["stages"], job["error"]) == ("queued", [], None)
+    # The input image survived, so the next worker can redo the job
+    assert store.claim("w2")["image"] == b"img"
+
+
+def test_requeued_job_claimed_elsewhere_ignores_its_old_worker(store, clock):
+    job_id = store.create(b"img", {})
+    store.claim("w1")
+    clock.advance(120)
+    assert store.requeue_stale(stale_seconds=60, max_attempts=3) == 1
+    store.claim("w2")
+
+    # The original worker comes back and tries to report
+    store.heartbeat("w1", [job_id])
+    store.add_stage(job_id, "w1", "detect")
+    assert not store.finish(job_id, "w1", {"final_analysis": "stale"})
+    assert not store.fail(job_id, "w1", "stale")
+
+    store.add_stage(job_id, "w2", "regions")
+    assert store.finish(job_id, "w2", {"final_analysis": "fresh"})
+    job = store.get(job_id)
+    assert (job["stages"], job["result"], job["attempts"]) == (["regions"], {"final_analysis": "fresh"}, 2)
+
+
+def test_requeue_stale_fails_jobs_out_of_attempts(store, clock):
+    job_id = store.create(b"img", {})
+    for worker in ("w1", "w2"):
+        store.claim(worker)
+        clock.advance(120)
+        store.requeue_stale(stale_seconds=60, max_attempts=2)
+    job = store.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "Worker lost too many times")
+    assert store.claim("w3") is None
+
+
+def test_heartbeat_keeps_owned_job_running(store, clock):
+    job_id = store.create(b"img", {})
+    store.claim("w1")
+    clock.advance(50)
+    store.heartbeat("w1", [job_id])
+    clock.advance(50)
+    assert store.requeue_stale(stale_seconds=60, max_attempts=3) == 0
+    assert store.get(job_id)["status"] == "running"
+
+
+def test_failure_during_shutdown_keeps_released_job_queued(store, monkeypatch):
+    runner = JobRunner(store, threads=1)
+    job_id = store.create(b"img", {})
+    job = store.claim(runner.worker_id)
+    runner._running[job_id] = 0.0
+
+    def run_pipeline(*args, **kwargs):
+        # stop() hands the job back, then the in-flight run fails as the process shuts down
+        runner.stop()
+        raise RuntimeError("connection closed")
+
+    monkeypatch.setattr(pipeline, "run_pipeline", run_pipeline)
+    runner._run(job)
+
+    assert store.get(job_id)["status"] == "queued"
+    assert store.claim("other")["image"] == b"img"
+
+
+def test_runner_records_failure_of_owned_job(store, monkeypatch):
+    runner = JobRunner(store, threads=1)
+    job_id = store.create(b"img", {})
+    job = store.claim(runner.worker_id)
+
+    def run_pipeline(*args, **kwargs):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(pipeline, "run_pipeline", run_pipeline)
+    runner._run(job)
+
+    job = store.get(job_id)
+    assert (job["status"], job["error"]) == ("failed", "provider down")
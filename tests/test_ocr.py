@@ -0,0 +1,43 @@
+from ocr import SpatialIndex, TextBox, assign_text_to_components
+
+
+def text(bbox, value):
+    return TextBox(bbox=bbox, text=value, confidence=0.9)
+
+
+def test_index_finds_box_straddling_cell_boundary():
+    # Spans the 128px cells on both axes
+    index = SpatialIndex([(120, 120, 20, 20), (400, 400, 10, 10)], cell_size=128)
+    assert index.query((0, 0, 125, 125)) == {0}
+    assert index.query((130, 130, 10, 10)) == {0}
+    assert index.query((300, 0, 10, 10)) == set()
+
+
+def test_straddling_text_is_assigned_to_component_past_the_boundary():
+    boxes = [text((120, 10, 20, 10), "Submit")]
+    assert assign_text_to_components(boxes, [(128, 0, 100, 50)]) == ["Submit"]
+
+
+def test_text_mostly_outside_a_component_is_not_assigned():
+    boxes = [text((0, 0, 100, 10), "Header title")]
+    # 40% of the text box is inside the first component, 60% inside the second
+    assert assign_text_to_components(boxes, [(60, 0, 100, 50), (0, 0, 60, 50)]) == ["", "Header title"]
+
+
+def test_exactly_half_inside_counts_as_contained():
+    boxes = [text((0, 0, 100, 10), "Half")]
+    assert assign_text_to_components(boxes, [(50, 0, 100, 50)]) == ["Half"]
+
+
+def test_nested_components_share_text_in_reading_order():
+    boxes = [
+        text((20, 60, 40, 10), "second"),
+        text((80, 20, 40, 10), "right"),
+        text((20, 20, 40, 10), "first"),
+    ]
+    card, button = (0, 0, 200, 100), (10, 50, 60, 30)
+    assert assign_text_to_components(boxes, [card, button]) == ["first right second", "second"]
+
+
+def test_no_text_boxes():
+    assert assign_text_to_components([], [(0, 0, 10, 10)]) == [""]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from detect_components import CANDIDATE_DTYPE, suppress_overlaps
+
+
+def random_candidates(count: int, seed: int, width: int = 1920, height: int = 1080) -> np.ndarray:
+    """Random boxes like dense UI contours, with rounded areas so ties are common"""
+    rng = np.random.default_rng(seed)
+    candidates = np.empty(count, dtype=CANDIDATE_DTYPE)
+    w = np.clip(rng.lognormal(4.0, 0.8, count), 20, width // 2).astype(np.int32)
+    h = np.clip(rng.lognormal(3.5, 0.7, count), 20, height // 2).astype(np.int32)
+    candidates["x"] = rng.integers(0, width - w)
+    candidates["y"] = rng.integers(0, height - h)
+    candidates["w"] = w
+    candidates["h"] = h
+    candidates["area"] = np.round(w * h * rng.uniform(0.3, 1.0, count), -1)
+    candidates["aspect"] = w / h.astype(np.float64)
+    return candidates
+
+
+def legacy_suppress(candidates: np.ndarray, max_keep: int):
+    """The original greedy loop from AdvancedDetector.get_components"""
+    components = sorted(
+        ({"bbox": (int(c["x"]), int(c["y"]), int(c["w"]), int(c["h"])), "area": float(c["area"])}
+         for c in candidates),
+        key=lambda comp: comp["area"],
+        reverse=True,
+    )
+    kept = []
+    for comp in components:
+        x1, y1, w1, h1 = comp["bbox"]
+        overlapping = False
+        for x2, y2, w2, h2 in kept:
+            x_left, y_top = max(x1, x2), max(y1, y2)
+            x_right, y_bottom = min(x1 + w1, x2 + w2), min(y1 + h1, y2 + h2)
+            if x_right > x_left and y_bottom > y_top:
+                if (x_right - x_left) * (y_bottom - y_top) / min(w1 * h1, w2 * h2) > 0.5:
+                    overlapping = True
+                    break
+        if not overlapping:
+            kept.append(comp["bbox"])
+        if len(kept) >= max_keep:
+            break
+    return kept
+
+
+def bboxes(kept: np.ndarray):
+    return [(int(c["x"]), int(c["y"]), int(c["w"]), int(c["h"])) for c in kept]
+
+
+@pytest.mark.parametrize("count", [1, 50, 700])
+@pytest.mark.parametrize("max_keep", [6, 10_000])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_matches_legacy_loop(count, max_keep, seed):
+    candidates = random_candidates(count, seed)
+    assert bboxes(suppress_overlaps(candidates, max_keep)) == legacy_suppress(candidates, max_keep)
+
+
+def test_small_blocks_match_legacy_loop():
+    # Many blocks exercise the kept-vs-block pass as well as the in-block greedy pass
+    candidates = random_candidates(300, seed=2)
+    assert bboxes(suppress_overlaps(candidates, 10_000, block_size=7)) == legacy_suppress(candidates, 10_000)
+
+
+def test_nested_box_is_suppressed_and_disjoint_box_kept():
+    candidates = np.zeros(3, dtype=CANDIDATE_DTYPE)
+    for i, (x, y, w, h) in enumerate([(0, 0, 100, 100), (10, 10, 20, 20), (200, 200, 50, 50)]):
+        candidates[i] = (x, y, w, h, w * h, w / h)
+    assert bboxes(suppress_overlaps(candidates, 10)) == [(0, 0, 100, 100), (200, 200, 50, 50)]
+
+
+def test_empty_input_and_zero_keep():
+    assert len(suppress_overlaps(np.zeros(0, dtype=CANDIDATE_DTYPE), 5)) == 0
+    assert len(suppress_overlaps(random_candidates(10, seed=0), 0)) == 0
@@ -0,0 +1,18 @@
+import pipeline
+
+
+def test_cache_hit_replays_main_design_analyses_and_prompt(monkeypatch):
+    monkeypatch.setattr(pipeline, "pipeline_cache_key", lambda image_data, options: "result:test")
+    monkeypatch.setattr(pipeline, "lookup_cached_result",
+                        lambda key: ("Dark theme", ["[top] Nav bar", "[body] Card grid"], "Build a dashboard"))
+
+    events = list(pipeline.process_image_events(b"png bytes"))
+
+    assert [event["type"] for event in events] == ["main_design", "analyses", "final_chunk", "done"]
+    assert events[0]["text"] == "Dark theme"
+    assert events[1]["analyses"] == ["[top] Nav bar", "[body] Card grid"]
+    assert events[2]["text"] == "Build a dashboard"
+    done = events[-1]
+    assert done["cached"] is True
+    assert (done["main_design_choices"], done["final_analysis"]) == ("Dark theme", "Build a dashboard")
+    assert "usage" in done
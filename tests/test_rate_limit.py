@@ -0,0 +1,90 @@
+import pytest
+
+import rate_limit
+from rate_limit import RateLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return RateLimiter(str(tmp_path / "limits.sqlite"), {"default": {"rpm": 60, "tpm": 600}})
+
+
+def level(limiter, deployment="gpt"):
+    return limiter.levels()[deployment]
+
+
+def test_buckets_start_full_and_drain(limiter):
+    assert limiter.try_acquire("gpt", 100) == 0
+    assert level(limiter)["requests_available"] == 59
+    assert level(limiter)["tokens_available"] == 500
+
+
+def test_wait_covers_the_token_shortfall(limiter, clock):
+    assert limiter.try_acquire("gpt", 500) == 0
+    # 100 tokens left, 200 more needed at 10 tokens/second
+    assert limiter.try_acquire("gpt", 300) == pytest.approx(20.0)
+    clock.advance(20)
+    assert limiter.try_acquire("gpt", 300) == 0
+    assert level(limiter)["tokens_available"] == 0
+
+
+def test_wait_covers_the_request_shortfall(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "time", clock)
+    limiter = RateLimiter(str(tmp_path / "limits.sqlite"), {"default": {"rpm": 2, "tpm": 10_000}})
+    assert limiter.try_acquire("gpt", 1) == 0
+    assert limiter.try_acquire("gpt", 1) == 0
+    assert limiter.try_acquire("gpt", 1) == pytest.approx(30.0)
+    clock.advance(15)
+    assert limiter.try_acquire("gpt", 1) == pytest.approx(15.0)
+
+
+def test_refill_is_capped_at_the_limit(limiter, clock):
+    limiter.try_acquire("gpt", 600)
+    clock.advance(30)
+    assert level(limiter)["tokens_available"] == 300
+    clock.advance(3600)
+    assert level(limiter)["tokens_available"] == 600
+    assert level(limiter)["requests_available"] == 60
+
+
+def test_oversized_call_runs_once_the_bucket_is_full(limiter, clock):
+    assert limiter.try_acquire("gpt", 5000) == 0
+    assert level(limiter)["tokens_available"] == 0
+    assert limiter.try_acquire("gpt", 5000) == pytest.approx(60.0)
+
+
+def test_refund_returns_and_takes_tokens(limiter):
+    limiter.try_acquire("gpt", 400)
+    limiter.refund("gpt", 150)
+    assert level(limiter)["tokens_available"] == 350
+    limiter.refund("gpt", 1000)
+    assert level(limiter)["tokens_available"] == 600
+    limiter.refund("gpt", -700)
+    assert level(limiter)["tokens_available"] == -100
+    assert limiter.try_acquire("gpt", 50) == pytest.approx(15.0)
+
+
+def test_block_drains_and_delays_every_caller(limiter, clock):
+    limiter.try_acquire("gpt", 100)
+    limiter.block("gpt", 10)
+    levels = level(limiter)
+    assert levels["blocked_for_seconds"] == 10
+    assert levels["throttled_responses"] == 1
+    assert levels["tokens_available"] == 0
+    assert limiter.try_acquire("gpt", 1) == pytest.approx(10.0)
+
+    clock.advance(10)
+    assert limiter.try_acquire("gpt", 1) == 0
+
+
+def test_deployments_have_separate_buckets(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "time", clock)
+    limiter = RateLimiter(
+        str(tmp_path / "limits.sqlite"),
+        {"default": {"rpm": 60, "tpm": 600}, "claude": {"rpm": 6, "tpm": 60}},
+    )
+    limiter.try_acquire("claude", 60)
+    assert limiter.try_acquire("claude", 30) == pytest.approx(30.0)
+    assert limiter.try_acquire("gpt", 30) == 0
+    assert limiter.limits_for("claude") == (6.0, 60.0)
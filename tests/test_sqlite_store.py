@@ -0,0 +1,16 @@
+import threading
+
+from sqlite_store import SQLiteConnections
+
+
+def test_connection_per_thread_in_wal_mode(tmp_path):
+    connections = SQLiteConnections(str(tmp_path / "nested" / "store.sqlite"))
+    conn = connections.connect()
+    assert connections.connect() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections.connect()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
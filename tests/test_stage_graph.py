@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+
+from stage_graph import StageGraph
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def test_stages_receive_dependency_results(executor):
+    graph = (
+        StageGraph()
+        .add_stage("regions", lambda: [1, 2, 3])
+        .add_stage("title", lambda: "page")
+        .add_map_stage("double", lambda item, title: f"{title}:{item * 2}", over="regions", deps=["title"])
+        .add_stage("joined", lambda double: ",".join(double), deps=["double"])
+    )
+    items = []
+    run = graph.start(executor, on_item_complete=lambda name, index, result: items.append(index))
+    results = run.wait()
+    assert results["double"] == ["page:2", "page:4", "page:6"]
+    assert results["joined"] == "page:2,page:4,page:6"
+    assert sorted(items) == [0, 1, 2]
+    assert set(run.stage_seconds) == {"regions", "title", "double", "joined"}
+
+
+def test_empty_map_stage_completes(executor):
+    graph = StageGraph().add_stage("regions", lambda: []).add_map_stage("each", lambda item: item, over="regions")
+    assert graph.run(executor)["each"] == []
+
+
+def test_unknown_and_duplicate_stages_are_rejected():
+    graph = StageGraph().add_stage("a", lambda: 1)
+    with pytest.raises(ValueError):
+        graph.add_stage("a", lambda: 2)
+    with pytest.raises(ValueError):
+        graph.add_stage("b", lambda missing: 1, deps=["missing"])
+
+
+def test_first_failure_stops_dependents(executor):
+    ran = []
+
+    def fail():
+        raise RuntimeError("provider down")
+
+    graph = (
+        StageGraph()
+        .add_stage("fail", fail)
+        .add_stage("after", lambda fail: ran.append(fail), deps=["fail"])
+    )
+    with pytest.raises(RuntimeError, match="provider down"):
+        graph.run(executor)
+    assert ran == []
+
+
+def test_cancel_drops_queued_items():
+    release = threading.Event()
+    started = []
+
+    def work(item):
+        started.append(item)
+        release.wait(5)
+        return item
+
+    graph = StageGraph().add_stage("items", lambda: list(range(20))).add_map_stage("work", work, over="items")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        run = graph.start(pool)
+        while len(started) < 2:
+            threading.Event().wait(0.01)
+        run.cancel()
+        release.set()
+        with pytest.raises(CancelledError):
+            run.wait()
+    assert len(started) < 20
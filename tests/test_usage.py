@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+import usage
+from image_payload import ImagePayload
+from usage import RequestUsage, call_cost, model_pricing, token_counts
+
+PRICING = {
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "claude-3-sonnet": {"input": 3.00, "output": 15.00},
+}
+
+
+@pytest.fixture(autouse=True)
+def pricing(monkeypatch):
+    monkeypatch.setattr(usage, "MODEL_PRICING", PRICING)
+
+
+def test_longest_prefix_wins():
+    assert model_pricing("gpt-4o-mini-2024-07-18") == PRICING["gpt-4o-mini"]
+    assert model_pricing("gpt-4o-2024-08-06") == PRICING["gpt-4o"]
+    assert model_pricing("gpt-4o") == PRICING["gpt-4o"]
+    assert model_pricing("o1-preview") is None
+
+
+def test_call_cost_per_million_tokens():
+    assert call_cost("gpt-4o-mini", 1_000_000, 1_000_000) == pytest.approx(0.75)
+    assert call_cost("gpt-4o", 2000, 500) == pytest.approx(0.01)
+    assert call_cost("unknown-model", 2000, 500) == 0.0
+
+
+@pytest.mark.parametrize("reported", [
+    SimpleNamespace(prompt_tokens=120, completion_tokens=30, total_tokens=150),
+    {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150},
+    SimpleNamespace(input_tokens=120, output_tokens=30),
+    {"input_tokens": 120, "output_tokens": 30},
+])
+def test_token_counts_reads_openai_and_anthropic_shapes(reported):
+    assert token_counts(reported) == (120, 30)
+
+
+def test_token_counts_without_usage():
+    assert token_counts(None) == (0, 0)
+    assert token_counts({}) == (0, 0)
+    assert token_counts(SimpleNamespace()) == (0, 0)
+
+
+def test_summary_rolls_up_by_stage_and_model():
+    request = RequestUsage()
+    request.record_call("region", "openai", "gpt-4o-mini", {"prompt_tokens": 1000, "completion_tokens": 100},
+                        image_tokens=255)
+    request.record_call("region", "openai", "gpt-4o-mini", {"prompt_tokens": 1000, "completion_tokens": 100},
+                        image_tokens=255)
+    request.record_call("main_design", "openai", "gpt-4o", {"prompt_tokens": 2000, "completion_tokens": 500})
+    request.record_call("super_prompt", "anthropic", "claude-3-sonnet",
+                        SimpleNamespace(input_tokens=3000, output_tokens=1000))
+    request.record_image(ImagePayload(data_url="", detail="high", media_type="image/png", width=512, height=512,
+                                      estimated_tokens=255, baseline_tokens=765, encoded_bytes=4096))
+
+    summary = request.summary()
+    mini_cost = 2 * (1000 * 0.15 + 100 * 0.60) / 1_000_000
+    assert summary["calls"] == 4
+    assert (summary["prompt_tokens"], summary["completion_tokens"]) == (7000, 1700)
+    assert summary["cost_usd"] == pytest.approx(mini_cost + 0.01 + 0.024)
+    assert summary["by_stage"]["region"]["calls"] == 2
+    assert summary["by_stage"]["region"]["image_tokens"] == 510
+    assert summary["by_stage"]["region"]["cost_usd"] == pytest.approx(mini_cost)
+    assert summary["by_model"]["gpt-4o"]["prompt_tokens"] == 2000
+    assert summary["by_model"]["claude-3-sonnet"]["cost_usd"] == pytest.approx(0.024)
+    assert set(summary["by_model"]) == {"gpt-4o-mini", "gpt-4o", "claude-3-sonnet"}
+    assert (summary["images"], summary["estimated_image_tokens_saved"], summary["image_bytes"]) == (1, 510, 4096)
+    assert request.cost_usd == pytest.approx(summary["cost_usd"])